@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging,sys,itertools,hashlib,heapq,math
+
+
+# Hash values are the first 64 bits of the md5 digest of a gene-pair key
+HASH_MAX = 2 ** 64
+
+
+class ApproximateSummary:
+	"""
+	Estimates the number of fusion genes shared by combinations of
+	datasets, for when the exact summary is infeasible because of the
+	number of datasets. Each dataset is reduced to a bottom-k (MinHash)
+	sketch: the k smallest hash values of its gene-pair keys. The
+	intersection of a combination is estimated from the union of its
+	sketches, so the memory is O(k) per dataset and the runtime per
+	combination O(r*k) regardless of the size of the datasets.
+	
+	Fusion genes are considered identical if their gene-pair keys are
+	identical, i.e. the estimates follow exact gene matching (egm).
+	"""
+	
+	logger = logging.getLogger("FuMa::ApproximateSummary")
+	
+	def __init__(self,args):
+		self.args = args
+		
+		self.sketch_size = args.sketch_size
+		self.max_order = args.approximate_summary_max_order
+		
+		if self.sketch_size < 3:
+			raise Exception("The sketch size should be at least 3, not: "+str(self.sketch_size))
+		
+		self.dataset_names = []
+		self.sketches = []
+		
+		# Whether a sketch holds all hash values of its dataset
+		self.complete = []
+	
+	def get_gene_pair_key(self,fusion):
+		"""
+		Without acceptor-donor-order-specific-matching (A,B) and (B,A)
+		have the same key.
+		"""
+		left = ":".join(sorted(fusion.get_annotated_gene_names_left()))
+		right = ":".join(sorted(fusion.get_annotated_gene_names_right()))
+		
+		if not self.args.acceptor_donor_order_specific_matching and right < left:
+			left, right = right, left
+		
+		return left+"\t"+right
+	
+	def get_hash(self,key):
+		return int(hashlib.md5(key).hexdigest()[:16],16)
+	
+	def add_experiment(self,experiment):
+		"""
+		Keeps the k smallest distinct hash values in a max-heap, such
+		that the sketch is made in a single pass with O(k) memory.
+		"""
+		heap = []
+		sketch = set()
+		complete = True
+		
+		for fusion in experiment:
+			if fusion and fusion.has_annotated_genes():
+				value = self.get_hash(self.get_gene_pair_key(fusion))
+				
+				if value not in sketch:
+					if len(heap) < self.sketch_size:
+						heapq.heappush(heap,-value)
+						sketch.add(value)
+					else:
+						# A distinct value is left out, either this one or the largest in the sketch
+						complete = False
+						
+						if value < -heap[0]:
+							sketch.discard(-heapq.heappushpop(heap,-value))
+							sketch.add(value)
+		
+		self.dataset_names.append(experiment.name)
+		self.sketches.append(frozenset(sketch))
+		self.complete.append(complete)
+	
+	def estimate(self,indices):
+		"""
+		Returns the estimated number of gene-pair keys present in all
+		datasets with the given indices, its standard error and whether
+		it is exact.
+		
+		If all sketches are complete, the intersection is counted
+		exactly. Otherwise the estimate is never exact, even if its
+		standard error is 0 (e.g. when no shared value was sampled).
+		
+		A value in the bottom-k of the union that belongs to a dataset
+		is always in the sketch of that dataset, so the fraction of
+		these k values present in all sketches estimates the Jaccard
+		index J. The size of the union is estimated as (k-1)/u_k, with
+		u_k the k-th smallest (normalized) hash value.
+		"""
+		sketches = [self.sketches[i] for i in indices]
+		
+		if all([self.complete[i] for i in indices]):
+			return float(len(frozenset.intersection(*sketches))), 0.0, True
+		
+		union = heapq.nsmallest(self.sketch_size,frozenset().union(*sketches))
+		n_shared = len([value for value in union if all([value in sketch for sketch in sketches])])
+		
+		k = self.sketch_size
+		union_size = (k - 1) * float(HASH_MAX) / float(max(union[-1],1))
+		jaccard = float(n_shared) / k
+		
+		estimate = jaccard * union_size
+		
+		# Error of the Jaccard index (binomial) and of the union size (relative: 1/sqrt(k-2))
+		standard_error = math.sqrt((union_size * math.sqrt(jaccard * (1.0 - jaccard) / k)) ** 2 + (estimate / math.sqrt(k - 2)) ** 2)
+		
+		return estimate, standard_error, False
+	
+	def export_summary(self,filename):
+		"""
+		Writes one row per combination of up to max_order datasets:
+		
+		Datasets                     Estimated fusion genes   Standard error   Exact
+		prediction_a                 123                      0.0              TRUE
+		prediction_a & prediction_b  40                       3.1              FALSE
+		"""
+		if(filename == "-"):
+			fh = sys.stdout
+		else:
+			fh = open(filename,"w")
+		
+		fh.write("Datasets\tEstimated fusion genes\tStandard error\tExact\n")
+		
+		n = len(self.sketches)
+		for r in range(1,min(self.max_order,n)+1):
+			self.logger.info("Estimating the overlap of "+str(r)+" datasets")
+			
+			for combination in itertools.combinations(range(n),r):
+				estimate, standard_error, exact = self.estimate(combination)
+				
+				fh.write(" & ".join([self.dataset_names[i] for i in combination])+"\t")
+				fh.write(str(int(round(estimate)))+"\t")
+				fh.write(str(round(standard_error,1))+"\t")
+				fh.write(("TRUE" if exact else "FALSE")+"\n")
+		
+		if(filename != "-"):
+			fh.close()
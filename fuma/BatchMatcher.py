@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging
+
+import numpy
+import scipy.sparse
+
+
+class BatchMatcher:
+	"""
+	Matches the gene names of all fusion genes of two blocks, i.e. the
+	fusion genes of two experiments that share a chromosome pair, at
+	once instead of per pair.
+	
+	The gene names of each junction are encoded as (fusion gene x gene)
+	CSR incidence matrices. Their product contains the number of shared
+	gene names of every pair, from which the matches follow using the
+	number of gene names per fusion gene:
+	 - overlap: shared > 0
+	 - subset:  shared == min(size_1, size_2)
+	 - egm:     shared == size_1 == size_2
+	
+	Only pairs sharing at least one gene name are stored in the
+	product, so it stays sparse for large intra-chromosomal blocks.
+	"""
+	logger = logging.getLogger("FuMa::BatchMatcher")
+	
+	def __init__(self,args):
+		self.args = args
+	
+	def can_match_block(self,fusions_1,fusions_2):
+		"""
+		Small blocks are faster matched per pair. Blocks with fusion
+		genes that lack a strand or direction required by the matching
+		are also matched per pair, such that the same error is raised.
+		"""
+		if(len(fusions_1) * len(fusions_2) < self.args.batch_matching_threshold):
+			return False
+		
+		for fusion in fusions_1 + fusions_2:
+			if(self.args.strand_specific_matching and (fusion.get_left_strand() == None or fusion.get_right_strand() == None)):
+				return False
+			if(self.args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == None):
+				return False
+		
+		return True
+	
+	def get_incidence_matrices(self,gene_names_1,gene_names_2):
+		"""
+		Both matrices share the gene columns. Fusion genes without gene
+		names get an empty row.
+		"""
+		gene_ids = {}
+		matrices = []
+		
+		for gene_names in [gene_names_1,gene_names_2]:
+			indptr = [0]
+			indices = []
+			
+			for fusion_gene_names in gene_names:
+				for gene_name in fusion_gene_names:
+					if(not gene_ids.has_key(gene_name)):
+						gene_ids[gene_name] = len(gene_ids)
+					indices.append(gene_ids[gene_name])
+				indptr.append(len(indices))
+			
+			matrices.append((indptr,indices))
+		
+		n_genes = max(1,len(gene_ids))
+		
+		return [scipy.sparse.csr_matrix((numpy.ones(len(indices),dtype=numpy.int32),numpy.array(indices,dtype=numpy.int32),numpy.array(indptr,dtype=numpy.int64)),shape=(len(indptr)-1,n_genes)) for indptr,indices in matrices]
+	
+	def match_junction(self,gene_names_1,gene_names_2):
+		"""
+		Returns the matching pairs of one junction as sorted array of
+		linear indices (i * len(gene_names_2) + j).
+		"""
+		matrix_1, matrix_2 = self.get_incidence_matrices(gene_names_1,gene_names_2)
+		
+		shared = (matrix_1 * matrix_2.T).tocoo()
+		rows = shared.row.astype(numpy.int64)
+		cols = shared.col.astype(numpy.int64)
+		
+		if(self.args.matching_method == 'overlap'):
+			matched = (shared.data > 0)
+		else:
+			sizes_1 = numpy.array([len(fusion_gene_names) for fusion_gene_names in gene_names_1],dtype=numpy.int32)[rows]
+			sizes_2 = numpy.array([len(fusion_gene_names) for fusion_gene_names in gene_names_2],dtype=numpy.int32)[cols]
+			
+			if(self.args.matching_method == 'egm'):
+				matched = (shared.data == sizes_1) & (shared.data == sizes_2)
+			else:
+				matched = (shared.data == numpy.minimum(sizes_1,sizes_2))
+		
+		return numpy.unique(rows[matched] * len(gene_names_2) + cols[matched])
+	
+	def match_block(self,fusions_1,fusions_2):
+		"""
+		Returns, per index of fusions_1, the indices of fusions_2 of
+		which the gene names of both junctions match, in increasing
+		order. The strands and directions still have to be compared.
+		"""
+		gene_names = []
+		for fusions in [fusions_1,fusions_2]:
+			gene_names_left = []
+			gene_names_right = []
+			
+			for fusion in fusions:
+				if(fusion.has_annotated_genes()):
+					gene_names_left.append(fusion.get_annotated_gene_names_left())
+					gene_names_right.append(fusion.get_annotated_gene_names_right())
+				else:
+					gene_names_left.append(frozenset())
+					gene_names_right.append(frozenset())
+			
+			gene_names.append((gene_names_left,gene_names_right))
+		
+		matches_left = self.match_junction(gene_names[0][0],gene_names[1][0])
+		matches_right = self.match_junction(gene_names[0][1],gene_names[1][1])
+		matches = numpy.intersect1d(matches_left,matches_right)
+		
+		n = len(fusions_2)
+		matched_pairs = {}
+		for i, j in zip((matches // n).tolist(),(matches % n).tolist()):
+			if(not matched_pairs.has_key(i)):
+				matched_pairs[i] = []
+			matched_pairs[i].append(j)
+		
+		return matched_pairs
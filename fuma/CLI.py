@@ -95,20 +95,52 @@ def CLI(argv=None):
 	
 	parser.add_argument("-a","--add-gene-annotation",help="annotation_alias:filename  * file in BED format",nargs="*")
 	
-	parser.add_argument("-s","--add-sample",nargs="+",required=True,help="sample_alias:format:filename (available formats: %(prog)s --formats)")
+	parser.add_argument("-s","--add-sample",nargs="+",default=[],help="sample_alias:format:filename (available formats: %(prog)s --formats)")
 	parser.add_argument("-l","--link-sample-to-annotation",help="sample_alias:annotation_alias",nargs="*")
 	
 	parser.add_argument("-f","--format",default="list",choices=["summary","list","extensive"],help="Output-format")
 	
+	parser.add_argument("--summary-engine",default="pairwise",choices=["pairwise","bitmask"],help="Method used for the summary format. Pairwise compares the datasets for every combination of datasets. Bitmask matches all fusion genes once and counts the fusion genes found with the same genes in several datasets per combination of datasets; only the remaining fusion genes are compared pairwise. Gives the same tables, much faster for many datasets")
+	
+	parser.add_argument("--approximate-summary",action="store_true",help="Instead of the output format, write estimates of the number of fusion genes shared per combination of datasets, based on a MinHash sketch per dataset. Intended for large numbers of datasets; fusion genes are matched by their exact gene names (egm)")
+	parser.add_argument("--approximate-summary-max-order",default=3,type=int,help="Maximal number of datasets combined by --approximate-summary")
+	parser.add_argument("--sketch-size",default=1024,type=int,help="Number of hash values per dataset used by --approximate-summary; the relative error is about 1/sqrt(sketch-size)")
+	
+	parser.add_argument("--batch-matching-threshold",default=0,type=int,help="Match the gene names of two datasets' fusion genes sharing a chromosome pair with a sparse matrix product instead of per pair, when they form at least this many pairs (pairwise summary engine only; requires SciPy). 0 to disable")
+	
+	parser.add_argument("--max-fusions-in-memory",default=0,type=int,help="Maximal number of merged fusion genes the pairwise summary engine keeps in memory; the intermediate results exceeding it are temporarily written to disk. 0 keeps everything in memory")
+	parser.add_argument("--spill-directory",default=None,help="Directory for the intermediate results written by --max-fusions-in-memory; defaults to the system's temporary directory")
+	
+	parser.add_argument("--stream",action="store_true",help="Instead of comparing samples, write the annotated fusion genes of a single sample (-s) without duplicates to -o as Complete Genomics junctions file, while it is being read. Only the fusion genes of one chromosome pair are kept in memory; sort the input on the chromosomes to remove all duplicates")
+	
+	parser.add_argument("--cache-dir",default=None,help="Directory in which the parsed samples and their gene annotations are cached, such that runs on the same input files load them instead of parsing and annotating them again")
+	parser.add_argument("--cache-size",default=1024,type=int,help="Maximal size of --cache-dir in MB; the least recently used files are removed when it is exceeded")
+	
 	parser.add_argument("-g","--long-gene-size",default=200000,type=int,help="Gene-name based matching is more sensitive to long genes. This is the gene size used to mark fusion genes spanning a 'long gene' as reported the output. Use 0 to disable this feature.")
 	
 	parser.add_argument("-o","--output",help="output filename; '-' for stdout",default="output_fuma.txt")
 	
+	parser.add_argument("-j","--jobs",default=1,type=int,help="Number of processes used to match the fusion genes (list format and pairwise summary engine)")
+	
+	parser.add_argument("--incidence-matrix",help="Also save the rows of the list output as boolean (fusion gene x dataset) matrix, with the pairwise Jaccard indices and overlap coefficients of the datasets, to this NumPy .npz file (list format only)")
+	
+	parser.add_argument("--checkpoint",help="Save the annotated fusion genes and the state of the matching to this file after each completed level (with -j 1) or shard of components (with -j > 1), such that an interrupted run can be resumed (list format only)")
+	parser.add_argument("--resume",action="store_true",help="Resume the matching from the --checkpoint file, if it exists, without parsing and annotating the samples again. The input files and settings must be the same, except for -j")
+	
+	parser.add_argument("--cohort",help="Add the samples to this SQLite file with the matched fusion genes of a cohort, instead of comparing them only with each other. A new sample is only matched with the fusion genes of the cohort it shares genes with, and the list output of the whole cohort is written to -o. Without -s, only the output is written. The matching options must be identical for every run on the same file")
+	
+	parser.add_argument("--stats-file",help="Write the run statistics (time per phase, comparisons per second, matches per level and peak memory usage) as JSON lines to this file")
+	
 	if(argv == None):
-		return parser.parse_args()
+		args = parser.parse_args()
 	else:
 		# Argumented parameters are used in the unit tests.
-		return parser.parse_args(argv)
+		args = parser.parse_args(argv)
+	
+	if(not args.add_sample and args.cohort == None):
+		parser.error("argument -s/--add-sample is required")
+	
+	return args
 
 
 def CLI_ensmble_gtf_to_bed_converter(argv=None):
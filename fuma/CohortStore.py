@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging,sqlite3,json,itertools,hashlib
+
+import fuma
+from Gene import Gene
+from Fusion import Fusion
+from Fusion import AD_DIRECTION_REVERSE
+from MergedFusion import MergedFusion
+from FusionDetectionExperiment import FusionDetectionExperiment
+from ComparisonTriangle import ComparisonTriangle
+from ComparisonTriangle import EXPORT_CHUNK_SIZE
+
+
+class CohortStore:
+	"""
+	Persistent (SQLite) state of the list format for a growing cohort,
+	such that a new sample is matched with the existing fusion genes
+	instead of running ComparisonTriangle.overlay_fusions() over all
+	samples again.
+	
+	The store contains the (annotated and deduplicated) fusions of all
+	samples, an index of their gene names and the rows of the list
+	format: the unmatched fusions and the clusters of matched fusions
+	(MergedFusion). Each fusion belongs to a component, as found by
+	ComparisonTriangle.find_components(); rows never cross components.
+	
+	A new sample only changes the components that contain candidates
+	of its fusions, i.e. fusions sharing a left and a right gene (with
+	egm: the same canonical gene-pair key). Only those components are
+	loaded and matched again, together with the new sample, using
+	ComparisonTriangle. The rows are therefore identical to those of a
+	run over all samples at once; only their order differs.
+	"""
+	
+	logger = logging.getLogger("FuMa::CohortStore")
+	
+	def __init__(self,filename,args):
+		self.filename = filename
+		self.args = args
+		
+		if(self.args.format != "list" or self.args.approximate_summary):
+			raise Exception("A cohort can only be exported in the list format")
+		if(self.args.incidence_matrix != None):
+			raise Exception("--incidence-matrix can not be combined with --cohort")
+		
+		self.connection = sqlite3.connect(filename)
+		self.connection.text_factory = str
+		
+		self.create_tables()
+		self.check_settings()
+	
+	def create_tables(self):
+		with self.connection:
+			self.connection.executescript("""
+				CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+				CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+				
+				CREATE TABLE IF NOT EXISTS fusions (id INTEGER PRIMARY KEY, sample INTEGER, component INTEGER, left_chr TEXT, right_chr TEXT, left_pos INTEGER, right_pos INTEGER, left_strand INTEGER, right_strand INTEGER, acceptor_donor_direction INTEGER, uid TEXT, bucket TEXT, gene_key TEXT);
+				CREATE INDEX IF NOT EXISTS fusions_component ON fusions (component);
+				CREATE INDEX IF NOT EXISTS fusions_gene_key ON fusions (gene_key, bucket);
+				
+				CREATE TABLE IF NOT EXISTS fusion_genes (fusion INTEGER, side TEXT, gene TEXT, is_long_gene INTEGER);
+				CREATE INDEX IF NOT EXISTS fusion_genes_gene ON fusion_genes (gene, side);
+				CREATE INDEX IF NOT EXISTS fusion_genes_fusion ON fusion_genes (fusion);
+				
+				CREATE TABLE IF NOT EXISTS locations (fusion INTEGER, uid TEXT, left_chr TEXT, right_chr TEXT, left_pos INTEGER, right_pos INTEGER);
+				CREATE INDEX IF NOT EXISTS locations_fusion ON locations (fusion);
+				
+				CREATE TABLE IF NOT EXISTS clusters (id INTEGER PRIMARY KEY, component INTEGER, genes_left TEXT, genes_right TEXT, spans_large_gene INTEGER, reverse INTEGER);
+				CREATE INDEX IF NOT EXISTS clusters_component ON clusters (component);
+				
+				CREATE TABLE IF NOT EXISTS cluster_fusions (cluster INTEGER, fusion INTEGER);
+				CREATE INDEX IF NOT EXISTS cluster_fusions_cluster ON cluster_fusions (cluster);
+				
+				CREATE TEMP TABLE IF NOT EXISTS affected_components (component INTEGER PRIMARY KEY);
+				CREATE TEMP TABLE IF NOT EXISTS new_fusions (fusion INTEGER PRIMARY KEY, bucket TEXT, gene_key TEXT);
+				CREATE TEMP TABLE IF NOT EXISTS new_fusion_genes (fusion INTEGER, side TEXT, gene TEXT);
+			""")
+	
+	def get_settings(self):
+		"""
+		The rows in the store are only valid for the settings they were
+		matched with.
+		"""
+		return json.dumps({
+			'matching_method': self.args.matching_method,
+			'strand_specific_matching': self.args.strand_specific_matching,
+			'acceptor_donor_order_specific_matching': self.args.acceptor_donor_order_specific_matching,
+			'long_gene_size': self.args.long_gene_size},sort_keys=True)
+	
+	def check_settings(self):
+		row = self.connection.execute("SELECT value FROM settings WHERE name = 'settings'").fetchone()
+		
+		if(row == None):
+			with self.connection:
+				self.connection.execute("INSERT INTO settings (name, value) VALUES ('settings', ?)",(self.get_settings(),))
+				self.connection.execute("INSERT INTO settings (name, value) VALUES ('version', ?)",(fuma.__version__,))
+		elif(row[0] != self.get_settings()):
+			raise Exception("The cohort "+self.filename+" was created with different settings: "+row[0])
+	
+	def get_annotation_fingerprint(self,filenames):
+		"""
+		The gene annotation is identified by the MD5 hashes of the BED
+		files, such that a copied or touched file is still the same.
+		"""
+		fingerprints = []
+		for filename in filenames:
+			md5 = hashlib.md5()
+			with open(filename,"rb") as fh:
+				for block in iter(lambda: fh.read(1048576),""):
+					md5.update(block)
+			fingerprints.append(md5.hexdigest())
+		
+		return ",".join(sorted(fingerprints))
+	
+	def check_annotation(self,annotation_filenames):
+		"""
+		Fusions annotated with other gene annotations can not be
+		matched, so all samples have to be annotated with the gene
+		annotation of the first one.
+		"""
+		fingerprint = self.get_annotation_fingerprint(annotation_filenames)
+		row = self.connection.execute("SELECT value FROM settings WHERE name = 'annotation'").fetchone()
+		
+		if(row == None):
+			self.connection.execute("INSERT INTO settings (name, value) VALUES ('annotation', ?)",(fingerprint,))
+		elif(row[0] != fingerprint):
+			raise Exception("The cohort "+self.filename+" was annotated with another gene annotation than: "+", ".join(annotation_filenames))
+	
+	def get_sample_names(self):
+		return [row[0] for row in self.connection.execute("SELECT name FROM samples ORDER BY id")]
+	
+	def get_gene_pair_key(self,left_genes,right_genes):
+		return json.dumps([sorted(left_genes),sorted(right_genes)])
+	
+	def find_affected_components(self,fusions,triangle):
+		"""
+		Fills affected_components with the components containing
+		candidates of the given fusions, using the same criteria as
+		ComparisonTriangle.get_candidates(). The fusions are loaded in
+		temporary tables, such that a single query finds them all.
+		"""
+		self.connection.execute("DELETE FROM affected_components")
+		self.connection.execute("DELETE FROM new_fusions")
+		self.connection.execute("DELETE FROM new_fusion_genes")
+		
+		new_fusions = []
+		new_fusion_genes = []
+		for i, fusion in enumerate(fusions):
+			if(fusion.has_annotated_genes()):
+				left_genes, right_genes = triangle.get_gene_names(fusion)
+				
+				new_fusions.append((i, repr(triangle.get_index_key(fusion)), self.get_gene_pair_key(left_genes,right_genes)))
+				new_fusion_genes += [(i,'left',gene) for gene in left_genes] + [(i,'right',gene) for gene in right_genes]
+		
+		self.connection.executemany("INSERT INTO new_fusions (fusion, bucket, gene_key) VALUES (?, ?, ?)",new_fusions)
+		
+		if(self.args.matching_method == 'egm'):
+			self.connection.execute("INSERT INTO affected_components (component)" + \
+				" SELECT DISTINCT fusions.component FROM new_fusions" + \
+				" JOIN fusions ON fusions.gene_key = new_fusions.gene_key AND fusions.bucket = new_fusions.bucket")
+		else:
+			self.connection.executemany("INSERT INTO new_fusion_genes (fusion, side, gene) VALUES (?, ?, ?)",new_fusion_genes)
+			self.connection.execute("INSERT INTO affected_components (component)" + \
+				" SELECT DISTINCT fusions.component FROM new_fusion_genes AS new_left_genes" + \
+				" JOIN new_fusion_genes AS new_right_genes ON new_right_genes.fusion = new_left_genes.fusion AND new_right_genes.side = 'right'" + \
+				" JOIN new_fusions ON new_fusions.fusion = new_left_genes.fusion" + \
+				" JOIN fusion_genes AS left_genes ON left_genes.gene = new_left_genes.gene AND left_genes.side = 'left'" + \
+				" JOIN fusion_genes AS right_genes ON right_genes.fusion = left_genes.fusion AND right_genes.gene = new_right_genes.gene AND right_genes.side = 'right'" + \
+				" JOIN fusions ON fusions.id = left_genes.fusion AND fusions.bucket = new_fusions.bucket" + \
+				" WHERE new_left_genes.side = 'left'")
+	
+	def load_fusions(self,sample_names):
+		"""
+		Rebuilds the fusions of the components in affected_components,
+		in the order in which they were added, with their annotated
+		genes and the locations of their duplicates.
+		"""
+		fusions = []
+		fusion_ids = []
+		index = {}
+		
+		for row in self.connection.execute("SELECT id, sample, left_chr, right_chr, left_pos, right_pos, left_strand, right_strand, acceptor_donor_direction, uid FROM fusions WHERE component IN (SELECT component FROM affected_components) ORDER BY id"):
+			fusion = Fusion(row[2],row[3],row[4],row[5],None,None,sample_names[row[1]],row[9],False)
+			fusion.left_strand = (None if row[6] == None else bool(row[6]))
+			fusion.right_strand = (None if row[7] == None else bool(row[7]))
+			fusion.acceptor_donor_direction = (None if row[8] == None else bool(row[8]))
+			fusion.matches = set()
+			
+			index[row[0]] = fusion
+			fusion_ids.append(row[0])
+			fusions.append(fusion)
+		
+		genes = {}
+		annotated_genes = dict([(fusion_id,{'left':[], 'right':[]}) for fusion_id in fusion_ids])
+		for fusion_id, side, name, is_long_gene in self.connection.execute("SELECT fusion, side, gene, is_long_gene FROM fusion_genes WHERE fusion IN (SELECT id FROM fusions WHERE component IN (SELECT component FROM affected_components)) ORDER BY rowid"):
+			key = (name, bool(is_long_gene))
+			if(not genes.has_key(key)):
+				genes[key] = Gene(name,bool(is_long_gene))
+			annotated_genes[fusion_id][side].append(genes[key])
+		
+		for fusion_id in fusion_ids:
+			index[fusion_id].annotate_genes_left(annotated_genes[fusion_id]['left'])
+			index[fusion_id].annotate_genes_right(annotated_genes[fusion_id]['right'])
+		
+		for fusion_id, uid, left_chr, right_chr, left_pos, right_pos in self.connection.execute("SELECT fusion, uid, left_chr, right_chr, left_pos, right_pos FROM locations WHERE fusion IN (SELECT id FROM fusions WHERE component IN (SELECT component FROM affected_components))"):
+			fusion = index[fusion_id]
+			fusion.matches.add(Fusion(left_chr,right_chr,left_pos,right_pos,None,None,fusion.dataset_name,uid,False))
+		
+		return fusions, fusion_ids
+	
+	def add_experiment(self,experiment,annotation_filenames):
+		"""
+		Adds an annotated and deduplicated sample to the cohort and
+		updates the rows of the components its fusions touch. The BED
+		files it was annotated with are checked against those of the
+		cohort.
+		"""
+		sample_names = self.get_sample_names()
+		if(experiment.name in sample_names):
+			raise Exception("The cohort "+self.filename+" already contains a sample named: "+experiment.name)
+		
+		triangle = ComparisonTriangle(self.args)
+		new_fusions = [fusion for fusion in experiment]
+		
+		with self.connection:
+			self.check_annotation(annotation_filenames)
+			self.find_affected_components(new_fusions,triangle)
+			
+			old_fusions, old_fusion_ids = self.load_fusions(sample_names)
+			
+			# The experiments are only used for the dataset masks and the number of fusions
+			experiments = dict([(sample_name,FusionDetectionExperiment(sample_name)) for sample_name in sample_names])
+			for fusion in old_fusions:
+				experiments[fusion.dataset_name].add_fusion(fusion)
+			for sample_name in sample_names:
+				triangle.add_experiment(experiments[sample_name])
+			triangle.add_experiment(experiment)
+			
+			rows = triangle.get_rows(old_fusions + new_fusions)
+			
+			self.logger.info("Matched "+str(len(new_fusions))+" fusions of "+experiment.name+" with "+str(len(old_fusions))+" fusions of the cohort")
+			
+			sample_id = len(sample_names)
+			first_id = self.connection.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM fusions").fetchone()[0]
+			fusion_ids = old_fusion_ids + range(first_id,first_id + len(new_fusions))
+			
+			self.connection.execute("INSERT INTO samples (id, name) VALUES (?, ?)",(sample_id,experiment.name))
+			self.save_fusions(sample_id,new_fusions,fusion_ids[len(old_fusions):],triangle)
+			
+			# A component is identified by its first fusion
+			components = {}
+			for component in triangle.find_components():
+				for i in component:
+					components[fusion_ids[i]] = fusion_ids[component[0]]
+			self.connection.executemany("UPDATE fusions SET component = ? WHERE id = ?",[(component,fusion_id) for fusion_id,component in components.items()])
+			
+			self.connection.execute("DELETE FROM cluster_fusions WHERE cluster IN (SELECT id FROM clusters WHERE component IN (SELECT component FROM affected_components))")
+			self.connection.execute("DELETE FROM clusters WHERE component IN (SELECT component FROM affected_components)")
+			self.save_rows(rows,dict([(fusion,fusion_ids[i]) for i,fusion in enumerate(triangle.fusions)]),components,triangle)
+	
+	def save_fusions(self,sample_id,fusions,fusion_ids,triangle):
+		for fusion_id, fusion in zip(fusion_ids,fusions):
+			if(fusion.has_annotated_genes()):
+				bucket = repr(triangle.get_index_key(fusion))
+				gene_key = self.get_gene_pair_key(*triangle.get_gene_names(fusion))
+			else:
+				bucket = None
+				gene_key = None
+			
+			self.connection.execute("INSERT INTO fusions (id, sample, component, left_chr, right_chr, left_pos, right_pos, left_strand, right_strand, acceptor_donor_direction, uid, bucket, gene_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", \
+				(fusion_id, sample_id, fusion_id, fusion.get_left_chromosome(), fusion.get_right_chromosome(), fusion.get_left_break_position(), fusion.get_right_break_position(), fusion.left_strand, fusion.right_strand, fusion.acceptor_donor_direction, str(fusion.uid), bucket, gene_key))
+			
+			genes = [(fusion_id,'left',str(gene),gene.is_long_gene) for gene in fusion.get_annotated_genes_left(False)]
+			genes += [(fusion_id,'right',str(gene),gene.is_long_gene) for gene in fusion.get_annotated_genes_right(False)]
+			self.connection.executemany("INSERT INTO fusion_genes (fusion, side, gene, is_long_gene) VALUES (?, ?, ?, ?)",genes)
+			
+			self.connection.executemany("INSERT INTO locations (fusion, uid, left_chr, right_chr, left_pos, right_pos) VALUES (?, ?, ?, ?, ?, ?)", \
+				[(fusion_id, str(location['id']), location['left'][0], location['right'][0], location['left'][1], location['right'][1]) for location in fusion.locations()])
+	
+	def save_rows(self,rows,fusion_ids,components,triangle):
+		"""
+		The gene columns of a row are stored as they are exported, the
+		location columns are formatted during the export because they
+		depend on the samples in the cohort at that time.
+		"""
+		for row in rows:
+			if(isinstance(row,MergedFusion)):
+				fusions = row.fusions
+			else:
+				fusions = [row]
+			
+			ids = sorted([fusion_ids[fusion] for fusion in fusions])
+			reverse = (self.args.acceptor_donor_order_specific_matching and row.acceptor_donor_direction == AD_DIRECTION_REVERSE)
+			genes_left, genes_right = triangle.format_list_genes(row,reverse)
+			
+			cursor = self.connection.execute("INSERT INTO clusters (component, genes_left, genes_right, spans_large_gene, reverse) VALUES (?, ?, ?, ?, ?)",(components[ids[0]],genes_left,genes_right,row.spans_a_large_gene(),reverse))
+			self.connection.executemany("INSERT INTO cluster_fusions (cluster, fusion) VALUES (?, ?)",[(cursor.lastrowid,fusion_id) for fusion_id in ids])
+	
+	def export_list(self):
+		"""
+		Writes the list format of the whole cohort to args.output, one
+		component after the other.
+		"""
+		triangle = ComparisonTriangle(self.args)
+		for sample_name in self.get_sample_names():
+			triangle.add_experiment(FusionDetectionExperiment(sample_name))
+		
+		fh = triangle.export_list_header()
+		
+		query = "SELECT clusters.id, clusters.genes_left, clusters.genes_right, clusters.spans_large_gene, clusters.reverse, samples.name, locations.uid, locations.left_chr, locations.left_pos, locations.right_chr, locations.right_pos" + \
+			" FROM clusters" + \
+			" JOIN cluster_fusions ON cluster_fusions.cluster = clusters.id" + \
+			" JOIN fusions ON fusions.id = cluster_fusions.fusion" + \
+			" JOIN samples ON samples.id = fusions.sample" + \
+			" JOIN locations ON locations.fusion = fusions.id" + \
+			" ORDER BY clusters.component, clusters.id"
+		
+		rows = []
+		for cluster_id, cluster_locations in itertools.groupby(self.connection.execute(query),lambda row: row[0]):
+			cluster_locations = list(cluster_locations)
+			locations = [{'left':[row[7],row[8]], 'right':[row[9],row[10]], 'id':row[6], 'dataset':row[5]} for row in cluster_locations]
+			
+			genes_left, genes_right, spans_large_gene, reverse = cluster_locations[0][1:5]
+			rows.append(triangle.format_list_row(genes_left,genes_right,spans_large_gene,locations,reverse))
+			
+			if(len(rows) >= EXPORT_CHUNK_SIZE):
+				fh.write("".join(rows))
+				rows = []
+		
+		fh.write("".join(rows))
+		
+		if(self.args.output != "-"):
+			fh.close()
+	
+	def close(self):
+		self.connection.close()
@@ -23,7 +23,8 @@
 
 import logging
 
-from Fusion import Fusion
+from FusionMatch import FusionMatch
+from FusionMatcher import FusionMatcher
 from FusionDetectionExperiment import FusionDetectionExperiment
 
 
@@ -35,6 +36,13 @@ class CompareFusionsBySpanningGenes:
 		self.experiment_2 = experiment_2
 		
 		self.args = args
+		self.matcher = FusionMatcher(args)
+		
+		if(args.batch_matching_threshold > 0):
+			from BatchMatcher import BatchMatcher
+			self.batch_matcher = BatchMatcher(args)
+		else:
+			self.batch_matcher = None
 	
 	def find_overlap(self):
 		self.logger.debug("Comparing: '"+self.experiment_1.name+"' with '"+self.experiment_2.name + "'" + " - using '"+self.args.matching_method+"'-based matching")
@@ -49,10 +57,22 @@ class CompareFusionsBySpanningGenes:
 			
 			for chromosome_left in self.experiment_1.index.items():
 				for chromosome_right in chromosome_left[1].items():
-					for fusion_1 in chromosome_right[1]:
+					# Gene names of large blocks are matched at once; the candidates of fusion i are then fusions_2[j] for j in batch_matches[i]
+					batch_matches = None
+					if(self.batch_matcher != None and self.experiment_2.index.has_key(chromosome_left[0]) and self.experiment_2.index[chromosome_left[0]].has_key(chromosome_right[0])):
+						fusions_2 = self.experiment_2.index[chromosome_left[0]][chromosome_right[0]]
+						if(self.batch_matcher.can_match_block(chromosome_right[1],fusions_2)):
+							batch_matches = self.batch_matcher.match_block(chromosome_right[1],fusions_2)
+					
+					for i, fusion_1 in enumerate(chromosome_right[1]):
 						
 						if(self.experiment_2.index.has_key(chromosome_left[0]) and self.experiment_2.index[chromosome_left[0]].has_key(chromosome_right[0])):
-							for fusion_2 in self.experiment_2.index[chromosome_left[0]][chromosome_right[0]]:
+							if(batch_matches != None):
+								candidates = [fusions_2[j] for j in batch_matches.get(i,[])]
+							else:
+								candidates = self.experiment_2.index[chromosome_left[0]][chromosome_right[0]]
+							
+							for fusion_2 in candidates:
 								
 								## Do the gene-name comparison
 								#if(self.args.matching_method == 'egm'):
@@ -78,24 +98,6 @@ class CompareFusionsBySpanningGenes:
 			self.logger.warning("No gene annotation reference found")
 	
 	
-	def match_fusion_gene_strands(self,fusion_1,fusion_2):
-		if not self.args.strand_specific_matching:
-			return True
-		else:
-			if fusion_1.left_strand == None or fusion_1.right_strand == None or fusion_2.left_strand == None or fusion_2.right_strand == None:
-				raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
-			else:
-				return fusion_1.left_strand == fusion_2.left_strand and fusion_1.right_strand == fusion_2.right_strand
-	
-	def match_acceptor_donor_direction(self,fusion_1,fusion_2):
-		if(not self.args.acceptor_donor_order_specific_matching):
-			return True
-		elif(fusion_1.acceptor_donor_direction == None or fusion_2.acceptor_donor_direction == None):
-			raise Exception("A fusion gene without an annotated acceptor-donor direction was used for acceptor-donor-order-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
-		else:
-			return (fusion_1.acceptor_donor_direction == fusion_2.acceptor_donor_direction)
-	
-	
 	def match_fusions(self,fusion_1,fusion_2,allow_empty = True):
 		"""Matches whether two fusion objects are the same prediction
 				# fusion_1 <=> fusion_2; for both left and right position:
@@ -107,113 +109,18 @@ class CompareFusionsBySpanningGenes:
 				#	BECAUSE: [a,b] can not be located in C, never
 				#
 				# (not is_empty(a)) and subset(a,b) or subset(b,a)
+		
+		Fusion genes without annotated genes on both junctions never
+		match, so allow_empty does not change the result.
 		"""
 		
-		# First check whether the strands match, if strand-specific-matching is enabled:
-		if(self.match_fusion_gene_strands(fusion_1,fusion_2) and self.match_acceptor_donor_direction(fusion_1,fusion_2)):
-			
-			if((fusion_1.annotated_genes_left and fusion_1.annotated_genes_right and fusion_2.annotated_genes_left and fusion_2.annotated_genes_right)):
-				# Check if all of the smallest are in the largest;
-				# if you do it otherwise you don't know if all from the smallest are also in the largest
-				
-				fusion_1_annotated_genes_left =  fusion_1.get_annotated_genes_left(True)
-				fusion_1_annotated_genes_right = fusion_1.get_annotated_genes_right(True)
-				
-				fusion_2_annotated_genes_left =  fusion_2.get_annotated_genes_left(True)
-				fusion_2_annotated_genes_right = fusion_2.get_annotated_genes_right(True)
-				
-				if(self.args.matching_method == 'overlap'):
-					matches_left  = self.match_overlap( set(fusion_1_annotated_genes_left.keys()), set(fusion_2_annotated_genes_left.keys()) )
-					matches_right = self.match_overlap( set(fusion_1_annotated_genes_right.keys()), set(fusion_2_annotated_genes_right.keys()) )
-				elif(self.args.matching_method == 'egm'):
-					matches_left  = self.match_egm( set(fusion_1_annotated_genes_left.keys()), set(fusion_2_annotated_genes_left.keys()) )
-					matches_right = self.match_egm( set(fusion_1_annotated_genes_right.keys()), set(fusion_2_annotated_genes_right.keys()) )
-				else:
-					matches_left  = self.match_sets( set(fusion_1_annotated_genes_left.keys()), set(fusion_2_annotated_genes_left.keys()) )
-					matches_right = self.match_sets( set(fusion_1_annotated_genes_right.keys()), set(fusion_2_annotated_genes_right.keys()) )
-				
-				# Do we allow empty matches as empty results or 2x empty input? >> if the latter, the if should be in the beginning of the function
-				if(matches_left and matches_right and \
-						(allow_empty or \
-						(len(fusion_1.annotated_genes_left) > 0 and \
-						len(fusion_1.annotated_genes_right) > 0 and \
-						len(fusion_2.annotated_genes_left) > 0 and \
-						len(fusion_2.annotated_genes_right) > 0)) \
-					):
-					
-					fusion_merged = Fusion( \
-						fusion_1.get_left_chromosome(), \
-						fusion_1.get_right_chromosome(), \
-						fusion_1.get_left_break_position(), \
-						fusion_1.get_right_break_position(), \
-						fusion_1.left_strand, \
-						fusion_1.right_strand, \
-						fusion_1.dataset_name+"_vs._"+fusion_2.dataset_name, \
-						"", \
-						(fusion_1.acceptor_donor_direction != None and fusion_2.acceptor_donor_direction != None)
-					)
-					
-					# Fancy oneliners: create a list of all Gene objects based on the gene names in matches_left
-					#print [item for sublist in matches_left for item in fusion_1_annotated_genes_left[sublist]+fusion_2_annotated_genes_left[sublist]]
-					
-					fusion_merged.annotate_genes_left(list(set([item for sublist in matches_left for item in ((fusion_1_annotated_genes_left[sublist]) if fusion_1_annotated_genes_left.has_key(sublist) else [])+((fusion_2_annotated_genes_left[sublist]) if fusion_2_annotated_genes_left.has_key(sublist) else [])])))
-					fusion_merged.annotate_genes_right(list(set([item for sublist in matches_right for item in ((fusion_1_annotated_genes_right[sublist]) if fusion_1_annotated_genes_right.has_key(sublist) else [])+((fusion_2_annotated_genes_right[sublist]) if fusion_2_annotated_genes_right.has_key(sublist) else [])])))
-					
-					#@todo Check whether keeping the references to the original fusion objects is much more intensive or not - if not, use it instead
-					#   otherwise, make a Location() object and use it and save the reference in the fusion class
-					#for location in fusion_1.locations()+fusion_2.locations():
-					#	fusion_merged.add_location(location)
-					
-					# If one fusion is (A,B) and the other (B,A), the directions are opposite
-					# Therefore not the direction of fusion_1 should be chosen, but it should be set to "None" / unknown
-					acceptor_donor_directions = set([fusion_1.acceptor_donor_direction,fusion_2.acceptor_donor_direction])
-					if(len(acceptor_donor_directions) != 1):
-						fusion_merged.acceptor_donor_direction = None
-					else:
-						fusion_merged.acceptor_donor_direction = list(acceptor_donor_directions)[0]
-					
-					# If one fusion's left strand is (+) and the other is (-) the strand should be unknown, similarly for the right
-					left_strands = set([fusion_1.left_strand,fusion_2.left_strand])
-					if(len(left_strands) != 1):
-						fusion_merged.left_strand = None
-					else:
-						fusion_merged.left_strand = list(left_strands)[0]
-						
-					right_strands = set([fusion_1.right_strand,fusion_2.right_strand])
-					if(len(right_strands) != 1):
-						fusion_merged.right_strand = None
-					else:
-						fusion_merged.right_strand = list(right_strands)[0]
-					
-					return fusion_merged
-				else:
-					return False
-			else:
-				return False
+		matches = self.matcher.match(fusion_1,fusion_2)
+		
+		if(matches):
+			return FusionMatch(fusion_1,fusion_2,matches[0],matches[1])
 		else:
 			return False
 	
-	def match_sets(self,superset,subset):								#https://docs.python.org/2/library/sets.html
-		if(len(subset) > len(superset)):
-			return self.match_sets(subset,superset)						# Gene names have to be provided as sets
-		elif(subset.issubset(superset)):
-			return subset
-		else:
-			return None
-	
-	def match_egm(self,set1,set2):
-		if set1 == set2:
-			return set1
-		else:
-			return None
-	
-	def match_overlap(self,set1,set2):									#https://docs.python.org/2/library/sets.html
-		overlap = set1.intersection(set2)
-		if(not overlap):
-			return None
-		else:
-			return overlap
-	
 	""" 
 	#This type of matching increases the sets after multiple iterations
 	def match_sets_return_superset(self,superset,subset):
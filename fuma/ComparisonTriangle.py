@@ -21,11 +21,17 @@
  <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
 """
 
+import fuma
+
 from Readers import *
 
 from ParseBED import ParseBED
 from FusionDetectionExperiment import FusionDetectionExperiment
 from MergedFusion import MergedFusion
+from Gene import Gene
+from FusionMatcher import FusionMatcher
+from RunStatistics import RunStatistics
+from IncidenceMatrix import IncidenceMatrix
 
 from Fusion import AD_DIRECTION_REVERSE
 from Fusion import AD_DIRECTION_FORWARD
@@ -34,15 +40,75 @@ from Fusion import STRAND_FORWARD
 from Fusion import STRAND_REVERSE
 
 
-import os.path,sys,itertools
+import os,os.path,sys,itertools,multiprocessing,cStringIO,gzip,time,json
+
+
+# Number of rows that are formatted before they are written in one go
+EXPORT_CHUNK_SIZE = 10000
+
+# Buffer size of the (uncompressed) output file
+EXPORT_BUFFER_SIZE = 1024 * 1024
+
+
+parallel_comparison_triangle = None
+
+def from_json(value):
+	"""
+	The json module returns all strings as unicode
+	"""
+	if isinstance(value, unicode):
+		return value.encode("utf-8")
+	else:
+		return value
+
+def overlay_fusions_shard(ids):
+	"""
+	Worker function for ComparisonTriangle.overlay_fusions_parallel()
+	"""
+	fh = cStringIO.StringIO()
+	
+	# The statistics of the parent are only reported by the parent
+	parallel_comparison_triangle.stats = RunStatistics()
+	if parallel_comparison_triangle.incidence_matrix != None:
+		parallel_comparison_triangle.incidence_matrix = IncidenceMatrix()
+	
+	# Only the parent saves checkpoints, after each completed shard
+	parallel_comparison_triangle.args.checkpoint = None
+	
+	parallel_comparison_triangle.overlay_fusions_subset(fh,ids)
+	
+	return fh.getvalue(), parallel_comparison_triangle.stats.levels, parallel_comparison_triangle.stats.phases.get('export',0.0), parallel_comparison_triangle.incidence_matrix
 
 
 class ComparisonTriangle:
 	logger = logging.getLogger("FuMa::ComparisonTriangle")
 	
-	def __init__(self,args):
+	def __init__(self,args,stats=None):
 		self.experiments = []
 		self.args = args
+		self.matcher = FusionMatcher(args)
+		
+		# Only used by count_dataset_masks()
+		self.dataset_mask_counts = None
+		
+		# Only used by get_rows()
+		self.rows = None
+		
+		# Shards that still have to run after the current one, saved in the checkpoints
+		self.pending_shards = []
+		
+		# The fusions in a checkpoint, only serialized once per run
+		self.checkpoint_fusions = None
+		
+		if args.incidence_matrix != None:
+			self.incidence_matrix = IncidenceMatrix()
+		else:
+			self.incidence_matrix = None
+		
+		if stats == None:
+			self.stats = RunStatistics()
+		else:
+			self.stats = stats
 	
 	def add_experiment(self,arg_experiment):
 		if not isinstance(arg_experiment, FusionDetectionExperiment):
@@ -51,83 +117,507 @@ class ComparisonTriangle:
 			if arg_experiment in self.experiments:
 				raise Exception("MergedFusion is updated with one that it already contains")
 			else:
+				# Each experiment gets a small integer id; its fusions carry the corresponding bit
+				dataset_mask = 1 << len(self.experiments)
+				for fusion in arg_experiment:
+					fusion.dataset_mask = dataset_mask
+				
 				self.experiments.append(arg_experiment)
 	
 	def overlay_fusions(self):
-		fh = self.export_list_header()
+		"""
+		The export is interleaved with the overlay, so its time is
+		accumulated separately and subtracted from the overlay phase.
 		
-		export_fusions = []# Fusions to be exported after current iteration
-		merged_fusions = []# MergedFusions to be used for next iteration
+		When resuming from a checkpoint, the experiments are replaced
+		by those stored in the checkpoint.
+		"""
+		started = time.time()
+		export_before = self.stats.phases.get('export',0.0)
+		
+		if self.args.resume and self.incidence_matrix != None:
+			raise Exception("--incidence-matrix can not be combined with --resume; the rows of the completed levels are not in the checkpoint")
+		
+		if self.has_checkpoint():
+			# The experiments and their fusions are restored from the checkpoint
+			fh, merged_fusions, shards = self.read_checkpoint()
+			
+			# The state before the first level is the checkpoint itself
+			if len(merged_fusions) > 0:
+				merged_fusions = self.overlay_fusions_recursive(fh,merged_fusions)
+			
+			self.pending_shards = shards
+			self.overlay_fusions_levels(fh,merged_fusions)
+			self.overlay_fusions_shards(fh,shards)
+		else:
+			if self.args.resume:
+				self.logger.info("No checkpoint found at "+self.args.checkpoint+", starting from k=1")
+			
+			self.index_fusions()
+			
+			fh = self.export_list_header()
+			
+			if self.args.jobs > 1:
+				self.overlay_fusions_parallel(fh,self.find_shards(self.args.jobs * 4))
+			else:
+				self.overlay_fusions_subset(fh,range(len(self.fusions)))
+		
+		if self.args.output != "-":
+			fh.close()
+		
+		if self.incidence_matrix != None:
+			self.incidence_matrix.export(self.args.incidence_matrix,[experiment.name for experiment in self.experiments])
 		
-		for tmp,fusion in self:
-			export_fusions.append(fusion)
+		# The run has completed, so there is nothing left to resume
+		if self.args.checkpoint != None and os.path.isfile(self.args.checkpoint):
+			os.remove(self.args.checkpoint)
+		
+		export = self.stats.phases.get('export',0.0) - export_before
+		self.stats.add('overlay',time.time() - started - export)
+	
+	def overlay_fusions_subset(self,fh,ids):
+		"""
+		Runs the k=1 comparison and all recursive levels for the fusions
+		with the given (sorted) ids. The ids must be closed under
+		get_candidates(), which is true for all fusions and for any
+		combination of the components from find_components().
+		"""
+		matched = set()# Fusions that are exported as part of a MergedFusion
+		merged_fusions = []# MergedFusions to be used for next iteration
 		
-		n_total = int(round(0.5 * (len(export_fusions) * (len(export_fusions) + 1)) ))
+		n_total = len(ids)
 		passed = 0
-		previous_percentage = -100.0
+		comparisons = 0
 		
-		self.logger.info("Starting "+str(n_total)+" comparisons for k=1")
+		self.logger.info("Starting comparisons of "+str(n_total)+" fusions for k=1")
+		self.stats.start_level(1,n_total)
 		
-		for y,fusion_y in self:
-			for x,fusion_x in self:
+		for y in ids:
+			fusion_y = self.fusions[y]
+			
+			for x,fusion_x in self.get_candidates(fusion_y):
 				if y >= x:
-					n_total, passed, previous_percentage = self.log_progress(n_total, passed, previous_percentage)
-					
 					# If they do not belong to the same dataset - i.e. no duplication removal - and if they are the same MergedFusion gene
-					if fusion_y and fusion_y.dataset_name not in [tmp['dataset'] for tmp in fusion_x.locations()]:# and fusion_y != fusion_x
+					if fusion_y and not (fusion_y.dataset_mask & fusion_x.dataset_mask):# and fusion_y != fusion_x
 						comparison = self.match_fusions(fusion_y, fusion_x)
+						comparisons += 1
 						
 						if comparison != False:
 							# Keep is not important - hiding is only useful for for exporting..
-							export_fusions[x] = None
-							export_fusions[y] = None
+							matched.add(x)
+							matched.add(y)
 							
 							merged_fusions.append(comparison)
-					passed += 1
+				else:
+					break# candidates are sorted on x
+			
+			passed += 1
+			self.stats.progress(passed,comparisons,len(merged_fusions))
 		
-		n_total, passed, previous_percentage = self.log_progress(n_total, passed, previous_percentage)
+		self.stats.finish_level(len(merged_fusions))
 		
-		self.export_list_chunked(fh,export_fusions)
+		self.export_list_chunked(fh,[self.fusions[i] for i in ids if i not in matched])
 		
-		#@todo put this in some kind of while loop - and add recursion limit to be better safe than sorry..
+		self.overlay_fusions_levels(fh,merged_fusions)
+	
+	def overlay_fusions_levels(self,fh,merged_fusions):
+		"""
+		Runs the recursive levels k=2,3,.. and, with --checkpoint, saves
+		the state before each of them.
+		"""
 		while len(merged_fusions) > 0:
+			if self.args.checkpoint != None and self.dataset_mask_counts == None and self.rows == None:
+				self.write_checkpoint(fh,merged_fusions)
+			
 			merged_fusions = self.overlay_fusions_recursive(fh,merged_fusions)
+	
+	def overlay_fusions_shards(self,fh,shards):
+		"""
+		Runs the shards that were pending in a checkpoint, in parallel
+		or, with --jobs 1, one after the other.
+		"""
+		if self.args.jobs > 1:
+			self.overlay_fusions_parallel(fh,shards)
+		else:
+			for i in range(len(shards)):
+				self.pending_shards = shards[i + 1:]
+				self.overlay_fusions_subset(fh,shards[i])
+				
+				if self.args.checkpoint != None:
+					self.write_checkpoint(fh,[])
+	
+	def overlay_fusions_parallel(self,fh,shards):
+		"""
+		Distributes the shards, independent components of fusions from
+		find_shards(), over a pool of --jobs processes. Each process runs
+		all levels for its shard and returns the exported rows, which are
+		written in the order of the shards. The rows are identical to
+		those of the single process run, only their order differs. With
+		--checkpoint, the state is saved after each written shard.
+		"""
+		global parallel_comparison_triangle
 		
-		if self.args.output != "-":
-			fh.close()
+		levels = []
+		n_fusions = sum([len(shard) for shard in shards])
+		self.logger.info("Distributing "+str(n_fusions)+" fusions in "+str(len(shards))+" shards over "+str(self.args.jobs)+" processes")
+		
+		# Forked worker processes inherit this object instead of unpickling it
+		parallel_comparison_triangle = self
+		pool = multiprocessing.Pool(self.args.jobs)
+		
+		try:
+			for i, (rows, shard_levels, export, incidence_matrix) in enumerate(pool.imap(overlay_fusions_shard, shards)):
+				fh.write(rows)
+				
+				levels += shard_levels
+				self.stats.add('export',export)
+				
+				if incidence_matrix != None:
+					self.incidence_matrix.extend(incidence_matrix)
+				
+				if self.args.checkpoint != None:
+					self.pending_shards = shards[i + 1:]
+					self.write_checkpoint(fh,[])
+		finally:
+			pool.close()
+			pool.join()
+			parallel_comparison_triangle = None
+		
+		self.stats.merge_levels(levels)
+	
+	def count_dataset_masks(self,ids):
+		"""
+		Runs the same matching as overlay_fusions() for the fusions with
+		the given (sorted) ids, but instead of exporting the rows it
+		counts them per dataset_mask, i.e. per combination of datasets
+		in which the fusion gene was found. The fusions must have been
+		indexed and the ids must be closed under get_candidates(). Used
+		by OverlapComplex.overlay_fusions_bitmask().
+		"""
+		self.dataset_mask_counts = {}
+		self.overlay_fusions_subset(None,ids)
+		
+		dataset_mask_counts = self.dataset_mask_counts
+		self.dataset_mask_counts = None
+		
+		return dataset_mask_counts
+	
+	def get_rows(self,fusions):
+		"""
+		Runs the same matching as overlay_fusions() for the given
+		fusions, in the given order, but instead of exporting the rows
+		it returns them as the unmatched Fusion and the MergedFusion
+		objects. The fusions must be closed under get_candidates(). Used
+		by CohortStore to match a new sample to the components of the
+		cohort it touches.
+		"""
+		self.index_fusions(fusions)
+		
+		self.rows = []
+		self.overlay_fusions_subset(None,range(len(self.fusions)))
+		
+		rows = self.rows
+		self.rows = None
+		
+		return rows
+	
+	def check_checkpoint_args(self):
+		"""
+		Resuming truncates the output file to the offset stored in the
+		checkpoint, which requires an uncompressed file.
+		"""
+		if self.args.output == "-" or self.args.output.endswith(".gz"):
+			raise Exception("--checkpoint requires an uncompressed output file, not: "+self.args.output)
+	
+	def has_checkpoint(self):
+		"""
+		Whether the run resumes from a checkpoint, in which case the
+		samples do not have to be parsed and annotated.
+		"""
+		if self.args.checkpoint != None:
+			self.check_checkpoint_args()
+		elif self.args.resume:
+			raise Exception("--resume requires a --checkpoint file")
+		
+		return self.args.resume and os.path.isfile(self.args.checkpoint)
+	
+	def get_file_fingerprints(self,arguments,n_fields):
+		"""
+		The size and modification time of the files in the arguments of
+		the samples ('alias:format:file') or annotations ('alias:file').
+		"""
+		fingerprints = []
+		for argument in (arguments or []):
+			filename = argument.split(":",n_fields - 1)[-1]
+			if os.path.isfile(filename):
+				stat = os.stat(filename)
+				fingerprints.append([argument, stat.st_size, int(stat.st_mtime)])
+			else:
+				fingerprints.append([argument, None, None])
+		return fingerprints
+	
+	def get_checkpoint_settings(self):
+		"""
+		The fusions in a checkpoint replace the parsed and annotated
+		samples, so they are only valid for the same input files and
+		the same settings.
+		"""
+		return {
+			'samples': self.get_file_fingerprints(self.args.add_sample,3),
+			'gene_annotations': self.get_file_fingerprints(self.args.add_gene_annotation,2),
+			'links': self.args.link_sample_to_annotation,
+			'matching_method': self.args.matching_method,
+			'strand_specific_matching': self.args.strand_specific_matching,
+			'acceptor_donor_order_specific_matching': self.args.acceptor_donor_order_specific_matching,
+			'long_gene_size': self.args.long_gene_size,
+			'output': self.args.output}
+	
+	def write_checkpoint(self,fh,merged_fusions):
+		"""
+		Saves the pending merged fusions of the next level, the pending
+		shards and the size of the output written so far. A merged
+		fusion is stored as the ids of its fusions and its matched genes
+		as (fusion id, index) references into the annotated genes of
+		those fusions, so the checkpoint stays small and no objects are
+		pickled. The annotated fusions themselves are stored as well
+		(see get_checkpoint_fusions()), such that a resumed run does
+		not have to parse and annotate the samples again.
+		
+		The file is replaced atomically, so a job that gets killed
+		while writing it can still resume from the previous level.
+		"""
+		fh.flush()
+		
+		fusion_ids = dict([(fusion,i) for i,fusion in enumerate(self.fusions)])
+		
+		if self.checkpoint_fusions == None:
+			self.checkpoint_fusions = self.get_checkpoint_fusions()
+		
+		checkpoint = {
+			'version': fuma.__version__,
+			'settings': self.get_checkpoint_settings(),
+			'k': (len(merged_fusions[0].fusions) if len(merged_fusions) > 0 else 1),
+			'offset': fh.tell(),
+			'fusions': self.checkpoint_fusions,
+			'merged_fusions': [self.merged_fusion_to_ids(merged_fusion,fusion_ids) for merged_fusion in merged_fusions],
+			'shards': self.pending_shards}
+		
+		tmp_file = self.args.checkpoint+".tmp"
+		with open(tmp_file,"w") as fh_checkpoint:
+			json.dump(checkpoint,fh_checkpoint)
+		os.rename(tmp_file,self.args.checkpoint)
+		
+		self.logger.info("Saved checkpoint for k="+str(checkpoint['k'])+" with "+str(len(merged_fusions))+" merged fusions and "+str(len(self.pending_shards))+" pending shards")
+	
+	def read_checkpoint(self):
+		"""
+		Restores the experiments with their annotated fusions, the merged
+		fusions of the level that was about to run and the shards that
+		did not run yet, and reopens the output file at the stored
+		offset, discarding the rows of the level that was interrupted.
+		"""
+		with open(self.args.checkpoint,"r") as fh_checkpoint:
+			checkpoint = json.load(fh_checkpoint)
+		
+		if checkpoint['version'] != fuma.__version__ or checkpoint['settings'] != self.get_checkpoint_settings():
+			raise Exception("The checkpoint "+self.args.checkpoint+" was created with different input files, settings or version of FuMa")
+		
+		self.set_checkpoint_fusions(checkpoint['fusions'])
+		
+		merged_fusions = [self.merged_fusion_from_ids(ids) for ids in checkpoint['merged_fusions']]
+		
+		fh = open(self.args.output,"r+",EXPORT_BUFFER_SIZE)
+		fh.seek(checkpoint['offset'])
+		fh.truncate()
+		
+		self.logger.info("Resuming from checkpoint at k="+str(checkpoint['k'])+" with "+str(len(merged_fusions))+" merged fusions and "+str(len(checkpoint['shards']))+" pending shards")
+		
+		return fh, merged_fusions, checkpoint['shards']
+	
+	def get_checkpoint_fusions(self):
+		"""
+		The experiments and their annotated fusions, in the order of
+		their ids. The genes are stored once and referred to by index,
+		such that fusions sharing a Gene object share it again after
+		set_checkpoint_fusions(). Duplicates that were merged into a
+		fusion are only stored by their locations.
+		"""
+		gene_ids = {}
+		genes = []
+		
+		def get_gene_ids(annotated_genes):
+			ids = []
+			for gene in annotated_genes:
+				if(not gene_ids.has_key(id(gene))):
+					gene_ids[id(gene)] = len(genes)
+					genes.append([gene.name, gene.is_long_gene])
+				ids.append(gene_ids[id(gene)])
+			return ids
+		
+		fusions = []
+		for fusion in self.fusions:
+			duplicates = [[match.get_left_chromosome(), match.get_right_chromosome(), match.get_left_break_position(), match.get_right_break_position(), match.uid] for match in fusion.matches if match is not fusion]
+			
+			fusions.append([fusion.get_left_chromosome(), fusion.get_right_chromosome(), fusion.get_left_break_position(), fusion.get_right_break_position(), fusion.left_strand, fusion.right_strand, fusion.uid, fusion.acceptor_donor_direction, get_gene_ids(fusion.annotated_genes_left), get_gene_ids(fusion.annotated_genes_right), duplicates])
+		
+		return {
+			'experiments': [[experiment.name, len(experiment)] for experiment in self.experiments],
+			'genes': genes,
+			'fusions': fusions}
+	
+	def set_checkpoint_fusions(self,checkpoint_fusions):
+		"""
+		Replaces the experiments by those stored with
+		get_checkpoint_fusions() and indexes their fusions, in the same
+		order and thus with the same ids.
+		"""
+		genes = [Gene(from_json(name),is_long_gene) for name,is_long_gene in checkpoint_fusions['genes']]
+		
+		self.experiments = []
+		fusions = []
+		
+		offset = 0
+		for name, n in checkpoint_fusions['experiments']:
+			experiment = FusionDetectionExperiment(from_json(name))
+			
+			for left_chr, right_chr, left_pos, right_pos, left_strand, right_strand, uid, acceptor_donor_direction, genes_left, genes_right, duplicates in checkpoint_fusions['fusions'][offset:offset + n]:
+				fusion = Fusion(from_json(left_chr), from_json(right_chr), left_pos, right_pos, None, None, experiment.name, from_json(uid), False)
+				fusion.left_strand = left_strand
+				fusion.right_strand = right_strand
+				fusion.acceptor_donor_direction = acceptor_donor_direction
+				fusion.annotate_genes_left([genes[i] for i in genes_left])
+				fusion.annotate_genes_right([genes[i] for i in genes_right])
+				
+				for duplicate_left_chr, duplicate_right_chr, duplicate_left_pos, duplicate_right_pos, duplicate_uid in duplicates:
+					fusion.matches.add(Fusion(from_json(duplicate_left_chr), from_json(duplicate_right_chr), duplicate_left_pos, duplicate_right_pos, None, None, experiment.name, from_json(duplicate_uid), False))
+				
+				experiment.add_fusion(fusion)
+				fusions.append(fusion)
+			
+			self.add_experiment(experiment)
+			offset += n
+		
+		self.index_fusions(fusions)
+		self.checkpoint_fusions = checkpoint_fusions
+	
+	def merged_fusion_to_ids(self,merged_fusion,fusion_ids):
+		"""
+		The matched genes of a MergedFusion are always taken from the
+		annotated genes of one of its fusions (see match_fusions()).
+		They are referred to by name, because the order in which the
+		genes are annotated is not the same in every run.
+		"""
+		def gene_references(genes,side):
+			references = []
+			for gene in genes:
+				for fusion in merged_fusion.fusions:
+					if gene in getattr(fusion,'annotated_genes_'+side):
+						references.append([fusion_ids[fusion], str(gene)])
+						break
+				else:
+					raise Exception("Matched gene is not annotated to any of the fusions of the MergedFusion: "+str(gene))
+			return references
+		
+		return [sorted([fusion_ids[fusion] for fusion in merged_fusion.fusions]), gene_references(merged_fusion.annotated_genes_left,'left'), gene_references(merged_fusion.annotated_genes_right,'right')]
+	
+	def merged_fusion_from_ids(self,ids):
+		fusions, genes_left, genes_right = ids
+		
+		merged_fusion = MergedFusion()
+		for i in fusions:
+			merged_fusion.add_fusion(self.fusions[i])
+		
+		merged_fusion.annotate_genes_left([self.fusions[i].get_annotated_genes_left(True)[name][0] for i,name in genes_left])
+		merged_fusion.annotate_genes_right([self.fusions[i].get_annotated_genes_right(True)[name][0] for i,name in genes_right])
+		
+		return merged_fusion
+	
+	def find_components(self):
+		"""
+		Groups the fusion ids into components that can never be matched
+		with each other, using union-find over the candidate pairs. The
+		candidates of a MergedFusion are always a subset of the
+		candidates of its fusions, so the recursive levels never cross
+		a component either.
+		"""
+		parent = range(len(self.fusions))
+		
+		for y in range(len(self.fusions)):
+			for x,fusion_x in self.get_candidates(self.fusions[y]):
+				root_x = x
+				while parent[root_x] != root_x:
+					root_x = parent[root_x]
+				
+				root_y = y
+				while parent[root_y] != root_y:
+					root_y = parent[root_y]
+				
+				if root_x != root_y:
+					parent[max(root_x,root_y)] = min(root_x,root_y)
+				
+				parent[x] = parent[y] = min(root_x,root_y)
+		
+		components = {}
+		for i in range(len(self.fusions)):
+			root = i
+			while parent[root] != root:
+				root = parent[root]
+			
+			if(not components.has_key(root)):
+				components[root] = []
+			components[root].append(i)
+		
+		return [components[root] for root in sorted(components.keys())]
+	
+	def find_shards(self,n):
+		"""
+		Divides the components over at most n shards of similar size;
+		largest components first, each into the currently smallest shard.
+		"""
+		components = sorted(self.find_components(), key=lambda component: (-len(component),component[0]))
+		
+		shards = [[] for i in range(min(n,len(components)))]
+		for component in components:
+			smallest = min(range(len(shards)), key=lambda i: len(shards[i]))
+			shards[smallest] += component
+		
+		return [sorted(shard) for shard in shards if len(shard) > 0]
 	
 	def overlay_fusions_recursive(self,fh,merged_fusions):
-		n_total = self.num_fusions() * len(merged_fusions)
+		n_total = len(merged_fusions)
 		passed = 0
-		previous_percentage = -100.0
+		comparisons = 0
 		
 		k = len(merged_fusions[0].fusions)
 		if k > self.num_fusions():
 			raise Exception("Out of bound, reasonable recursion depth has exceeded")
 		
-		self.logger.info("Starting "+str(n_total)+" comparisons for k="+str(k))
+		self.logger.info("Starting comparisons of "+str(n_total)+" merged fusions for k="+str(k))
+		self.stats.start_level(k,n_total)
 		
 		export_fusions = [tmp for tmp in merged_fusions]
 		merged_fusions_new = []
 		
 		for x in range(len(merged_fusions)):
-			for y,fusion_y in self:
-				merged_fusion_x = merged_fusions[x]
-				n_total, passed, previous_percentage = self.log_progress(n_total, passed, previous_percentage)
-				
+			merged_fusion_x = merged_fusions[x]
+			
+			for y,fusion_y in self.get_candidates(merged_fusion_x):
 				# - if fusion_y not in merged_fusion ? // if fusion_y.dataset_name not in [tmp['dataset'] for tmp in fusion_x.locations()]
 				if fusion_y not in merged_fusion_x.fusions:
 					comparison = self.match_fusions(fusion_y, merged_fusion_x)
+					comparisons += 1
 					
 					if comparison != False:
 						export_fusions[x] = None
 						merged_fusions_new.append(comparison)
 						break
-				
-				passed += 1
-		n_total, passed, previous_percentage = self.log_progress(n_total, passed, previous_percentage)
+			
+			# Each merged fusion counts once, also when the comparisons stopped at the first match
+			passed += 1
+			self.stats.progress(passed,comparisons,len(merged_fusions_new))
 		
 		merged_fusions_new = self.prune_duplicates(merged_fusions_new)
+		self.stats.finish_level(len(merged_fusions_new))
 		self.export_list_chunked(fh,export_fusions)
 		
 		return merged_fusions_new
@@ -135,69 +625,78 @@ class ComparisonTriangle:
 	def prune_duplicates(self,merged_fusions):
 		"""
 		Remove MergedFusion instances with identical Fusion objects
+		
+		The frozen set of Fusion objects is used as key, so duplicates
+		are found in a single pass. The first occurrence is kept.
 		"""
 		
-		for y in range(len(merged_fusions)):
-			for x in range(y+1,len(merged_fusions)):
-				if merged_fusions[x] != None and merged_fusions[y] != None and merged_fusions[x].fusions == merged_fusions[y].fusions:
-					# Do some garbage removal?
-					merged_fusions[x] = None
+		unique_merged_fusions = []
+		observed = set()
 		
-		return [tmp for tmp in merged_fusions if tmp != None]
-	
-	def log_progress(self,n_total, passed, previous_percentage):
-		# Print percentage - doesn't entirely fit yet
-		percentage = 100.0 * (float(passed) / float(n_total))
-		if percentage >= previous_percentage + 5.0 or passed == n_total:# Repport each 5%
-			self.logger.debug(str(round(percentage,1))+"% completed")
-			previous_percentage = percentage
-		return n_total, passed, previous_percentage
+		for merged_fusion in merged_fusions:
+			key = frozenset(merged_fusion.fusions)
+			
+			if key not in observed:
+				observed.add(key)
+				unique_merged_fusions.append(merged_fusion)
+		
+		return unique_merged_fusions
 	
 	def export_list_fg(self,fusion,fh):
-		if(self.args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == AD_DIRECTION_REVERSE):
-			## A-B should be reported as B-A; chr1:123\tchr1:456 as chr1:456-chr1:123
-			fh.write(":".join(sorted(list(set([str(gene) for gene in fusion.get_annotated_genes_right2()])))) + "\t")
-			fh.write(":".join(sorted(list(set([str(gene) for gene in fusion.get_annotated_genes_left2()])))))
-			
-			if fusion.spans_a_large_gene():
-				fh.write("\tTRUE")
-			else:
-				fh.write("\tFALSE")
-			
-			for dataset in self.experiments:
-				fh.write("\t")
-				strdata = []
-				
-				for location in fusion.locations():
-					if location['dataset'] == dataset.name:
-						strdata.append(str(location['id'])+"=chr"+location['right'][0]+':'+str(location['right'][1])+'-chr'+location['left'][0]+':'+str(location['left'][1]))
-				
-				fh.write(",".join(sorted(strdata)))
+		fh.write(self.format_list_fg(fusion))
+	
+	def format_list_fg(self,fusion):
+		reverse = (self.args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == AD_DIRECTION_REVERSE)
+		
+		genes_left, genes_right = self.format_list_genes(fusion,reverse)
+		
+		return self.format_list_row(genes_left,genes_right,fusion.spans_a_large_gene(),fusion.locations(),reverse)
+	
+	def format_list_row(self,genes_left,genes_right,spans_a_large_gene,locations,reverse):
+		"""
+		Formats a single row of the list output. The locations are
+		grouped by dataset in one pass.
+		"""
+		row = [genes_left, genes_right]
+		
+		if spans_a_large_gene:
+			row.append("TRUE")
 		else:
-			fh.write(":".join(sorted(list(set([str(gene) for gene in fusion.get_annotated_genes_left2()])))) + "\t")
-			fh.write(":".join(sorted(list(set([str(gene) for gene in fusion.get_annotated_genes_right2()])))))
-			
-			if fusion.spans_a_large_gene():
-				fh.write("\tTRUE")
+			row.append("FALSE")
+		
+		strdata = {}
+		for location in locations:
+			if reverse:
+				first, second = location['right'], location['left']
 			else:
-				fh.write("\tFALSE")
+				first, second = location['left'], location['right']
 			
-			for dataset in self.experiments:
-				fh.write("\t")
-				strdata = []
-				
-				for location in fusion.locations():
-					if location['dataset'] == dataset.name:
-						strdata.append(str(location['id'])+"=chr"+location['left'][0]+':'+str(location['left'][1])+'-chr'+location['right'][0]+':'+str(location['right'][1]))
-				
-				fh.write(",".join(sorted(strdata)))
-			fh.write("\n")
+			if not strdata.has_key(location['dataset']):
+				strdata[location['dataset']] = []
+			strdata[location['dataset']].append(str(location['id'])+"=chr"+first[0]+':'+str(first[1])+'-chr'+second[0]+':'+str(second[1]))
+		
+		for dataset in self.experiments:
+			if strdata.has_key(dataset.name):
+				row.append(",".join(sorted(strdata[dataset.name])))
+			else:
+				row.append("")
+		
+		return "\t".join(row)+"\n"
+	
+	def format_list_genes(self,fusion,reverse):
+		if reverse:
+			## A-B should be reported as B-A; chr1:123\tchr1:456 as chr1:456-chr1:123
+			return ":".join(sorted(fusion.get_annotated_gene_names_right())), ":".join(sorted(fusion.get_annotated_gene_names_left()))
+		else:
+			return ":".join(sorted(fusion.get_annotated_gene_names_left())), ":".join(sorted(fusion.get_annotated_gene_names_right()))
 	
 	def export_list_header(self):
 		if self.args.output == "-":
 			fh = sys.stdout
+		elif self.args.output.endswith(".gz"):
+			fh = gzip.open(self.args.output,"wb")
 		else:
-			fh = open(self.args.output,"w")
+			fh = open(self.args.output,"w",EXPORT_BUFFER_SIZE)
 		
 		fh.write("Left-genes\tRight-genes\t")
 		if self.args.long_gene_size > 0:
@@ -212,12 +711,35 @@ class ComparisonTriangle:
 		return fh
 	
 	def export_list_chunked(self,fh,chunk_fusions):
+		if self.rows != None:
+			self.rows += [fusion for fusion in chunk_fusions if fusion not in [None, False]]
+			return
+		
+		if self.dataset_mask_counts != None:
+			for fusion in chunk_fusions:
+				if fusion not in [None, False]:
+					self.dataset_mask_counts[fusion.dataset_mask] = self.dataset_mask_counts.get(fusion.dataset_mask,0) + 1
+			return
+		
+		started = time.time()
+		rows = []
+		
 		for fusion in chunk_fusions:
 			if fusion not in [None, False]:# False means marked as duplicate earlier on
-				self.export_list_fg(fusion,fh)
+				rows.append(self.format_list_fg(fusion))
 				
-				if not isinstance(fusion, Fusion):
-					del(fusion)# MergedFusion is not part of any original object, only used for determining the overlap. Get rid of object as soon as possible
+				if self.incidence_matrix != None:
+					genes_left, genes_right = self.format_list_genes(fusion,(self.args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == AD_DIRECTION_REVERSE))
+					self.incidence_matrix.add(genes_left,genes_right,fusion.dataset_mask)
+				
+				if len(rows) >= EXPORT_CHUNK_SIZE:
+					fh.write("".join(rows))
+					rows = []
+		
+		if rows:
+			fh.write("".join(rows))
+		
+		self.stats.add('export',time.time() - started)
 	
 	def __len__(self):
 		return len(self.experiments)
@@ -228,6 +750,118 @@ class ComparisonTriangle:
 			n += len(experiment)
 		return n
 	
+	def index_fusions(self,fusions=None):
+		"""
+		Candidate generation: buckets the fusions on the properties
+		that match_fusions() requires to be identical, i.e. the strands
+		(with strand-specific-matching) and the acceptor-donor direction
+		(with acceptor-donor-order-specific-matching). Fusions without
+		annotated genes can never match and are not indexed at all.
+		
+		The chromosome names are deliberately not part of the key:
+		since v3.0 fusion genes with identical genes annotated on
+		different chromosome names are considered identical.
+		
+		Within each bucket an inverted index from gene name to fusion
+		ids is kept for the left and the right genes. Two fusions that
+		do not share at least one left and one right gene can not
+		match using overlap, subset or egm. For egm the exact gene sets
+		are used as key instead.
+		
+		The fusions are those of the experiments, in their order, unless
+		a list of fusions is given.
+		"""
+		self.index = {}
+		self.fusions = []
+		
+		n_experiments = len([experiment for experiment in self.experiments if len(experiment) > 0])
+		
+		for i,fusion in (self if fusions == None else enumerate(fusions)):
+			self.fusions.append(fusion)
+			
+			# Such fusions would raise an exception during the first comparison with another dataset
+			if n_experiments > 1:
+				if self.args.strand_specific_matching and (fusion.get_left_strand() == None or fusion.get_right_strand() == None):
+					raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion.__str__())
+				if self.args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == None:
+					raise Exception("A fusion gene without an annotated acceptor-donor direction was used for acceptor-donor-order-specific-matching.\n\n"+fusion.__str__())
+			
+			if fusion.has_annotated_genes():
+				key = self.get_index_key(fusion)
+				
+				if(not self.index.has_key(key)):
+					self.index[key] = {'left':{}, 'right':{}, 'gene_sets':{}}
+				
+				bucket = self.index[key]
+				left_genes, right_genes = self.get_gene_names(fusion)
+				
+				if self.args.matching_method == 'egm':
+					gene_sets = (left_genes, right_genes)
+					if(not bucket['gene_sets'].has_key(gene_sets)):
+						bucket['gene_sets'][gene_sets] = []
+					bucket['gene_sets'][gene_sets].append(i)
+				else:
+					for gene in left_genes:
+						if(not bucket['left'].has_key(gene)):
+							bucket['left'][gene] = []
+						bucket['left'][gene].append(i)
+					
+					for gene in right_genes:
+						if(not bucket['right'].has_key(gene)):
+							bucket['right'][gene] = []
+						bucket['right'][gene].append(i)
+	
+	def get_index_key(self,fusion):
+		key = []
+		
+		if self.args.strand_specific_matching:
+			key.append(fusion.get_left_strand())
+			key.append(fusion.get_right_strand())
+		
+		if self.args.acceptor_donor_order_specific_matching:
+			key.append(fusion.acceptor_donor_direction)
+		
+		return tuple(key)
+	
+	def get_gene_names(self,fusion):
+		left_genes = fusion.get_annotated_gene_names_left()
+		right_genes = fusion.get_annotated_gene_names_right()
+		
+		return left_genes, right_genes
+	
+	def get_candidates(self,fusion):
+		"""
+		Returns the (i,fusion) tuples, sorted on i, that can possibly
+		match the given Fusion or MergedFusion.
+		"""
+		key = self.get_index_key(fusion)
+		
+		if not fusion.has_annotated_genes() or not self.index.has_key(key):
+			return []
+		
+		bucket = self.index[key]
+		left_genes, right_genes = self.get_gene_names(fusion)
+		
+		if self.args.matching_method == 'egm':
+			if bucket['gene_sets'].has_key((left_genes, right_genes)):
+				ids = bucket['gene_sets'][(left_genes, right_genes)]
+			else:
+				ids = []
+		else:
+			ids_left = set()
+			for gene in left_genes:
+				if bucket['left'].has_key(gene):
+					ids_left.update(bucket['left'][gene])
+			
+			ids_right = set()
+			for gene in right_genes:
+				if bucket['right'].has_key(gene):
+					ids_right.update(bucket['right'][gene])
+			
+			ids = sorted(ids_left & ids_right)
+		
+		return [(i,self.fusions[i]) for i in ids]
+	
 	def __iter__(self):
 		i = 0
 		for experiment in self.experiments:
@@ -248,113 +882,52 @@ class ComparisonTriangle:
 				# (not is_empty(a)) and subset(a,b) or subset(b,a)
 		"""
 		
-		# First check whether the strands match, if strand-specific-matching is enabled:
-		if	self.match_fusion_gene_strands(fusion_1,fusion_2) and \
-			self.match_acceptor_donor_direction(fusion_1,fusion_2) and \
-			fusion_1.has_annotated_genes() and \
-			fusion_2.has_annotated_genes():
-			
+		matches = self.matcher.match(fusion_1,fusion_2)
+		
+		if matches:
 			# Compare the fusion genes based on their gene names
-			if(self.args.matching_method == 'overlap'):
-				matches_left  = self.match_overlap(fusion_1.get_annotated_genes_left2(), fusion_2.get_annotated_genes_left2())
-				matches_right = self.match_overlap(fusion_1.get_annotated_genes_right2(), fusion_2.get_annotated_genes_right2())
-			elif(self.args.matching_method == 'egm'):
-				matches_left  = self.match_egm(fusion_1.get_annotated_genes_left2(), fusion_2.get_annotated_genes_left2())
-				matches_right = self.match_egm(fusion_1.get_annotated_genes_right2(), fusion_2.get_annotated_genes_right2())
-			else:
-				matches_left  = self.match_sets(fusion_1.get_annotated_genes_left2(), fusion_2.get_annotated_genes_left2())
-				matches_right = self.match_sets(fusion_1.get_annotated_genes_right2(), fusion_2.get_annotated_genes_right2())
+			matches_left  = self.matcher.get_matched_genes(fusion_1.get_annotated_genes_left2(), fusion_2.get_annotated_genes_left2(), fusion_1.get_annotated_gene_names_left(), fusion_2.get_annotated_gene_names_left(), matches[0])
+			matches_right = self.matcher.get_matched_genes(fusion_1.get_annotated_genes_right2(), fusion_2.get_annotated_genes_right2(), fusion_1.get_annotated_gene_names_right(), fusion_2.get_annotated_gene_names_right(), matches[1])
 			
-			if matches_left and matches_right:
-				# Fusion only merges with MergedFusion
-				#if isinstance(fusion_1, MergedFusion) and isinstance(fusion_2, MergedFusion):
-				#	raise Exception("If (A & B) == (C & D), (A & B & C) should have matched before..")
-				#	#merged_fusion = fusion_1
-				#	#merged_fusion.merge(fusion_2)
-				#	#replace_merged_fusions = fusion_2
-				#
-				# And the  first object is always a Fusion, the second possibly a MergedFusion
-				#elif isinstance(fusion_1, MergedFusion) and isinstance(fusion_2, Fusion):
-				#	merged_fusion = fusion_1
-				#	merged_fusion.add_fusion(fusion_2)
-				#
-				# And the following can be done cleaner
-				#elif isinstance(fusion_1, Fusion) and isinstance(fusion_2, MergedFusion):
-				#	merged_fusion = fusion_2
-				#	merged_fusion.add_fusion(fusion_1)
-				#elif isinstance(fusion_1, Fusion) and isinstance(fusion_2, Fusion):
-				#	merged_fusion = MergedFusion()
-				#	merged_fusion.add_fusion(fusion_1)
-				#	merged_fusion.add_fusion(fusion_2)
-				
-				if isinstance(fusion_1, Fusion):
-					if isinstance(fusion_2, MergedFusion):
-						merged_fusion = fusion_2
-						merged_fusion.add_fusion(fusion_1)
-					elif isinstance(fusion_2, Fusion):
-						merged_fusion = MergedFusion()
-						merged_fusion.add_fusion(fusion_1)
-						merged_fusion.add_fusion(fusion_2)
-					else:
-						raise Exception("Something went wrong with the object types")
+			# Fusion only merges with MergedFusion
+			#if isinstance(fusion_1, MergedFusion) and isinstance(fusion_2, MergedFusion):
+			#	raise Exception("If (A & B) == (C & D), (A & B & C) should have matched before..")
+			#	#merged_fusion = fusion_1
+			#	#merged_fusion.merge(fusion_2)
+			#	#replace_merged_fusions = fusion_2
+			#
+			# And the  first object is always a Fusion, the second possibly a MergedFusion
+			#elif isinstance(fusion_1, MergedFusion) and isinstance(fusion_2, Fusion):
+			#	merged_fusion = fusion_1
+			#	merged_fusion.add_fusion(fusion_2)
+			#
+			# And the following can be done cleaner
+			#elif isinstance(fusion_1, Fusion) and isinstance(fusion_2, MergedFusion):
+			#	merged_fusion = fusion_2
+			#	merged_fusion.add_fusion(fusion_1)
+			#elif isinstance(fusion_1, Fusion) and isinstance(fusion_2, Fusion):
+			#	merged_fusion = MergedFusion()
+			#	merged_fusion.add_fusion(fusion_1)
+			#	merged_fusion.add_fusion(fusion_2)
+			
+			if isinstance(fusion_1, Fusion):
+				if isinstance(fusion_2, MergedFusion):
+					merged_fusion = fusion_2
+					merged_fusion.add_fusion(fusion_1)
+				elif isinstance(fusion_2, Fusion):
+					merged_fusion = MergedFusion()
+					merged_fusion.add_fusion(fusion_1)
+					merged_fusion.add_fusion(fusion_2)
 				else:
 					raise Exception("Something went wrong with the object types")
-				
-				# This has to be pre-cached and can not be determined on the fly by a functions,
-				# because it requires the type of matching. If you would allow for functions, you could 
-				# end up with overlap and egm and subset based matching mixed up.
-				merged_fusion.annotated_genes_left = matches_left
-				merged_fusion.annotated_genes_right = matches_right
-				
-				return merged_fusion
-		return False
-	
-	def match_fusion_gene_strands(self,fusion_1,fusion_2):
-		if not self.args.strand_specific_matching:
-			return True
-		else:
-			if fusion_1.get_left_strand() == None or fusion_1.get_right_strand() == None or fusion_2.get_left_strand() == None or fusion_2.get_right_strand() == None:
-				raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
 			else:
-				return fusion_1.get_left_strand() == fusion_2.get_left_strand() and fusion_1.get_right_strand() == fusion_2.get_right_strand()
-	
-	def match_acceptor_donor_direction(self,fusion_1,fusion_2):
-		if(not self.args.acceptor_donor_order_specific_matching):
-			return True
-		elif(fusion_1.acceptor_donor_direction == None or fusion_2.acceptor_donor_direction == None):
-			raise Exception("A fusion gene without an annotated acceptor-donor direction was used for acceptor-donor-order-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
-		else:
-			return (fusion_1.acceptor_donor_direction == fusion_2.acceptor_donor_direction)
-	
-	def match_overlap(self,set1,set2):									#https://docs.python.org/2/library/sets.html
-		set1_s = set([str(gene) for gene in set1])
-		set2_s = set([str(gene) for gene in set2])
-		
-		overlap = set1_s.intersection(set2_s)
-		if(not overlap):
-			return None
-		else:
-			gene_list = []
-			for gene in set1:
-				if str(gene) in overlap:
-					gene_list.append(gene)
-			return gene_list
-	
-	def match_egm(self,set1,set2):
-		set1_s = set([str(gene) for gene in set1])
-		set2_s = set([str(gene) for gene in set2])
-		if set1_s == set2_s:
-			return set1
-		else:
-			return None
-	
-	def match_sets(self,superset,subset):								#https://docs.python.org/2/library/sets.html
-		subset_s = set([str(gene) for gene in subset])
-		superset_s = set([str(gene) for gene in superset])
-		
-		if(len(subset_s) > len(superset_s)):
-			return self.match_sets(subset,superset)						# Gene names have to be provided as sets
-		elif(subset_s.issubset(superset_s)):
-			return subset
-		else:
-			return None
+				raise Exception("Something went wrong with the object types")
+			
+			# This has to be pre-cached and can not be determined on the fly by a functions,
+			# because it requires the type of matching. If you would allow for functions, you could 
+			# end up with overlap and egm and subset based matching mixed up.
+			merged_fusion.annotate_genes_left(matches_left)
+			merged_fusion.annotate_genes_right(matches_right)
+			
+			return merged_fusion
+		return False
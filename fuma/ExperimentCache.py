@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging,os,os.path,tempfile,hashlib
+
+import numpy
+
+import fuma
+from Gene import Gene
+from FusionColumns import FusionColumns
+from FusionDetectionExperiment import FusionDetectionExperiment
+
+# Increase when the layout of the cached files changes
+CACHE_VERSION = 2
+
+
+class ExperimentCache:
+	"""
+	On-disk cache of parsed experiments and, separately, of their gene
+	annotations, such that repeated runs on the same input files do
+	not parse and annotate them again.
+	
+	An experiment is stored as the NumPy arrays of its FusionColumns,
+	keyed on the size, modification time and MD5 hash of the input file
+	and the input format. Its annotation is stored as the gene names
+	and long gene flags with, per annotated fusion, its row in the
+	experiment and the indices of its left and right genes. It is keyed
+	on the experiment and on the fingerprint of the BED file and the
+	long gene size.
+	
+	When the files in the directory exceed max_size bytes, the least
+	recently used files are removed.
+	"""
+	
+	logger = logging.getLogger("FuMa::ExperimentCache")
+	
+	def __init__(self,directory,max_size):
+		self.directory = directory
+		self.max_size = max_size
+		
+		if(not os.path.isdir(self.directory)):
+			os.makedirs(self.directory)
+		
+		self.fingerprints = {}
+		
+		# Genes loaded from the cache, shared by the experiments annotated with the same gene annotation
+		self.genes = {}
+	
+	def get_file_fingerprint(self,filename):
+		filename = os.path.abspath(filename)
+		
+		if(not self.fingerprints.has_key(filename)):
+			md5 = hashlib.md5()
+			with open(filename,"rb") as fh:
+				for block in iter(lambda: fh.read(1048576),""):
+					md5.update(block)
+			
+			stat = os.stat(filename)
+			self.fingerprints[filename] = str(stat.st_size)+"-"+str(int(stat.st_mtime))+"-"+md5.hexdigest()
+		
+		return self.fingerprints[filename]
+	
+	def get_key(self,*items):
+		return hashlib.md5(repr((CACHE_VERSION,fuma.__version__)+items)).hexdigest()
+	
+	def get_experiment_key(self,filename,input_format):
+		return self.get_key('experiment',input_format,self.get_file_fingerprint(filename))
+	
+	def get_annotation_fingerprint(self,filename,long_gene_size):
+		return self.get_key('gene_annotation',self.get_file_fingerprint(filename),long_gene_size)
+	
+	def get_annotation_key(self,experiment_key,annotation_fingerprint):
+		return self.get_key('annotation',experiment_key,annotation_fingerprint)
+	
+	def get_filename(self,key,suffix):
+		return os.path.join(self.directory,key+"."+suffix+".npz")
+	
+	def load_arrays(self,filename):
+		if(os.path.isfile(filename)):
+			try:
+				with open(filename,"rb") as fh:
+					arrays = numpy.load(fh,allow_pickle=False)
+					arrays = dict([(name,arrays[name]) for name in arrays.files])
+			except Exception as e:
+				self.logger.warning("Could not read cached file "+filename+": "+str(e))
+				return None
+			
+			# The modification time marks the last use for the eviction
+			os.utime(filename,None)
+			return arrays
+		else:
+			return None
+	
+	def save_arrays(self,filename,arrays):
+		"""
+		The file is written under a temporary name and renamed, so
+		concurrent runs never read a partially written file.
+		"""
+		fd, tmp_filename = tempfile.mkstemp(prefix=".fuma-",suffix=".npz",dir=self.directory)
+		with os.fdopen(fd,"wb") as fh:
+			numpy.savez(fh,**arrays)
+		os.rename(tmp_filename,filename)
+		
+		self.evict(filename)
+	
+	def evict(self,keep=None):
+		"""
+		The file that was just written (keep) is never removed, also not
+		when it is the oldest or larger than max_size by itself.
+		"""
+		files = []
+		for filename in os.listdir(self.directory):
+			if(filename.endswith(".npz") and not filename.startswith(".") and (keep == None or filename != os.path.basename(keep))):
+				stat = os.stat(os.path.join(self.directory,filename))
+				files.append((stat.st_mtime,stat.st_size,filename))
+		
+		size = sum([item[1] for item in files])
+		if(keep != None):
+			size += os.path.getsize(keep)
+		
+		for mtime, file_size, filename in sorted(files):
+			if(size <= self.max_size):
+				break
+			
+			self.logger.debug("Removing least recently used cached file: "+filename)
+			os.remove(os.path.join(self.directory,filename))
+			size -= file_size
+	
+	def load_experiment(self,key,name):
+		"""
+		Returns the cached experiment as FusionDetectionExperiment of
+		which the fusions are materialized when used, or None.
+		"""
+		arrays = self.load_arrays(self.get_filename(key,"experiment"))
+		
+		if(arrays == None):
+			return None
+		else:
+			columns = FusionColumns()
+			columns.set_arrays(arrays)
+			
+			experiment = FusionDetectionExperiment(name)
+			experiment.breakpoint_columns = columns
+			
+			self.logger.info("Loaded "+str(len(columns))+" fusions of "+name+" from the cache")
+			
+			return experiment
+	
+	def save_experiment(self,key,experiment):
+		"""
+		Saves the fusions of a parsed (not annotated) experiment in the
+		order of their stable ids.
+		"""
+		if(len(experiment.fusions) == 0 and experiment.breakpoint_columns != None):
+			columns = experiment.breakpoint_columns
+		else:
+			experiment.materialize_fusions()
+			
+			columns = FusionColumns()
+			for fusion in experiment.fusions:
+				columns.append_fusion(fusion)
+		
+		self.save_arrays(self.get_filename(key,"experiment"),columns.get_arrays())
+	
+	def get_gene(self,annotation_fingerprint,name,is_long_gene):
+		key = (annotation_fingerprint,name,is_long_gene)
+		
+		if(not self.genes.has_key(key)):
+			self.genes[key] = Gene(name,is_long_gene)
+		
+		return self.genes[key]
+	
+	def load_annotation(self,experiment_key,annotation_fingerprint,experiment,gene_annotation):
+		"""
+		Annotates the genes of both junctions of the experiment from the
+		cache and marks the experiment as annotated with gene_annotation.
+		Returns whether the annotation was found.
+		
+		Like FusionDetectionExperiment.annotate_junctions(), only the
+		breakpoints with genes on both junctions are materialized if the
+		experiment has not been materialized yet.
+		"""
+		arrays = self.load_arrays(self.get_filename(self.get_annotation_key(experiment_key,annotation_fingerprint),"annotation"))
+		
+		if(arrays != None):
+			if(len(experiment) != int(arrays['n_rows'])):
+				self.logger.warning("Cached annotation of "+experiment.name+" does not match its fusions")
+				return False
+			
+			rows = arrays['rows'].tolist()
+			offsets = dict([(side,arrays[side+'_offsets'].tolist()) for side in ['left','right']])
+			
+			if(experiment.breakpoint_columns != None and len(experiment.fusions) == 0):
+				annotated = [k for k in range(len(rows)) if offsets['left'][k + 1] > offsets['left'][k] and offsets['right'][k + 1] > offsets['right'][k]]
+				
+				experiment.n_non_gene_spanning = len(experiment) - len(annotated)
+				experiment.gene_spanning_rows = [rows[k] for k in annotated]
+				experiment.materialize_fusions(experiment.gene_spanning_rows)
+				
+				fusions = experiment.fusions
+			else:
+				experiment.materialize_fusions()
+				
+				annotated = range(len(rows))
+				fusions = [experiment.fusions[rows[k]] for k in annotated]
+			
+			genes = [self.get_gene(annotation_fingerprint,str(arrays['gene_names'][i]),bool(arrays['long_genes'][i])) for i in range(len(arrays['gene_names']))]
+			
+			for side in ['left','right']:
+				indices = arrays[side+'_genes'].tolist()
+				
+				for fusion, k in zip(fusions,annotated):
+					fusion_genes = [genes[j] for j in indices[offsets[side][k]:offsets[side][k + 1]]]
+					
+					if(side == 'left'):
+						fusion.annotate_genes_left(fusion_genes)
+					else:
+						fusion.annotate_genes_right(fusion_genes)
+			
+			experiment.genes_spanning_left_junction = [gene_annotation]
+			experiment.genes_spanning_right_junction = [gene_annotation]
+			
+			self.logger.info("Loaded the gene annotation of "+experiment.name+" from the cache")
+			
+			return True
+		else:
+			return False
+	
+	def save_annotation(self,experiment_key,annotation_fingerprint,experiment):
+		"""
+		Saves the genes annotated to the fusions of the experiment, with
+		their rows: their stable ids, or, if the breakpoints without
+		genes were discarded by the annotation, the rows they were
+		materialized from. This has to be done before the duplicates are
+		removed.
+		"""
+		experiment.materialize_fusions()
+		
+		if(experiment.gene_spanning_rows != None):
+			rows = experiment.gene_spanning_rows
+		else:
+			rows = range(len(experiment.fusions))
+		
+		gene_ids = {}
+		gene_names = []
+		long_genes = []
+		
+		arrays = {}
+		for side in ['left','right']:
+			offsets = [0]
+			indices = []
+			
+			for fusion in experiment.fusions:
+				if(side == 'left'):
+					fusion_genes = fusion.get_annotated_genes_left(False)
+				else:
+					fusion_genes = fusion.get_annotated_genes_right(False)
+				
+				for gene in fusion_genes:
+					if(not gene_ids.has_key(id(gene))):
+						gene_ids[id(gene)] = len(gene_names)
+						gene_names.append(str(gene))
+						long_genes.append(gene.is_long_gene)
+					
+					indices.append(gene_ids[id(gene)])
+				offsets.append(len(indices))
+			
+			arrays[side+'_offsets'] = numpy.array(offsets,dtype=numpy.int64)
+			arrays[side+'_genes'] = numpy.array(indices,dtype=numpy.int32)
+		
+		arrays['rows'] = numpy.array(rows,dtype=numpy.int64)
+		arrays['n_rows'] = numpy.array(len(experiment.fusions) + experiment.n_non_gene_spanning,dtype=numpy.int64)
+		arrays['gene_names'] = numpy.array(gene_names,dtype=str)
+		arrays['long_genes'] = numpy.array(long_genes,dtype=bool)
+		
+		self.save_arrays(self.get_filename(self.get_annotation_key(experiment_key,annotation_fingerprint),"annotation"),arrays)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging,os,os.path,shutil,tempfile,collections,cPickle
+
+
+class ExperimentStore:
+	"""
+	Dictionary of FusionDetectionExperiments (OverlapComplex.matrix_tmp)
+	that keeps at most max_fusions fusions of the intermediate ('_vs._')
+	experiments in memory. When the limit is exceeded, the least
+	recently used intermediate experiments are spilled to disk and they
+	are paged back in when they are requested again.
+	
+	The original fusions, their genes and the gene annotations are
+	shared by all experiments. They are pickled as references
+	(persistent ids), so a spilled experiment only contains its merged
+	fusions and the identity of the original objects is preserved.
+	"""
+	
+	logger = logging.getLogger("FuMa::ExperimentStore")
+	
+	def __init__(self,max_fusions,shared_experiments,directory=None):
+		self.max_fusions = max_fusions
+		self.directory = directory
+		self.spill_directory = None
+		
+		self.experiments = collections.OrderedDict()# In memory, least recently used first
+		self.spilled = {}# On disk
+		self.n_fusions = 0
+		
+		self.shared_objects = []
+		self.shared_ids = {}
+		for experiment in shared_experiments:
+			self.add_shared_object(experiment)
+			
+			for gene_annotation in (experiment.genes_spanning_left_junction or [])+(experiment.genes_spanning_right_junction or []):
+				self.add_shared_object(gene_annotation)
+			
+			for fusion in experiment:
+				for original_fusion in [fusion]+list(fusion.matches):
+					self.add_shared_object(original_fusion)
+					
+					for gene in original_fusion.get_annotated_genes_left(False)+original_fusion.get_annotated_genes_right(False):
+						self.add_shared_object(gene)
+	
+	def add_shared_object(self,obj):
+		if not self.shared_ids.has_key(id(obj)):
+			self.shared_ids[id(obj)] = len(self.shared_objects)
+			self.shared_objects.append(obj)
+	
+	def persistent_id(self,obj):
+		return self.shared_ids.get(id(obj),None)
+	
+	def persistent_load(self,i):
+		return self.shared_objects[int(i)]
+	
+	def is_intermediate(self,key):
+		return key.find(".") > -1
+	
+	def __setitem__(self,key,experiment):
+		if self.has_key(key):
+			del(self[key])
+		
+		self.experiments[key] = experiment
+		if self.is_intermediate(key):
+			self.n_fusions += len(experiment)
+		
+		self.spill(key)
+	
+	def __getitem__(self,key):
+		if self.experiments.has_key(key):
+			experiment = self.experiments.pop(key)
+			self.experiments[key] = experiment
+		else:
+			experiment = self.load(key)
+			
+			self.experiments[key] = experiment
+			self.n_fusions += len(experiment)
+			
+			self.spill(key)
+		
+		return experiment
+	
+	def __delitem__(self,key):
+		if self.experiments.has_key(key):
+			experiment = self.experiments.pop(key)
+			if self.is_intermediate(key):
+				self.n_fusions -= len(experiment)
+		
+		if self.spilled.has_key(key):
+			os.remove(self.spilled.pop(key))
+	
+	def has_key(self,key):
+		return self.experiments.has_key(key) or self.spilled.has_key(key)
+	
+	def __contains__(self,key):
+		return self.has_key(key)
+	
+	def spill(self,requested_key):
+		"""
+		Spills intermediate experiments, least recently used first,
+		until the limit is met. The requested experiment is kept.
+		"""
+		if self.max_fusions > 0:
+			for key in [key for key in self.experiments.keys() if self.is_intermediate(key) and key != requested_key]:
+				if self.n_fusions <= self.max_fusions:
+					break
+				
+				experiment = self.experiments.pop(key)
+				self.n_fusions -= len(experiment)
+				
+				# An experiment that was paged in is still on disk
+				if not self.spilled.has_key(key):
+					self.dump(key,experiment)
+	
+	def dump(self,key,experiment):
+		if self.spill_directory == None:
+			self.spill_directory = tempfile.mkdtemp(prefix="fuma-",dir=self.directory)
+		
+		filename = os.path.join(self.spill_directory,key+".pickle")
+		
+		with open(filename,"wb") as fh:
+			pickler = cPickle.Pickler(fh,cPickle.HIGHEST_PROTOCOL)
+			pickler.persistent_id = self.persistent_id
+			pickler.dump(experiment)
+		
+		self.spilled[key] = filename
+		self.logger.debug("Spilled "+key+" ("+str(len(experiment))+" fusions) to disk")
+	
+	def load(self,key):
+		"""
+		The file is kept, so paging in does not modify the disk (e.g.
+		by forked worker processes) and the experiment can be spilled
+		again without writing it.
+		"""
+		with open(self.spilled[key],"rb") as fh:
+			unpickler = cPickle.Unpickler(fh)
+			unpickler.persistent_load = self.persistent_load
+			experiment = unpickler.load()
+		
+		self.logger.debug("Paged "+key+" ("+str(len(experiment))+" fusions) back in from disk")
+		
+		return experiment
+	
+	def close(self):
+		if self.spill_directory != None:
+			shutil.rmtree(self.spill_directory)
+			self.spill_directory = None
+		
+		self.spilled = {}
@@ -29,6 +29,30 @@ STRAND_UNDETERMINED = None
 AD_DIRECTION_FORWARD = True
 AD_DIRECTION_REVERSE = False
 
+def cleanup_chr_name(chr_name):
+	"""Given the large number of fusion genes, we remove all 'chr'
+	prefixes because they add 6 bytes per fusion gene. They can be
+	added again using the getter functions.
+	"""
+	
+	chr_name = chr_name.strip()
+	return chr_name[3:] if chr_name[0:3] == "chr" else chr_name
+
+def find_strand_type(strand_type):
+	if(strand_type in [STRAND_FORWARD, STRAND_REVERSE]):
+		return strand_type
+	
+	if isinstance(strand_type, basestring):
+		strand_type = strand_type.lower()
+		if strand_type in ["f","+","forward","forwards","positive","5' -> 3'"]:
+			return STRAND_FORWARD
+		elif strand_type in ["b","-","r","backward","backwards","reverse","negative","3' -> 5'"]:
+			return STRAND_REVERSE
+		else:
+			raise Exception("Unknown fusion strand: '"+strand_type+"'")
+	
+	return None
+
 class Fusion:
 	def __init__(self, \
 	   arg_left_chr, \
@@ -48,6 +72,8 @@ class Fusion:
 		self.annotated_genes_left = None
 		self.annotated_genes_right = None
 		
+		self.flush_annotation_caches()
+		
 		self.left_strand = None
 		self.right_strand = None
 		
@@ -59,6 +85,9 @@ class Fusion:
 		#@todo use pointer to original dataset?
 		self.dataset_name = arg_dataset_name
 		
+		# Bitmask of the dataset(s) the fusion belongs to, assigned by ComparisonTriangle.add_experiment()
+		self.dataset_mask = 0
+		
 		self.acceptor_donor_direction = None
 		
 		self.set( \
@@ -138,31 +167,13 @@ class Fusion:
 				self.acceptor_donor_direction = AD_DIRECTION_FORWARD
 	
 	def find_strand_type(self,strand_type):
-		if(strand_type in [STRAND_FORWARD, STRAND_REVERSE]):
-			return strand_type
-		
-		if isinstance(strand_type, basestring):
-			strand_type = strand_type.lower()
-			if strand_type in ["f","+","forward","forwards","positive","5' -> 3'"]:
-				return STRAND_FORWARD
-			elif strand_type in ["b","-","r","backward","backwards","reverse","negative","3' -> 5'"]:
-				return STRAND_REVERSE
-			else:
-				raise Exception("Unknown fusion strand: '"+strand_type+"'")
-		
-		return None
+		return find_strand_type(strand_type)
 	
 	def acceptor_donor_direction(self):
 		return self.acceptor_donor_direction
 	
 	def cleanup_chr_name(self,chr_name):
-		"""Given the large number of fusion genes, we remove all 'chr'
-		prefixes because they add 6 bytes per fusion gene. They can be
-		added again using the getter functions.
-		"""
-		
-		chr_name = chr_name.strip()
-		return chr_name[3:] if chr_name[0:3] == "chr" else chr_name
+		return cleanup_chr_name(chr_name)
 	
 	def get_left_position(self,chromosome_with_prefix=False):
 		return [self.get_left_chromosome(chromosome_with_prefix),self.get_left_break_position()]
@@ -226,8 +237,27 @@ class Fusion:
 	def annotate_genes_left(self,gene_names):
 		self.annotated_genes_left = gene_names
 		
+		self.gene_names_left = None
+		self.genes_left_index = None
+		
 	def annotate_genes_right(self,gene_names):
 		self.annotated_genes_right = gene_names
+		
+		self.gene_names_right = None
+		self.genes_right_index = None
+	
+	def flush_annotation_caches(self):
+		"""
+		The gene names and name-indexed genes are used for every single
+		comparison, but the annotation does not change after it has been
+		assigned. They are therefore cached until annotate_genes_left()
+		or annotate_genes_right() is called again.
+		"""
+		self.gene_names_left = None
+		self.gene_names_right = None
+		
+		self.genes_left_index = None
+		self.genes_right_index = None
 	
 	def get_annotated_genes_left(self,name_indexed):
 		if(not name_indexed):
@@ -236,15 +266,18 @@ class Fusion:
 			else:
 				return self.annotated_genes_left
 		else:
-			index = {}
-			
-			for gene in self.get_annotated_genes_left(False):
-				gene_name = str(gene)
-				if(not index.has_key(gene_name)):
-					index[gene_name] = []
-				index[gene_name].append(gene)
+			if(self.genes_left_index == None):
+				index = {}
+				
+				for gene in self.get_annotated_genes_left(False):
+					gene_name = str(gene)
+					if(not index.has_key(gene_name)):
+						index[gene_name] = []
+					index[gene_name].append(gene)
+				
+				self.genes_left_index = index
 			
-			return index
+			return self.genes_left_index
 	
 	def get_annotated_genes_right(self,name_indexed):
 		if(not name_indexed):
@@ -253,15 +286,31 @@ class Fusion:
 			else:
 				return self.annotated_genes_right
 		else:
-			index = {}
-			for gene in self.get_annotated_genes_right(False):
-				gene_name = str(gene)
-				if(not index.has_key(gene_name)):
-					index[gene_name] = []
+			if(self.genes_right_index == None):
+				index = {}
+				
+				for gene in self.get_annotated_genes_right(False):
+					gene_name = str(gene)
+					if(not index.has_key(gene_name)):
+						index[gene_name] = []
+					
+					index[gene_name].append(gene)
 				
-				index[gene_name].append(gene)
+				self.genes_right_index = index
 			
-			return index
+			return self.genes_right_index
+	
+	def get_annotated_gene_names_left(self):
+		if(self.gene_names_left == None):
+			self.gene_names_left = frozenset([str(gene) for gene in self.get_annotated_genes_left2()])
+		
+		return self.gene_names_left
+	
+	def get_annotated_gene_names_right(self):
+		if(self.gene_names_right == None):
+			self.gene_names_right = frozenset([str(gene) for gene in self.get_annotated_genes_right2()])
+		
+		return self.gene_names_right
 	
 	def get_annotated_genes_left2(self):
 		if(not self.has_annotated_genes()):
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging
+
+import numpy
+
+from Fusion import Fusion
+from Fusion import cleanup_chr_name
+from Fusion import find_strand_type
+from Fusion import AD_DIRECTION_FORWARD
+from Fusion import AD_DIRECTION_REVERSE
+from Fusion import STRAND_FORWARD
+from Fusion import STRAND_REVERSE
+
+
+# Codes of the strands and acceptor-donor directions; -1 is unknown (None)
+STRAND_CODES = {STRAND_FORWARD:1, STRAND_REVERSE:0, None:-1}
+DIRECTION_CODES = {AD_DIRECTION_FORWARD:1, AD_DIRECTION_REVERSE:0, None:-1}
+
+STRAND_VALUES = {1:STRAND_FORWARD, 0:STRAND_REVERSE, -1:None}
+DIRECTION_VALUES = {1:AD_DIRECTION_FORWARD, 0:AD_DIRECTION_REVERSE, -1:None}
+
+INITIAL_CAPACITY = 1024
+
+
+class FusionColumns:
+	"""
+	Columnar storage of parsed breakpoints: NumPy arrays of chromosome
+	codes, positions, strands and acceptor-donor directions, and the
+	uids as one string buffer with offsets. A row costs about 30 bytes
+	plus its uid, instead of a Fusion object with its dicts and set.
+	The breakpoints are annotated from the columns (see
+	FusionDetectionExperiment.annotate_junctions()), such that only the
+	rows with genes on both junctions are materialized.
+	
+	The rows are normalized like Fusion.set() does: the breakpoints are
+	ordered and the direction is derived from the original order, so
+	get_fusion() makes the same Fusion object as the reader would have.
+	"""
+	logger = logging.getLogger("FuMa::FusionColumns")
+	
+	def __init__(self):
+		self.n = 0
+		
+		self.chromosomes = []
+		self.chromosome_codes = {}
+		
+		self.left_chr = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int32)
+		self.right_chr = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int32)
+		self.left_pos = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int64)
+		self.right_pos = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int64)
+		self.left_strand = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int8)
+		self.right_strand = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int8)
+		self.direction = numpy.zeros(INITIAL_CAPACITY,dtype=numpy.int8)
+		
+		self.uids = bytearray()
+		self.uid_offsets = numpy.zeros(INITIAL_CAPACITY + 1,dtype=numpy.int64)
+	
+	def __len__(self):
+		return self.n
+	
+	def get_chromosome_code(self,chromosome):
+		if(not self.chromosome_codes.has_key(chromosome)):
+			self.chromosome_codes[chromosome] = len(self.chromosomes)
+			self.chromosomes.append(chromosome)
+		
+		return self.chromosome_codes[chromosome]
+	
+	def grow(self):
+		capacity = 2 * len(self.left_pos)
+		
+		for column in ['left_chr','right_chr','left_pos','right_pos','left_strand','right_strand','direction']:
+			setattr(self,column,numpy.resize(getattr(self,column),capacity))
+		self.uid_offsets = numpy.resize(self.uid_offsets,capacity + 1)
+	
+	def append(self,left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,uid,auto_set_acceptor_donor_direction):
+		"""
+		Takes the same arguments as the Fusion constructor, except the
+		dataset name.
+		"""
+		left_chr = cleanup_chr_name(left_chr)
+		right_chr = cleanup_chr_name(right_chr)
+		
+		left_pos = int(str(left_pos).replace(",",""))
+		right_pos = int(str(right_pos).replace(",",""))
+		
+		left_strand = find_strand_type(left_strand)
+		right_strand = find_strand_type(right_strand)
+		
+		if (left_chr > right_chr) or ((left_chr == right_chr) and (left_pos > right_pos)):
+			direction = (AD_DIRECTION_REVERSE if auto_set_acceptor_donor_direction else None)
+			left_chr, right_chr = right_chr, left_chr
+			left_pos, right_pos = right_pos, left_pos
+			left_strand, right_strand = right_strand, left_strand
+		else:
+			direction = (AD_DIRECTION_FORWARD if auto_set_acceptor_donor_direction else None)
+		
+		if(self.n == len(self.left_pos)):
+			self.grow()
+		
+		i = self.n
+		self.left_chr[i] = self.get_chromosome_code(left_chr)
+		self.right_chr[i] = self.get_chromosome_code(right_chr)
+		self.left_pos[i] = left_pos
+		self.right_pos[i] = right_pos
+		self.left_strand[i] = STRAND_CODES[left_strand]
+		self.right_strand[i] = STRAND_CODES[right_strand]
+		self.direction[i] = DIRECTION_CODES[direction]
+		
+		self.uids += str(uid)
+		self.uid_offsets[i + 1] = len(self.uids)
+		
+		self.n += 1
+	
+	def append_fusion(self,fusion):
+		"""
+		Appends a Fusion object, of which the breakpoints are already
+		normalized, as row.
+		"""
+		if(self.n == len(self.left_pos)):
+			self.grow()
+		
+		i = self.n
+		self.left_chr[i] = self.get_chromosome_code(fusion.get_left_chromosome(False))
+		self.right_chr[i] = self.get_chromosome_code(fusion.get_right_chromosome(False))
+		self.left_pos[i] = fusion.get_left_break_position()
+		self.right_pos[i] = fusion.get_right_break_position()
+		self.left_strand[i] = STRAND_CODES[fusion.left_strand]
+		self.right_strand[i] = STRAND_CODES[fusion.right_strand]
+		self.direction[i] = DIRECTION_CODES[fusion.acceptor_donor_direction]
+		
+		self.uids += str(fusion.uid)
+		self.uid_offsets[i + 1] = len(self.uids)
+		
+		self.n += 1
+	
+	def get_arrays(self):
+		"""
+		Returns the rows as dict of NumPy arrays, e.g. to be saved with
+		numpy.savez(). set_arrays() restores them.
+		"""
+		arrays = {}
+		for column in ['left_chr','right_chr','left_pos','right_pos','left_strand','right_strand','direction']:
+			arrays[column] = getattr(self,column)[:self.n]
+		
+		arrays['chromosomes'] = numpy.array(self.chromosomes,dtype=str)
+		arrays['uids'] = numpy.frombuffer(bytes(self.uids),dtype=numpy.uint8)
+		arrays['uid_offsets'] = self.uid_offsets[:self.n + 1]
+		
+		return arrays
+	
+	def set_arrays(self,arrays):
+		self.n = len(arrays['left_pos'])
+		
+		self.chromosomes = [str(chromosome) for chromosome in arrays['chromosomes']]
+		self.chromosome_codes = dict([(self.chromosomes[i],i) for i in range(len(self.chromosomes))])
+		
+		for column in ['left_chr','right_chr','left_pos','right_pos','left_strand','right_strand','direction','uid_offsets']:
+			setattr(self,column,numpy.array(arrays[column]))
+		
+		self.uids = bytearray(arrays['uids'].tostring())
+	
+	def get_uid(self,i):
+		return str(self.uids[self.uid_offsets[i]:self.uid_offsets[i + 1]])
+	
+	def get_fusion(self,i,dataset_name):
+		"""
+		Materializes row i as Fusion object
+		"""
+		fusion = Fusion(self.chromosomes[self.left_chr[i]],self.chromosomes[self.right_chr[i]],int(self.left_pos[i]),int(self.right_pos[i]),STRAND_VALUES[int(self.left_strand[i])],STRAND_VALUES[int(self.right_strand[i])],dataset_name,self.get_uid(i),False)
+		fusion.acceptor_donor_direction = DIRECTION_VALUES[int(self.direction[i])]
+		
+		return fusion
+	
+	def get_rows(self,selection=None):
+		"""
+		Returns the row numbers of all rows, or of those in selection
+		(indices or a boolean mask). An invalid selection raises an
+		IndexError.
+		"""
+		if(selection is None):
+			return xrange(self.n)
+		else:
+			return numpy.arange(self.n)[selection].tolist()
+	
+	def get_fusions(self,dataset_name,selection=None):
+		"""
+		Materializes all rows, or only those in selection (indices or a
+		boolean mask), as Fusion objects.
+		"""
+		for i in self.get_rows(selection):
+			yield self.get_fusion(i,dataset_name)
+	
+	def get_breakpoints(self,side):
+		"""
+		Yields the left or right breakpoints per chromosome, as the
+		chromosome name, the row numbers and the positions.
+		"""
+		chromosome_codes = getattr(self,side+'_chr')[:self.n]
+		positions = getattr(self,side+'_pos')[:self.n]
+		
+		for code in numpy.unique(chromosome_codes):
+			rows = numpy.flatnonzero(chromosome_codes == code)
+			yield self.chromosomes[code], rows.tolist(), positions[rows].tolist()
+	
+	def nbytes(self):
+		return sum([getattr(self,column)[:self.n].nbytes for column in ['left_chr','right_chr','left_pos','right_pos','left_strand','right_strand','direction']]) + self.uid_offsets[:self.n + 1].nbytes + len(self.uids)
@@ -39,13 +39,51 @@ class FusionDetectionExperiment:
 		self.genes_spanning_left_junction = None
 		self.genes_spanning_right_junction = None
 		
+		# Breakpoints added with add_breakpoint() that are not materialized as Fusion objects yet
+		self.breakpoint_columns = None
+		
+		# Breakpoints without genes on both junctions are discarded when annotated from the columns; the fusions are those of gene_spanning_rows
+		self.n_non_gene_spanning = 0
+		self.gene_spanning_rows = None
+		
 		self.flush()
 	
 	def __del__(self):
-		for fusion in self:
+		for fusion in self.fusions:
 			fusion.prepare_deletion()
 	
+	def add_breakpoint(self,left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,uid,auto_set_acceptor_donor_direction):
+		"""
+		Alternative to add_fusion(Fusion(...)) for large inputs: the
+		breakpoint is stored in NumPy columns (see FusionColumns) and
+		only made into a Fusion object once the fusions are used.
+		"""
+		if(self.breakpoint_columns == None):
+			from FusionColumns import FusionColumns
+			self.breakpoint_columns = FusionColumns()
+		
+		self.breakpoint_columns.append(left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,uid,auto_set_acceptor_donor_direction)
+	
+	def materialize_fusions(self,selection=None):
+		"""
+		Turns the breakpoints stored by add_breakpoint() into Fusion
+		objects. With a selection (indices or boolean mask of the
+		breakpoints, in the order they were added) the others are
+		discarded.
+		"""
+		if(self.breakpoint_columns != None):
+			columns = self.breakpoint_columns
+			
+			# An invalid selection raises before the breakpoints are discarded
+			rows = columns.get_rows(selection)
+			self.breakpoint_columns = None
+			
+			for i in rows:
+				self.add_fusion(columns.get_fusion(i,self.name))
+	
 	def add_fusion(self,fusion):
+		self.materialize_fusions()
+		
 		# Add left location
 		left_chr = fusion.get_left_chromosome(False)
 		left_pos = fusion.get_left_break_position()
@@ -65,6 +103,10 @@ class FusionDetectionExperiment:
 		self.index[left_chr][right_chr].append(fusion)
 		################################################################
 		
+		# The position in self.fusions is the stable id of the fusion
+		self.fusions.append(fusion)
+		self.grouped_fusions = None
+		
 		self.n += 1
 	
 	def show_me(self):
@@ -81,28 +123,46 @@ class FusionDetectionExperiment:
 		return out
 	
 	def export_to_CG_Junctions_file(self,filename):
+		writer = self.write_CG_Junctions_file(filename)
+		writer.next()
+		
+		for fusion in self.__iter__():
+			if(fusion != False):# Duplicates are flagged as False
+				writer.send(fusion)
+		
+		writer.close()
+	
+	def write_CG_Junctions_file(self,filename):
+		"""
+		Generator that writes the fusions sent to it as Complete Genomics
+		junctions file, such that it can also be used while the fusions
+		are being read (see StreamingExperiment). The file is closed by
+		close().
+		"""
 		if(filename == "-"):
 			fh = sys.stdout
 		else:
 			fh = open(filename,"w")
 		
-		fh.write("#ASSEMBLY_ID	???\n")
-		fh.write("#SOFTWARE_VERSION	FuMa v"+fuma.__version__+"\n")
-		fh.write("#GENERATED_BY	FuMa\n")
-		fh.write("#GENERATED_AT	"+str(datetime.datetime.utcnow())+"\n")
-		fh.write("#FORMAT_VERSION	2\n")
-		fh.write("#GENOME_REFERENCE	???	build	??\n")
-		fh.write("#SAMPLE	???\n")
-		fh.write("#TYPE	JUNCTIONS\n")
-		fh.write("#DBSNP_BUILD	dbSNP	build	???\n")
-		fh.write("#GENE_ANNOTATIONS	???	build	???\n")
-		fh.write("\n")
-		fh.write(">Id	LeftChr	LeftPosition	LeftStrand	LeftLength	RightChr	RightPosition	RightStrand	RightLength	StrandConsistent	Interchromosomal	Distance	DiscordantMatePairAlignments	JunctionSequenceResolved	TransitionSequence	TransitionLength	LeftRepeatClassification	RightRepeatClassification	LeftGenes	RightGenes	XRef	DeletedTransposableElement	KnownUnderrepresentedRepeat	FrequencyInBaselineGenomeSet	AssembledSequence	EventId	Type	RelatedJunctions\n")
-		
-		fid = 1
-		
-		for fusion in self.__iter__():
-			if(fusion != False):# Duplicates are flagged as False
+		try:
+			fh.write("#ASSEMBLY_ID	???\n")
+			fh.write("#SOFTWARE_VERSION	FuMa v"+fuma.__version__+"\n")
+			fh.write("#GENERATED_BY	FuMa\n")
+			fh.write("#GENERATED_AT	"+str(datetime.datetime.utcnow())+"\n")
+			fh.write("#FORMAT_VERSION	2\n")
+			fh.write("#GENOME_REFERENCE	???	build	??\n")
+			fh.write("#SAMPLE	???\n")
+			fh.write("#TYPE	JUNCTIONS\n")
+			fh.write("#DBSNP_BUILD	dbSNP	build	???\n")
+			fh.write("#GENE_ANNOTATIONS	???	build	???\n")
+			fh.write("\n")
+			fh.write(">Id	LeftChr	LeftPosition	LeftStrand	LeftLength	RightChr	RightPosition	RightStrand	RightLength	StrandConsistent	Interchromosomal	Distance	DiscordantMatePairAlignments	JunctionSequenceResolved	TransitionSequence	TransitionLength	LeftRepeatClassification	RightRepeatClassification	LeftGenes	RightGenes	XRef	DeletedTransposableElement	KnownUnderrepresentedRepeat	FrequencyInBaselineGenomeSet	AssembledSequence	EventId	Type	RelatedJunctions\n")
+			
+			fid = 1
+			
+			while True:
+				fusion = (yield)
+				
 				fh.write(str(fid)+"	")
 				
 				fh.write(fusion.get_left_chromosome()+"	")
@@ -153,9 +213,9 @@ class FusionDetectionExperiment:
 				fh.write("			1.0		"+str(fid)+"	complex	"+str(fusion.locations)+"\n")
 				
 				fid += 1
-		
-		if(filename != "-"):
-			fh.close()
+		finally:
+			if(filename != "-"):
+				fh.close()
 	
 	def export_to_list(self,fh,order,blacklist,args):
 		"""
@@ -223,46 +283,106 @@ class FusionDetectionExperiment:
 				fh.write("\n")
 	
 	def annotate_genes(self,gene_annotation):
-		self.annotate_genes_left(gene_annotation)
-		self.annotate_genes_right(gene_annotation)
+		self.annotate_junctions(gene_annotation,not self.genes_spanning_left_junction,not self.genes_spanning_right_junction)
 	
 	def annotate_genes_left(self,gene_annotation):
-		if(not self.genes_spanning_left_junction):
-			self.logger.debug("Annotating genes on the left junction: "+self.name+" - "+gene_annotation.name)
-			
-			for fusion in self.__iter__():
-				if(fusion.annotated_genes_left == None):				# if object is not set, make it an empty list
-					fusion.annotated_genes_left = []
-				
-				for gene in gene_annotation.get_annotations(fusion.get_left_chromosome(),fusion.get_left_break_position()):
-					fusion.annotated_genes_left.append(gene)
-			
-			self.genes_spanning_left_junction = [gene_annotation]
+		self.annotate_junctions(gene_annotation,not self.genes_spanning_left_junction,False)
 	
 	def annotate_genes_right(self,gene_annotation):
-		if(not self.genes_spanning_right_junction):
-			self.logger.debug("Annotating genes on the right junction: "+self.name+" - "+gene_annotation.name)
+		self.annotate_junctions(gene_annotation,False,not self.genes_spanning_right_junction)
+	
+	def annotate_junctions(self,gene_annotation,left,right):
+		"""
+		Annotates the left and/or right junctions of all fusion genes
+		at once, using GeneAnnotation.get_annotations_bulk().
+		"""
+		if(left and right and self.breakpoint_columns != None and len(self.fusions) == 0):
+			self.annotate_breakpoint_columns(gene_annotation)
+		elif(left or right):
+			self.materialize_fusions()
+			
+			if(left):
+				self.logger.debug("Annotating genes on the left junction: "+self.name+" - "+gene_annotation.name)
+			if(right):
+				self.logger.debug("Annotating genes on the right junction: "+self.name+" - "+gene_annotation.name)
 			
-			for fusion in self:
-				if(fusion.annotated_genes_right == None):				# if object is not set, make it an empty list
-					fusion.annotated_genes_right = []
+			started = datetime.datetime.now()
+			
+			fusions = list(self.__iter__())
+			breakpoints = []
+			
+			if(left):
+				breakpoints += [(fusion.get_left_chromosome(),fusion.get_left_break_position()) for fusion in fusions]
+			if(right):
+				breakpoints += [(fusion.get_right_chromosome(),fusion.get_right_break_position()) for fusion in fusions]
+			
+			annotations = gene_annotation.get_annotations_bulk(breakpoints)
+			
+			if(left):
+				for i in range(len(fusions)):
+					fusions[i].annotate_genes_left(fusions[i].get_annotated_genes_left(False)[:] + annotations[i])		# if object is not set, make it an empty list
 				
-				for gene in gene_annotation.get_annotations(fusion.get_right_chromosome(),fusion.get_right_break_position()):
-					fusion.annotated_genes_right.append(gene)
+				self.genes_spanning_left_junction = [gene_annotation]
+				annotations = annotations[len(fusions):]
 			
-			self.genes_spanning_right_junction = [gene_annotation]
+			if(right):
+				for i in range(len(fusions)):
+					fusions[i].annotate_genes_right(fusions[i].get_annotated_genes_right(False)[:] + annotations[i])
+				
+				self.genes_spanning_right_junction = [gene_annotation]
+			
+			elapsed = (datetime.datetime.now() - started).total_seconds()
+			self.logger.debug("Annotated "+str(len(breakpoints))+" breakpoints of "+self.name+" in "+("%.2f" % elapsed)+"s ("+("%.0f" % (len(breakpoints) / max(elapsed,0.000001)))+" breakpoints/s)")
+	
+	def annotate_breakpoint_columns(self,gene_annotation):
+		"""
+		Annotates both junctions of the breakpoints stored by
+		add_breakpoint(), per chromosome, straight from the columns.
+		Breakpoints without genes on both junctions would be removed by
+		remove_duplicates(), so only the others are materialized as
+		Fusion objects.
+		"""
+		self.logger.debug("Annotating genes on the breakpoints: "+self.name+" - "+gene_annotation.name)
+		
+		started = datetime.datetime.now()
+		
+		columns = self.breakpoint_columns
+		genes = {'left':{}, 'right':{}}
+		
+		for side in ['left','right']:
+			for chromosome, rows, positions in columns.get_breakpoints(side):
+				annotations = gene_annotation.get_annotations_bulk([(chromosome,position) for position in positions])
+				
+				for i in range(len(rows)):
+					# Right genes are only kept for rows with left genes
+					if(annotations[i] and (side == 'left' or genes['left'].has_key(rows[i]))):
+						genes[side][rows[i]] = annotations[i]
+		
+		selection = sorted(genes['right'].keys())
+		
+		self.n_non_gene_spanning = len(columns) - len(selection)
+		self.gene_spanning_rows = selection
+		self.materialize_fusions(selection)
+		
+		for i in range(len(selection)):
+			self.fusions[i].annotate_genes_left(genes['left'][selection[i]])
+			self.fusions[i].annotate_genes_right(genes['right'][selection[i]])
+		
+		self.genes_spanning_left_junction = [gene_annotation]
+		self.genes_spanning_right_junction = [gene_annotation]
+		
+		elapsed = (datetime.datetime.now() - started).total_seconds()
+		self.logger.debug("Annotated "+str(2 * len(columns))+" breakpoints of "+self.name+" in "+("%.2f" % elapsed)+"s ("+("%.0f" % (2 * len(columns) / max(elapsed,0.000001)))+" breakpoints/s); "+str(len(selection))+" have genes on both junctions")
 	
 	def __iter__(self):
 		""" Return all fusions (non-indexed but sorted on chr,chr) as iterator
 		"""
-		for chromosome_left in self.index.items():
-			for chromosome_right in chromosome_left[1].items():
-				for fusion in chromosome_right[1]:
-					yield fusion
+		for fusion in self.get_grouped_fusions():
+			yield fusion
 	
 	def __getitem__(self,i):
 		"""
-		This allows to acces fusions by their id.
+		This allows to acces fusions by their position in the iterator.
 		For:
 		fusions = FusionDetectionExperiment
 		
@@ -270,14 +390,58 @@ class FusionDetectionExperiment:
 		
 		fusion_4th = fusions[3]# Use 0 based counting
 		"""
-		j = 0
-		for fusion in self:
-			if(i == j):
-				return fusion
-			else:
-				j += 1
+		grouped_fusions = self.get_grouped_fusions()
+		
+		if(i >= 0 and i < len(grouped_fusions)):
+			return grouped_fusions[i]
+		else:
+			return None
+	
+	def get_fusion(self,fusion_id):
+		"""
+		Returns the fusion by its stable id: the number of fusions that
+		were added before it. Unlike the position in the iterator, it
+		does not change when fusions of other chromosomes are added.
+		"""
+		self.materialize_fusions()
+		
+		return self.fusions[fusion_id]
+	
+	def get_grouped_fusions(self):
+		"""
+		The fusions in the order of the chromosome index, as flat list,
+		with the slice of each chromosome pair in self.grouped_slices.
+		It is built once after fusions have been added.
+		"""
+		self.materialize_fusions()
+		
+		if(self.grouped_fusions == None):
+			grouped_fusions = []
+			grouped_slices = {}
+			
+			for chromosome_left in self.index.items():
+				for chromosome_right in chromosome_left[1].items():
+					start = len(grouped_fusions)
+					grouped_fusions += chromosome_right[1]
+					grouped_slices[(chromosome_left[0],chromosome_right[0])] = (start,len(grouped_fusions))
+			
+			self.grouped_fusions = grouped_fusions
+			self.grouped_slices = grouped_slices
 		
-		return None
+		return self.grouped_fusions
+	
+	def get_chromosome_pair(self,left_chr,right_chr):
+		"""
+		Returns the fusions between two chromosomes, as slice of the
+		grouped fusions.
+		"""
+		self.get_grouped_fusions()
+		
+		if(self.grouped_slices.has_key((left_chr,right_chr))):
+			start, stop = self.grouped_slices[(left_chr,right_chr)]
+			return self.grouped_fusions[start:stop]
+		else:
+			return []
 	
 	def remove_duplicates(self,args):
 		"""
@@ -287,71 +451,22 @@ class FusionDetectionExperiment:
 		if(not self.genes_spanning_left_junction or not self.genes_spanning_right_junction):
 			raise Exception("Gene annotations on dataset '"+self.name+"' were not found")
 		else:
-			old_count = len(self)
+			old_count = len(self) + self.n_non_gene_spanning
 			if(self.name.find("vs.") == -1):
 				self.logger.info("Duplication removal: "+self.name+" ("+str(old_count)+" fusions)")
 		
-		unique_fusions = []
+		self.materialize_fusions()
 		
-		if(args.matching_method in ["overlap","subset","egm"]):
-			from CompareFusionsBySpanningGenes import CompareFusionsBySpanningGenes
-			overlap = CompareFusionsBySpanningGenes(False,False,args)
-		else:
-			raise Exception("Unknown overlap method for removing duplicates: '"+args.matching_method+"' for dataset "+self.name)
-		
-		stats_duplicates = 0
-		stats_non_gene_spanning = 0
+		stats_non_gene_spanning = self.n_non_gene_spanning
 		
 		fusions_to_add = []
 		
 		for chromosome_left in self.index.items():
 			for chromosome_right in chromosome_left[1].items():
+				unique_block, non_gene_spanning = self.remove_duplicates_block(chromosome_right[1],args)
 				
-				all_fusions = chromosome_right[1]
-				n = len(all_fusions)
-				
-				queue = range(n)
-				while(len(queue) > 0):
-					duplicates = []
-					for i in queue:
-						fusion_1 = all_fusions[i]
-						if(fusion_1):
-							is_duplicate = False
-							if(len(fusion_1.get_annotated_genes_left(False)) == 0 or len(fusion_1.get_annotated_genes_right(False)) == 0):
-								stats_non_gene_spanning += 1
-								all_fusions[i] = False
-							else:
-								for j in range(i+1,n):
-									fusion_2 = all_fusions[j]
-									if(fusion_2):
-										match = overlap.match_fusions(fusion_1,fusion_2,False)
-										
-										if(match):
-											merged_matches = fusion_1.matches | fusion_2.matches
-											
-											fusion_1.matches = merged_matches
-											fusion_1.acceptor_donor_direction = match.acceptor_donor_direction
-											fusion_1.left_strand = match.left_strand
-											fusion_1.right_strand = match.right_strand
-											fusion_1.annotated_genes_left  = match.annotated_genes_left
-											fusion_1.annotated_genes_right  = match.annotated_genes_right
-											
-											all_fusions[i] = fusion_1
-											all_fusions[j] = False
-											is_duplicate = True
-											
-											match.prepare_deletion()
-											del(match)
-								
-								if(is_duplicate):
-									duplicates.append(i)
-								else:
-									unique_fusions.append(fusion_1)
-					queue = duplicates
-				
-				for fusion in all_fusions:
-					if(fusion):
-						fusions_to_add.append(fusion)
+				stats_non_gene_spanning += non_gene_spanning
+				fusions_to_add += unique_block
 		
 		self.flush()
 		for fusion in fusions_to_add:
@@ -364,8 +479,170 @@ class FusionDetectionExperiment:
 		
 		return len(self)
 	
+	def remove_duplicates_block(self,fusions,args):
+		"""
+		Removes the duplicates of the fusions of one chromosome pair, as
+		remove_duplicates() does for all of them, without logging.
+		
+		Returns the remaining fusions and the number of fusions without
+		genes on both junctions.
+		"""
+		if(args.matching_method in ["overlap","subset","egm"]):
+			from CompareFusionsBySpanningGenes import CompareFusionsBySpanningGenes
+			overlap = CompareFusionsBySpanningGenes(False,False,args)
+		else:
+			raise Exception("Unknown overlap method for removing duplicates: '"+args.matching_method+"' for dataset "+self.name)
+		
+		all_fusions = self.merge_exact_duplicates(fusions,args)
+		
+		if(args.matching_method == 'egm' and self.has_strands_and_directions(all_fusions,args)):
+			return self.remove_duplicates_egm(all_fusions,args)
+		
+		stats_non_gene_spanning = 0
+		
+		n = len(all_fusions)
+		
+		queue = range(n)
+		while(len(queue) > 0):
+			duplicates = []
+			for i in queue:
+				fusion_1 = all_fusions[i]
+				if(fusion_1):
+					is_duplicate = False
+					if(len(fusion_1.get_annotated_genes_left(False)) == 0 or len(fusion_1.get_annotated_genes_right(False)) == 0):
+						stats_non_gene_spanning += 1
+						all_fusions[i] = False
+					else:
+						for j in range(i+1,n):
+							fusion_2 = all_fusions[j]
+							if(fusion_2):
+								match = overlap.match_fusions(fusion_1,fusion_2,False)
+								
+								if(match):
+									merged_matches = fusion_1.matches | fusion_2.matches
+									
+									fusion_1.matches = merged_matches
+									fusion_1.acceptor_donor_direction = match.acceptor_donor_direction
+									fusion_1.left_strand = match.left_strand
+									fusion_1.right_strand = match.right_strand
+									fusion_1.annotate_genes_left(match.annotated_genes_left)
+									fusion_1.annotate_genes_right(match.annotated_genes_right)
+									
+									all_fusions[i] = fusion_1
+									all_fusions[j] = False
+									is_duplicate = True
+									
+									match.prepare_deletion()
+									del(match)
+						
+						if(is_duplicate):
+							duplicates.append(i)
+			queue = duplicates
+		
+		return [fusion for fusion in all_fusions if fusion], stats_non_gene_spanning
+	
+	def get_exact_duplicate_key(self,fusion):
+		return (fusion.get_left_break_position(), fusion.get_right_break_position(), fusion.left_strand, fusion.right_strand, fusion.acceptor_donor_direction, fusion.get_annotated_gene_names_left(), fusion.get_annotated_gene_names_right())
+	
+	def has_strands_and_directions(self,fusions,args):
+		"""
+		Whether the strands and/or directions required by the matching
+		are known. If not, the fusions have to be compared pairwise to
+		raise the corresponding error.
+		"""
+		for fusion in fusions:
+			if(args.strand_specific_matching and (fusion.left_strand == None or fusion.right_strand == None)):
+				return False
+			if(args.acceptor_donor_order_specific_matching and fusion.acceptor_donor_direction == None):
+				return False
+		
+		return True
+	
+	def merge_duplicate(self,fusion_1,fusion_2):
+		"""
+		Merges fusion_2 into fusion_1, as remove_duplicates() does with
+		the match of two fusions that have the same gene names.
+		"""
+		fusion_1.matches = fusion_1.matches | fusion_2.matches
+		
+		if(fusion_1.acceptor_donor_direction != fusion_2.acceptor_donor_direction):
+			fusion_1.acceptor_donor_direction = None
+		if(fusion_1.left_strand != fusion_2.left_strand):
+			fusion_1.left_strand = None
+		if(fusion_1.right_strand != fusion_2.right_strand):
+			fusion_1.right_strand = None
+		
+		genes_left = set(fusion_1.get_annotated_genes_left(False))
+		if(not genes_left.issuperset(fusion_2.get_annotated_genes_left(False))):
+			fusion_1.annotate_genes_left(list(genes_left.union(fusion_2.get_annotated_genes_left(False))))
+		
+		genes_right = set(fusion_1.get_annotated_genes_right(False))
+		if(not genes_right.issuperset(fusion_2.get_annotated_genes_right(False))):
+			fusion_1.annotate_genes_right(list(genes_right.union(fusion_2.get_annotated_genes_right(False))))
+	
+	def merge_exact_duplicates(self,fusions,args):
+		"""
+		Fusions with identical breakpoints, strands, direction and gene
+		names always match each other, and every (merged) fusion that
+		matches one of them also matches the others. They are therefore
+		merged into their first occurrence before the pairwise
+		comparison. Fusions of which the strands or direction required
+		by the matching are unknown are left to the pairwise comparison.
+		"""
+		unique_fusions = []
+		first_fusions = {}
+		
+		for fusion in fusions:
+			if(fusion.has_annotated_genes() and self.has_strands_and_directions([fusion],args)):
+				key = self.get_exact_duplicate_key(fusion)
+				
+				if(first_fusions.has_key(key)):
+					self.merge_duplicate(first_fusions[key],fusion)
+					continue
+				else:
+					first_fusions[key] = fusion
+			
+			unique_fusions.append(fusion)
+		
+		return unique_fusions
+	
+	def remove_duplicates_egm(self,fusions,args):
+		"""
+		With egm, two fusions match if and only if their gene names,
+		and if required their strands and direction, are identical. The
+		duplicates are merged into their first occurrence using the
+		gene names as key, instead of by comparing all pairs.
+		
+		Returns the remaining fusions and the number of fusions without
+		genes on both junctions.
+		"""
+		unique_fusions = []
+		first_fusions = {}
+		non_gene_spanning = 0
+		
+		for fusion in fusions:
+			if(len(fusion.get_annotated_genes_left(False)) == 0 or len(fusion.get_annotated_genes_right(False)) == 0):
+				non_gene_spanning += 1
+			else:
+				key = (fusion.get_annotated_gene_names_left(), fusion.get_annotated_gene_names_right())
+				if(args.strand_specific_matching):
+					key += (fusion.left_strand, fusion.right_strand)
+				if(args.acceptor_donor_order_specific_matching):
+					key += (fusion.acceptor_donor_direction,)
+				
+				if(first_fusions.has_key(key)):
+					self.merge_duplicate(first_fusions[key],fusion)
+				else:
+					first_fusions[key] = fusion
+					unique_fusions.append(fusion)
+		
+		return unique_fusions, non_gene_spanning
+	
 	def __len__(self):
-		return self.n
+		if(self.breakpoint_columns != None):
+			return self.n + len(self.breakpoint_columns)
+		else:
+			return self.n
 	
 	def flush(self):
 		self.n = 0
@@ -374,3 +651,7 @@ class FusionDetectionExperiment:
 		self.n_matches_exp_2 = None
 		
 		self.index = {}
+		
+		self.fusions = []
+		self.grouped_fusions = None
+		self.grouped_slices = {}
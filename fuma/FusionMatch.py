@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+from Fusion import Fusion
+
+
+class FusionMatch(Fusion):
+	"""
+	The result of CompareFusionsBySpanningGenes.match_fusions(): the
+	fusion gene shared by fusion_1 and fusion_2, with the matched gene
+	names of both junctions.
+	
+	The positions are those of fusion_1, which are already cleaned up
+	and sorted, so the Fusion constructor is not needed. The dataset
+	name, the dataset dictionaries, the original matches and the Gene
+	objects of the matched gene names are only made when they are read
+	(see __getattr__()). Until then the match refers to the dataset
+	names and name-indexed genes of its parents, not to the parents
+	themselves.
+	"""
+	
+	def __init__(self,fusion_1,fusion_2,gene_names_left,gene_names_right):
+		self.left_chr_str = fusion_1.left_chr_str
+		self.right_chr_str = fusion_1.right_chr_str
+		
+		self.left_break_position = fusion_1.left_break_position
+		self.right_break_position = fusion_1.right_break_position
+		
+		self.uid = ""
+		self.dataset_mask = 0
+		
+		# If one fusion is (A,B) and the other (B,A), or the strands differ, they are unknown
+		self.acceptor_donor_direction = (fusion_1.acceptor_donor_direction if fusion_1.acceptor_donor_direction == fusion_2.acceptor_donor_direction else None)
+		self.left_strand = (fusion_1.left_strand if fusion_1.left_strand == fusion_2.left_strand else None)
+		self.right_strand = (fusion_1.right_strand if fusion_1.right_strand == fusion_2.right_strand else None)
+		
+		self.gene_names_left = frozenset(gene_names_left)
+		self.gene_names_right = frozenset(gene_names_right)
+		self.genes_left_index = None
+		self.genes_right_index = None
+		
+		self.parent_dataset_names = (fusion_1.dataset_name, fusion_2.dataset_name)
+		self.parent_genes_left = (fusion_1.get_annotated_genes_left(True), fusion_2.get_annotated_genes_left(True))
+		self.parent_genes_right = (fusion_1.get_annotated_genes_right(True), fusion_2.get_annotated_genes_right(True))
+	
+	def __getattr__(self,name):
+		"""
+		Only called for attributes that have not been set (yet).
+		"""
+		if name == 'dataset_name':
+			value = self.parent_dataset_names[0]+"_vs._"+self.parent_dataset_names[1]
+		elif name in ['tested_datasets','matched_datasets']:
+			value = {self.dataset_name:True}
+		elif name == 'matches':
+			value = set([self])
+		elif name == 'annotated_genes_left':
+			value = self.find_genes(self.parent_genes_left,self.gene_names_left)
+			del(self.parent_genes_left)
+		elif name == 'annotated_genes_right':
+			value = self.find_genes(self.parent_genes_right,self.gene_names_right)
+			del(self.parent_genes_right)
+		else:
+			raise AttributeError(name)
+		
+		self.__dict__[name] = value
+		
+		return value
+	
+	def find_genes(self,parent_genes,gene_names):
+		"""
+		All Gene objects of both parents that have a matched name
+		"""
+		genes = set()
+		
+		for gene_name in gene_names:
+			for genes_index in parent_genes:
+				if genes_index.has_key(gene_name):
+					genes.update(genes_index[gene_name])
+		
+		return list(genes)
+	
+	def has_annotated_genes(self):
+		"""
+		A match has at least one matched gene name on both junctions
+		"""
+		return True
+	
+	def prepare_deletion(self):
+		self.__dict__.pop('matches',None)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging
+
+
+class FusionMatcher:
+	"""
+	Bundles the strand check, the acceptor-donor direction check and
+	the gene-set predicate of the selected matching method. They are
+	selected once, from args, instead of for every pair of fusion
+	genes that is compared.
+	"""
+	logger = logging.getLogger("FuMa::FusionMatcher")
+	
+	def __init__(self,args):
+		self.args = args
+		
+		if(args.matching_method == 'overlap'):
+			self.match_gene_names = self.match_overlap
+			self.get_matched_genes = self.get_genes_overlap
+		elif(args.matching_method == 'egm'):
+			self.match_gene_names = self.match_egm
+			self.get_matched_genes = self.get_genes_egm
+		else:
+			self.match_gene_names = self.match_sets
+			self.get_matched_genes = self.get_genes_sets
+		
+		if(args.strand_specific_matching and args.acceptor_donor_order_specific_matching):
+			self.match_fusion_genes = self.match_strands_and_direction
+		elif(args.strand_specific_matching):
+			self.match_fusion_genes = self.match_strands
+		elif(args.acceptor_donor_order_specific_matching):
+			self.match_fusion_genes = self.match_direction
+		else:
+			self.match_fusion_genes = None
+		
+		# The fast paths do not have to call a separate check per pair
+		if(self.match_fusion_genes == self.match_strands):
+			self.match = self.match_strands_gene_names_of
+		elif(self.match_fusion_genes != None):
+			self.match = self.match_checked
+		elif(args.matching_method == 'egm'):
+			self.match = self.match_egm_gene_names_of
+		else:
+			self.match = self.match_gene_names_of
+	
+	def match_checked(self,fusion_1,fusion_2):
+		"""
+		Returns the matched gene names of the left and the right
+		junction, or None if the fusion genes do not match.
+		"""
+		if(self.match_fusion_genes(fusion_1,fusion_2)):
+			return self.match_gene_names_of(fusion_1,fusion_2)
+		else:
+			return None
+	
+	def match_strands_gene_names_of(self,fusion_1,fusion_2):
+		left_strand_1 = fusion_1.get_left_strand()
+		right_strand_1 = fusion_1.get_right_strand()
+		left_strand_2 = fusion_2.get_left_strand()
+		right_strand_2 = fusion_2.get_right_strand()
+		
+		if left_strand_1 == None or right_strand_1 == None or left_strand_2 == None or right_strand_2 == None:
+			raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
+		elif left_strand_1 == left_strand_2 and right_strand_1 == right_strand_2:
+			return self.match_gene_names_of(fusion_1,fusion_2)
+		else:
+			return None
+	
+	def match_gene_names_of(self,fusion_1,fusion_2):
+		if(fusion_1.has_annotated_genes() and fusion_2.has_annotated_genes()):
+			matches_left = self.match_gene_names(fusion_1.get_annotated_gene_names_left(), fusion_2.get_annotated_gene_names_left())
+			if(matches_left):
+				matches_right = self.match_gene_names(fusion_1.get_annotated_gene_names_right(), fusion_2.get_annotated_gene_names_right())
+				if(matches_right):
+					return (matches_left,matches_right)
+		return None
+	
+	def match_egm_gene_names_of(self,fusion_1,fusion_2):
+		if(fusion_1.has_annotated_genes() and fusion_2.has_annotated_genes()):
+			gene_names_left = fusion_1.get_annotated_gene_names_left()
+			gene_names_right = fusion_1.get_annotated_gene_names_right()
+			
+			if(gene_names_left == fusion_2.get_annotated_gene_names_left() and gene_names_right == fusion_2.get_annotated_gene_names_right()):
+				return (gene_names_left,gene_names_right)
+		return None
+	
+	def match_strands(self,fusion_1,fusion_2):
+		left_strand_1 = fusion_1.get_left_strand()
+		right_strand_1 = fusion_1.get_right_strand()
+		left_strand_2 = fusion_2.get_left_strand()
+		right_strand_2 = fusion_2.get_right_strand()
+		
+		if left_strand_1 == None or right_strand_1 == None or left_strand_2 == None or right_strand_2 == None:
+			raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
+		else:
+			return left_strand_1 == left_strand_2 and right_strand_1 == right_strand_2
+	
+	def match_direction(self,fusion_1,fusion_2):
+		if(fusion_1.acceptor_donor_direction == None or fusion_2.acceptor_donor_direction == None):
+			raise Exception("A fusion gene without an annotated acceptor-donor direction was used for acceptor-donor-order-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
+		else:
+			return (fusion_1.acceptor_donor_direction == fusion_2.acceptor_donor_direction)
+	
+	def match_strands_and_direction(self,fusion_1,fusion_2):
+		return self.match_strands(fusion_1,fusion_2) and self.match_direction(fusion_1,fusion_2)
+	
+	def match_sets(self,superset,subset):								#https://docs.python.org/2/library/sets.html
+		if(len(subset) > len(superset)):
+			return self.match_sets(subset,superset)						# Gene names have to be provided as sets
+		elif(subset.issubset(superset)):
+			return subset
+		else:
+			return None
+	
+	def match_egm(self,set1,set2):
+		if set1 == set2:
+			return set1
+		else:
+			return None
+	
+	def match_overlap(self,set1,set2):									#https://docs.python.org/2/library/sets.html
+		overlap = set1.intersection(set2)
+		if(not overlap):
+			return None
+		else:
+			return overlap
+	
+	def get_genes_sets(self,genes_1,genes_2,gene_names_1,gene_names_2,matches):
+		"""
+		The Gene objects of the fusion gene that provided the matched
+		gene names: the smallest set, or the second if they are equal.
+		"""
+		if(len(gene_names_2) > len(gene_names_1)):
+			return genes_1
+		else:
+			return genes_2
+	
+	def get_genes_egm(self,genes_1,genes_2,gene_names_1,gene_names_2,matches):
+		return genes_1
+	
+	def get_genes_overlap(self,genes_1,genes_2,gene_names_1,gene_names_2,matches):
+		return [gene for gene in genes_1 if str(gene) in matches]
@@ -23,7 +23,7 @@
 
 #import gffutils
 import HTSeq
-import logging
+import logging,heapq
 
 class GeneAnnotation:
 	"""Gene annotation is a virtual reference genome. It's only being
@@ -38,17 +38,82 @@ class GeneAnnotation:
 		# list(db.region(region=('2L', 9277, 10000), completely_within=True))
 		#self.gas2 = gffutils.create_db(gtf, dbfn=db_file)
 		self.gas = HTSeq.GenomicArrayOfSets("auto", stranded=False)
+		
+		# The same intervals per chromosome, sorted on their start when needed by get_annotations_bulk()
+		self.intervals = {}
+		self.intervals_sorted = True
 	
 	def add_annotation(self,gene,chromosome,start,stop):
 		#self.logger.debug("Adding annotation "+str(self.n)+": "+chromosome+":"+str(start)+"-"+str(stop)+" = "+str(gene))
 		self.gas[HTSeq.GenomicInterval(chromosome,start,stop)] += gene
 		self.n += 1
+		
+		if(not self.intervals.has_key(chromosome)):
+			self.intervals[chromosome] = []
+		self.intervals[chromosome].append((start,stop,gene))
+		self.intervals_sorted = False
 	
 	def get_annotations(self,chromosome,position):
 		#unique_genes = list(reduce(lambda s1, s2: s1 | s2, [x[1] for x in r])) << weird list construction - only neccesairy using the steps() function
 		for annotation in self.gas[HTSeq.GenomicPosition(chromosome,position)]:
 			yield annotation
 	
+	def get_annotations_bulk(self,breakpoints):
+		"""
+		Returns the genes of many breakpoints, given as (chromosome,
+		position) tuples, as a list of gene lists in the same order.
+		
+		Instead of a lookup per breakpoint, the breakpoints of each
+		chromosome are sorted and swept along the intervals sorted on
+		their start. The intervals spanning the current position are
+		kept in a heap on their end, like the half-open intervals of
+		get_annotations(). A chromosome with few breakpoints compared to
+		its number of intervals is looked up per breakpoint instead,
+		e.g. when a StreamingExperiment annotates small blocks.
+		"""
+		if(not self.intervals_sorted):
+			for intervals in self.intervals.values():
+				intervals.sort(key=lambda interval: interval[0])
+			self.intervals_sorted = True
+		
+		annotations = [None] * len(breakpoints)
+		
+		per_chromosome = {}
+		for i in range(len(breakpoints)):
+			chromosome, position = breakpoints[i]
+			if(not per_chromosome.has_key(chromosome)):
+				per_chromosome[chromosome] = []
+			per_chromosome[chromosome].append((position,i))
+		
+		for chromosome, positions in per_chromosome.items():
+			intervals = self.intervals.get(chromosome,[])
+			
+			if(len(positions) * 2 < len(intervals)):
+				for position, i in positions:
+					annotations[i] = list(self.get_annotations(chromosome,position))
+				continue
+			
+			positions.sort()
+			spanning = []
+			j = 0
+			previous_position = None
+			
+			for position, i in positions:
+				if(position != previous_position):
+					while(j < len(intervals) and intervals[j][0] <= position):
+						heapq.heappush(spanning,(intervals[j][1],j))
+						j += 1
+					
+					while(spanning and spanning[0][0] <= position):
+						heapq.heappop(spanning)
+					
+					genes = list(set([intervals[k][2] for stop, k in spanning]))
+					previous_position = position
+				
+				annotations[i] = genes[:]
+		
+		return annotations
+	
 	def __str__(self):
 		out = "[ Gene annotation: "+str(self.name)+" (genes: "+str(len(self))+")]"
 		for chromosome_name,chromosome_obj in self.gas.chrom_vectors.items():
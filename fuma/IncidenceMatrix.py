@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging
+
+import numpy
+
+
+class IncidenceMatrix:
+	"""
+	Boolean (fusion gene x dataset) matrix of the rows of the list
+	output, built from the dataset_mask of the exported (merged)
+	fusions, such that it does not have to be re-parsed from the list
+	file (as bin/fuma-list-to-boolean-list does).
+	"""
+	
+	logger = logging.getLogger("FuMa::IncidenceMatrix")
+	
+	def __init__(self):
+		self.genes_left = []
+		self.genes_right = []
+		self.dataset_masks = []
+	
+	def add(self,genes_left,genes_right,dataset_mask):
+		self.genes_left.append(genes_left)
+		self.genes_right.append(genes_right)
+		self.dataset_masks.append(dataset_mask)
+	
+	def extend(self,incidence_matrix):
+		self.genes_left += incidence_matrix.genes_left
+		self.genes_right += incidence_matrix.genes_right
+		self.dataset_masks += incidence_matrix.dataset_masks
+	
+	def __len__(self):
+		return len(self.dataset_masks)
+	
+	def get_matrix(self,n_datasets):
+		"""
+		Masks of more than 62 datasets do not fit in an int64 and are
+		shifted as Python integers.
+		"""
+		if n_datasets <= 62:
+			dataset_masks = numpy.array(self.dataset_masks,dtype=numpy.int64)
+		else:
+			dataset_masks = numpy.array(self.dataset_masks,dtype=object)
+		
+		matrix = numpy.zeros((len(self),n_datasets),dtype=bool)
+		for j in range(n_datasets):
+			matrix[:,j] = ((dataset_masks >> j) & 1).astype(bool)
+		
+		return matrix
+	
+	def get_similarities(self,matrix):
+		"""
+		Returns the pairwise (dataset x dataset) Jaccard indices,
+		|A & B| / |A | B|, and overlap coefficients,
+		|A & B| / min(|A|,|B|). Empty datasets have a similarity of 0.
+		"""
+		counts = matrix.astype(numpy.int64)
+		
+		intersections = counts.T.dot(counts)
+		sizes = numpy.diag(intersections)
+		
+		unions = sizes[:,numpy.newaxis] + sizes[numpy.newaxis,:] - intersections
+		smallest = numpy.minimum(sizes[:,numpy.newaxis],sizes[numpy.newaxis,:])
+		
+		jaccard = numpy.zeros(intersections.shape)
+		numpy.true_divide(intersections,unions,out=jaccard,where=(unions > 0))
+		
+		overlap = numpy.zeros(intersections.shape)
+		numpy.true_divide(intersections,smallest,out=overlap,where=(smallest > 0))
+		
+		return jaccard, overlap
+	
+	def export(self,filename,dataset_names):
+		"""
+		Saves a compressed .npz archive (numpy.load) with the arrays:
+		
+		- matrix: bool, fusion genes x datasets
+		- genes_left, genes_right: row labels as in the list output
+		- datasets: column labels
+		- jaccard, overlap_coefficient: datasets x datasets
+		"""
+		matrix = self.get_matrix(len(dataset_names))
+		jaccard, overlap = self.get_similarities(matrix)
+		
+		self.logger.info("Saving incidence matrix of "+str(matrix.shape[0])+" fusion genes x "+str(matrix.shape[1])+" datasets to: "+filename)
+		
+		with open(filename,"wb") as fh:
+			numpy.savez_compressed(fh, \
+				matrix=matrix, \
+				genes_left=numpy.array(self.genes_left,dtype=str), \
+				genes_right=numpy.array(self.genes_right,dtype=str), \
+				datasets=numpy.array(dataset_names,dtype=str), \
+				jaccard=jaccard, \
+				overlap_coefficient=overlap)
@@ -37,9 +37,13 @@ class MergedFusion:
 	
 	def __init__(self):
 		self.fusions = set()
+		self.dataset_mask = 0
 		
-		annotated_genes_left = None
-		annotated_genes_right = None
+		self.annotated_genes_left = None
+		self.annotated_genes_right = None
+		
+		self.gene_names_left = None
+		self.gene_names_right = None
 	
 	def __len__(self):
 		return len(self.fusions)
@@ -54,6 +58,8 @@ class MergedFusion:
 			if new_len == len_a:
 				raise Exception("MergedFusion is updated with one that it already contains")
 			
+			self.dataset_mask |= arg_fusion.dataset_mask
+			
 			#if new_len == 2:
 			#	self.logger.debug("Merged fusion genes")
 			#elif new_len > 2:
@@ -130,6 +136,26 @@ class MergedFusion:
 		
 		return False
 	
+	def annotate_genes_left(self,genes):
+		self.annotated_genes_left = genes
+		self.gene_names_left = None
+	
+	def annotate_genes_right(self,genes):
+		self.annotated_genes_right = genes
+		self.gene_names_right = None
+	
+	def get_annotated_gene_names_left(self):
+		if(self.gene_names_left == None):
+			self.gene_names_left = frozenset([str(gene) for gene in self.get_annotated_genes_left2()])
+		
+		return self.gene_names_left
+	
+	def get_annotated_gene_names_right(self):
+		if(self.gene_names_right == None):
+			self.gene_names_right = frozenset([str(gene) for gene in self.get_annotated_genes_right2()])
+		
+		return self.gene_names_right
+	
 	def get_annotated_genes_left2(self):
 		if(not self.has_annotated_genes()):
 			raise Exception("Requested empty gene list")
@@ -25,9 +25,30 @@ from Readers import *
 
 from ParseBED import ParseBED
 from CompareFusionsBySpanningGenes import CompareFusionsBySpanningGenes
+from ComparisonTriangle import ComparisonTriangle
+from ExperimentStore import ExperimentStore
+from FusionDetectionExperiment import FusionDetectionExperiment
 
 
-import os.path,sys,itertools
+import os.path,sys,itertools,multiprocessing
+
+
+parallel_overlap_complex = None
+
+def find_overlap_combination(keys):
+	"""
+	Worker function for OverlapComplex.find_overlaps()
+	"""
+	overlap_complex, args = parallel_overlap_complex
+	
+	comparison = CompareFusionsBySpanningGenes(overlap_complex.matrix_tmp[keys[0]],overlap_complex.matrix_tmp[keys[1]],args)
+	matches = comparison.find_overlap()
+	
+	# The gene annotations are not sent back; the parent restores them
+	matches[0].genes_spanning_left_junction = None
+	matches[0].genes_spanning_right_junction = None
+	
+	return keys, matches
 
 
 class OverlapComplex:
@@ -83,7 +104,10 @@ class OverlapComplex:
 		
 		self.logger.info("Determining the overlap of fusion genes in "+str(n)+" datasets")
 		
-		self.matrix_tmp = {}
+		if(args.max_fusions_in_memory > 0):
+			self.matrix_tmp = ExperimentStore(args.max_fusions_in_memory,self.datasets,args.spill_directory)
+		else:
+			self.matrix_tmp = {}
 		
 		for i in range(len(self.datasets)):
 			self.matrix_tmp[str(i+1)] = self.datasets[i]
@@ -117,12 +141,10 @@ class OverlapComplex:
 						#del(self.matrix_tmp[candidate])
 			
 			# Then run analysis
-			for c in r:
-				keys = self.create_keys(c)
-				
-				comparison = CompareFusionsBySpanningGenes(self.matrix_tmp[keys[0]],self.matrix_tmp[keys[1]],args)
-				matches = comparison.find_overlap()
-				matches_this_iteration = matches_this_iteration | matches[3]
+			for keys, matches in self.find_overlaps([self.create_keys(c) for c in r],args):
+				# Only used to export the list format; it keeps the fusions of the previous level in memory
+				if(args.format=="list"):
+					matches_this_iteration = matches_this_iteration | matches[3]
 				
 				if(not sparse and export_dir):
 					if(args.format=="extensive"):
@@ -130,6 +152,10 @@ class OverlapComplex:
 				
 				self.matrix_tmp[keys[2]] = matches[0]
 				self.matches_total[keys[2]] = len(matches[0])
+				
+				# Combinations are generated in lexicographic order, so the one ending with the last dataset is the last to read its prefix
+				if(args.format != "list" and keys[0].find(".") > -1 and keys[1] == str(n)):
+					del(self.matrix_tmp[keys[0]])
 			
 			if(args.format=="list"):# Write those that are not marked to go to the next iteration to a file
 				if(len(r_0) > 2):
@@ -150,8 +176,167 @@ class OverlapComplex:
 			export_key = '.'.join([str(x) for x in r_0])
 			self.matrix_tmp[export_key].export_to_list(export_dir,self.dataset_names,set([]),args) ## if this was once in a list to be removed, remove...?
 		
+		if(isinstance(self.matrix_tmp,ExperimentStore)):
+			self.matrix_tmp.close()
+		
 		return matches
 	
+	def find_overlaps(self,combination_keys,args):
+		"""
+		Yields the (keys, matches) of the given combinations of one
+		level. They only read the matrix_tmp entries of the previous
+		level, so with --jobs > 1 they are distributed over a pool of
+		processes, which is created per level to inherit the current
+		matrix_tmp.
+		
+		The results are returned as copies, which do not share the
+		original Fusion objects. This is sufficient for the counts of
+		the summary format, but not for the list format, which therefore
+		always runs in a single process.
+		"""
+		global parallel_overlap_complex
+		
+		if args.jobs > 1 and args.format == "summary" and len(combination_keys) > 1:
+			parallel_overlap_complex = (self,args)
+			pool = multiprocessing.Pool(min(args.jobs,len(combination_keys)))
+			
+			try:
+				for keys, matches in pool.imap(find_overlap_combination, combination_keys):
+					matches[0].genes_spanning_left_junction = list(set(self.matrix_tmp[keys[0]].genes_spanning_left_junction+self.matrix_tmp[keys[1]].genes_spanning_left_junction))
+					matches[0].genes_spanning_right_junction = list(set(self.matrix_tmp[keys[0]].genes_spanning_right_junction+self.matrix_tmp[keys[1]].genes_spanning_right_junction))
+					
+					yield keys, matches
+			finally:
+				pool.close()
+				pool.join()
+				parallel_overlap_complex = None
+		else:
+			for keys in combination_keys:
+				comparison = CompareFusionsBySpanningGenes(self.matrix_tmp[keys[0]],self.matrix_tmp[keys[1]],args)
+				yield keys, comparison.find_overlap()
+	
+	def overlay_fusions_bitmask(self,args):
+		"""
+		Alternative for overlay_fusions() for the summary format. All
+		fusions are grouped once (by ComparisonTriangle) into components
+		that can not match each other. In a component with at most one
+		fusion per dataset, all with the same genes and chromosomes,
+		every combination of its datasets has exactly one match, so it
+		is counted as the bitmask of its datasets.
+		
+		Other components, e.g. with a fusion gene that matches several
+		mutually non-matching fusion genes of another dataset, are not
+		counted the same by the rows of the list output. They are
+		compared with overlay_fusions(), per set of datasets that they
+		contain, so the tables are identical to those of the pairwise
+		engine.
+		"""
+		n = len(self.datasets)
+		
+		self.logger.info("Determining the overlap of fusion genes in "+str(n)+" datasets using dataset bitmasks")
+		
+		comparison_triangle = ComparisonTriangle(args)
+		for dataset in self.datasets:
+			comparison_triangle.add_experiment(dataset)
+		
+		comparison_triangle.index_fusions()
+		
+		simple_ids = []
+		other_components = {}
+		for component in comparison_triangle.find_components():
+			fusions = [comparison_triangle.fusions[i] for i in component]
+			
+			if(self.is_simple_component(fusions,comparison_triangle)):
+				simple_ids += component
+			else:
+				dataset_mask = 0
+				for fusion in fusions:
+					dataset_mask |= fusion.dataset_mask
+				
+				# Components of a single dataset have no matches
+				if(dataset_mask & (dataset_mask - 1)):
+					if(not other_components.has_key(dataset_mask)):
+						other_components[dataset_mask] = []
+					other_components[dataset_mask] += fusions
+		
+		dataset_mask_counts = comparison_triangle.count_dataset_masks(sorted(simple_ids))
+		
+		for r in self.find_combination_table(n):
+			for c in r:
+				self.matches_total[".".join([str(x) for x in c])] = 0
+		
+		# A cluster found in datasets {1,2,3} counts for 1.2, 1.3, 2.3 and 1.2.3
+		for dataset_mask, count in dataset_mask_counts.items():
+			submask = dataset_mask
+			while submask > 0:
+				if submask & (submask - 1):# Single datasets are counted by add_experiment()
+					key = ".".join([str(i+1) for i in range(n) if submask & (1 << i)])
+					self.matches_total[key] += count
+				
+				submask = (submask - 1) & dataset_mask
+		
+		self.logger.info("Comparing the "+str(sum([len(fusions) for fusions in other_components.values()]))+" fusions that can not be counted by bitmask pairwise")
+		
+		for dataset_mask, fusions in sorted(other_components.items()):
+			self.add_pairwise_matches_total([i for i in range(n) if dataset_mask & (1 << i)],fusions,args)
+	
+	def is_simple_component(self,fusions,comparison_triangle):
+		"""
+		Whether all combinations of the datasets of the component match
+		once in overlay_fusions(): the fusions are of different datasets
+		and have identical gene names and chromosomes, so every match
+		of them matches the others again.
+		"""
+		if(len(fusions) == 1):
+			return True
+		
+		dataset_mask = 0
+		for fusion in fusions:
+			if(dataset_mask & fusion.dataset_mask):
+				return False
+			dataset_mask |= fusion.dataset_mask
+		
+		key = (comparison_triangle.get_gene_names(fusions[0]), fusions[0].get_left_chromosome(False), fusions[0].get_right_chromosome(False))
+		for fusion in fusions[1:]:
+			if((comparison_triangle.get_gene_names(fusion), fusion.get_left_chromosome(False), fusion.get_right_chromosome(False)) != key):
+				return False
+		
+		return True
+	
+	def add_pairwise_matches_total(self,dataset_indices,fusions,args):
+		"""
+		Runs overlay_fusions() with only the given fusions, in
+		experiments of the given datasets, and adds their matches to
+		matches_total.
+		"""
+		experiments = []
+		for i in dataset_indices:
+			experiment = FusionDetectionExperiment(self.datasets[i].name)
+			experiment.genes_spanning_left_junction = self.datasets[i].genes_spanning_left_junction
+			experiment.genes_spanning_right_junction = self.datasets[i].genes_spanning_right_junction
+			
+			for fusion in fusions:
+				if(fusion.dataset_mask == (1 << i)):
+					experiment.add_fusion(fusion)
+			
+			experiments.append(experiment)
+		
+		overlap_complex = OverlapComplex()
+		for experiment in experiments:
+			overlap_complex.add_experiment(experiment)
+		
+		try:
+			overlap_complex.overlay_fusions(True,False,args)
+		finally:
+			# The fusions remain part of the datasets, so they are not prepared for deletion with these experiments
+			for experiment in experiments:
+				experiment.flush()
+		
+		for key, count in overlap_complex.matches_total.items():
+			if(key.find(".") > -1):
+				key = ".".join([str(dataset_indices[int(x)-1]+1) for x in key.split(".")])
+				self.matches_total[key] += count
+	
 	def find_combination_table(self,n):
 		in_list = range(1,n+1)
 		
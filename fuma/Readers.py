@@ -928,8 +928,8 @@ chr7	99638140	+	chr7	99638098	-	0	0	3	HWI-1KL113:71:D1G2NACXX:1:1102:17025:16070
 		left_pos = int(line[self.parse_left_pos_column])
 		right_pos = int(line[self.parse_right_pos_column])
 		
-		f = Fusion(line[self.parse_left_chr_column],line[self.parse_right_chr_column],left_pos,right_pos,line[self.parse_left_strand_column],line[self.parse_right_strand_column],self.name,str(self.i),True)
-		self.add_fusion(f)
+		# Chimeric.out.junction files have a row per read; they are only made into Fusion objects when used
+		self.add_breakpoint(line[self.parse_left_chr_column],line[self.parse_right_chr_column],left_pos,right_pos,line[self.parse_left_strand_column],line[self.parse_right_strand_column],str(self.i),True)
 
 
 class ReadRNASTARFusionFinal(FusionDetectionExperiment):
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import fuma
+
+import logging,os,time,json,resource
+
+
+class RunStatistics:
+	"""
+	Keeps track of the elapsed time per phase (parse, annotate, dedup,
+	overlay, export) and of the throughput of the comparisons per level
+	k. The progress is logged every `interval` seconds and, if a
+	stats_file is given, every record is also written to it as one JSON
+	object per line.
+	"""
+	
+	logger = logging.getLogger("FuMa::RunStatistics")
+	
+	def __init__(self,stats_file=None,interval=10.0):
+		self.interval = interval
+		self.pid = os.getpid()
+		
+		self.phases = {}
+		self.phase_order = []
+		self.phase_started = {}
+		
+		self.levels = []
+		self.k = None
+		
+		if stats_file == None:
+			self.fh = None
+		else:
+			self.fh = open(stats_file,"w")
+	
+	def peak_rss(self):
+		"""
+		Peak resident set size of the current process, in kB (Linux)
+		"""
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	
+	def emit(self,record):
+		# Forked worker processes share the file handle of their parent; only the parent writes
+		if self.fh != None and os.getpid() == self.pid:
+			record['time'] = round(time.time(),3)
+			self.fh.write(json.dumps(record,sort_keys=True)+"\n")
+			self.fh.flush()
+	
+	def start(self,phase):
+		self.phase_started[phase] = time.time()
+	
+	def stop(self,phase):
+		"""
+		The time of a phase is accumulated, because phases like annotate
+		and dedup are run once per sample.
+		"""
+		elapsed = time.time() - self.phase_started.pop(phase)
+		self.add(phase,elapsed)
+		
+		self.emit({'event':'phase', 'phase':phase, 'elapsed':round(elapsed,3), 'total':round(self.phases[phase],3), 'peak_rss_kb':self.peak_rss()})
+		
+		return elapsed
+	
+	def add(self,phase,elapsed):
+		"""
+		Accumulates time to a phase without reporting it, e.g. for the
+		export that is interleaved with the overlay.
+		"""
+		if not self.phases.has_key(phase):
+			self.phases[phase] = 0.0
+			self.phase_order.append(phase)
+		
+		self.phases[phase] += elapsed
+	
+	def start_level(self,k,n_total):
+		self.k = k
+		self.n_total = n_total
+		self.passed = 0
+		self.comparisons = 0
+		self.matches = 0
+		
+		self.level_started = time.time()
+		self.last_report = self.level_started
+	
+	def progress(self,passed,comparisons,matches):
+		"""
+		Updates the counters of the current level and reports them if
+		the interval has passed since the previous report.
+		"""
+		self.passed = passed
+		self.comparisons = comparisons
+		self.matches = matches
+		
+		now = time.time()
+		if now - self.last_report >= self.interval:
+			self.last_report = now
+			self.report(now)
+	
+	def report(self,now):
+		elapsed = now - self.level_started
+		
+		if self.n_total > 0:
+			percentage = 100.0 * float(self.passed) / float(self.n_total)
+		else:
+			percentage = 100.0
+		
+		if elapsed > 0:
+			comparisons_per_second = self.comparisons / elapsed
+		else:
+			comparisons_per_second = 0.0
+		
+		if self.passed > 0:
+			eta = elapsed / self.passed * (self.n_total - self.passed)
+		else:
+			eta = None
+		
+		self.logger.info("k="+str(self.k)+": "+str(round(percentage,1))+"% completed, "+str(int(comparisons_per_second))+" comparisons/s, "+str(self.matches)+" matches, ETA: "+("unknown" if eta == None else str(int(eta))+"s"))
+		
+		self.emit({'event':'progress', 'k':self.k, 'passed':self.passed, 'total':self.n_total, 'comparisons':self.comparisons, 'comparisons_per_second':round(comparisons_per_second,1), 'matches':self.matches, 'eta':(None if eta == None else round(eta,1)), 'peak_rss_kb':self.peak_rss()})
+	
+	def finish_level(self,n_merged):
+		"""
+		n_merged is the number of (unique) merged fusions that are
+		passed on to level k+1.
+		"""
+		elapsed = time.time() - self.level_started
+		
+		level = {'event':'level', 'k':self.k, 'fusions':self.n_total, 'comparisons':self.comparisons, 'matches':self.matches, 'merged_fusions':n_merged, 'elapsed':round(elapsed,3), 'peak_rss_kb':self.peak_rss()}
+		self.levels.append(level)
+		
+		self.logger.info("k="+str(self.k)+": finished in "+str(round(elapsed,1))+"s; "+str(self.comparisons)+" comparisons, "+str(self.matches)+" matches, "+str(n_merged)+" merged fusions")
+		self.emit(level)
+	
+	def merge_levels(self,levels):
+		"""
+		Combines the levels of the worker processes of
+		ComparisonTriangle.overlay_fusions_parallel() per k. The elapsed
+		time of a combined level is the sum over the workers.
+		"""
+		merged = {}
+		for level in levels:
+			if not merged.has_key(level['k']):
+				merged[level['k']] = {'event':'level', 'k':level['k'], 'fusions':0, 'comparisons':0, 'matches':0, 'merged_fusions':0, 'elapsed':0.0, 'peak_rss_kb':0}
+			
+			for key in ['fusions','comparisons','matches','merged_fusions','elapsed']:
+				merged[level['k']][key] += level[key]
+			merged[level['k']]['peak_rss_kb'] = max(merged[level['k']]['peak_rss_kb'],level['peak_rss_kb'])
+		
+		for k in sorted(merged.keys()):
+			level = merged[k]
+			self.levels.append(level)
+			
+			self.logger.info("k="+str(k)+": "+str(level['comparisons'])+" comparisons, "+str(level['matches'])+" matches, "+str(level['merged_fusions'])+" merged fusions (all processes)")
+			self.emit(level)
+	
+	def close(self):
+		summary = ", ".join([phase+": "+str(round(self.phases[phase],1))+"s" for phase in self.phase_order])
+		self.logger.info("Elapsed time per phase - "+summary+"; peak RSS: "+str(self.peak_rss())+" kB")
+		
+		self.emit({'event':'summary', 'version':fuma.__version__, 'phases':dict([(phase,round(self.phases[phase],3)) for phase in self.phase_order]), 'peak_rss_kb':self.peak_rss()})
+		
+		if self.fh != None:
+			self.fh.close()
+			self.fh = None
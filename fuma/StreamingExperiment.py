@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import logging
+
+from Fusion import Fusion
+from FusionDetectionExperiment import FusionDetectionExperiment
+
+
+class StreamingExperiment(FusionDetectionExperiment):
+	"""
+	Experiment that does not keep its fusions: they are annotated, the
+	non gene-spanning fusions and duplicates are removed, and the
+	remaining fusions are sent to the generator that writes the
+	Complete Genomics junctions file (write_CG_Junctions_file()) while
+	they are being read.
+	
+	Duplicates can only be found among fusions of the same chromosome
+	pair, so the fusions are kept per chromosome pair until a fusion
+	of another pair is added. Only that block is held in memory, as a
+	list, and the counts of all blocks are logged once by close(). For
+	the same results as remove_duplicates() on the whole experiment,
+	the fusions of each chromosome pair have to be adjacent in the
+	input, e.g. by sorting it on the chromosomes. Otherwise duplicates
+	in different blocks of the same pair are not merged.
+	"""
+	
+	logger = logging.getLogger("FuMa::StreamingExperiment")
+	
+	def __init__(self,name,gene_annotation,args,filename):
+		FusionDetectionExperiment.__init__(self,name)
+		
+		self.gene_annotation = gene_annotation
+		self.args = args
+		
+		self.writer = self.write_CG_Junctions_file(filename)
+		self.writer.next()
+		
+		self.block = None
+		self.block_key = None
+		self.finished_blocks = set()
+		self.n_repeated_blocks = 0
+		
+		self.n_read = 0
+		self.n_gene_spanning = 0
+		self.n_written = 0
+	
+	def read(self,reader_class,filename):
+		"""
+		Parses a file with one of the readers (e.g. ReadDefuse). The
+		fusions the reader adds are passed to this experiment instead
+		of being kept by the reader.
+		"""
+		streaming_reader_class = type(reader_class)("Streaming"+reader_class.__name__,(reader_class,),{
+			'add_fusion': self.add_fusion,
+			'add_breakpoint': self.add_breakpoint})
+		
+		streaming_reader_class(filename,self.name)
+	
+	def add_breakpoint(self,left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,uid,auto_set_acceptor_donor_direction):
+		self.add_fusion(Fusion(left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,self.name,uid,auto_set_acceptor_donor_direction))
+	
+	def add_fusion(self,fusion):
+		key = (fusion.get_left_chromosome(False),fusion.get_right_chromosome(False))
+		
+		if(key != self.block_key):
+			self.write_block()
+			
+			if(key in self.finished_blocks):
+				if(self.n_repeated_blocks == 0):
+					self.logger.warning("Fusions of chromosomes "+key[0]+" and "+key[1]+" are not adjacent in the input of "+self.name+"; duplicates in between their blocks are not removed")
+				self.n_repeated_blocks += 1
+			
+			self.block = []
+			self.block_key = key
+		
+		self.block.append(fusion)
+		self.n_read += 1
+	
+	def get_unique_fusions(self,block):
+		"""
+		Returns the annotated, gene-spanning and deduplicated fusions of
+		a block.
+		"""
+		annotations = self.gene_annotation.get_annotations_bulk([(fusion.get_left_chromosome(),fusion.get_left_break_position()) for fusion in block] + [(fusion.get_right_chromosome(),fusion.get_right_break_position()) for fusion in block])
+		
+		for i in range(len(block)):
+			block[i].annotate_genes_left(annotations[i])
+			block[i].annotate_genes_right(annotations[len(block) + i])
+		
+		unique_fusions, non_gene_spanning = self.remove_duplicates_block(block,self.args)
+		self.n_gene_spanning += len(block) - non_gene_spanning
+		
+		return unique_fusions
+	
+	def write_block(self):
+		if(self.block != None):
+			for fusion in self.get_unique_fusions(self.block):
+				self.writer.send(fusion)
+				self.n_written += 1
+			
+			self.finished_blocks.add(self.block_key)
+			self.block = None
+			self.block_key = None
+	
+	def close(self):
+		"""
+		Writes the last block and closes the writer. Returns the number
+		of fusions written.
+		"""
+		self.write_block()
+		self.writer.close()
+		
+		self.logger.info("Streamed "+self.name+": "+str(self.n_read)+" fusions read, "+str(self.n_gene_spanning)+" gene-spanning, "+str(self.n_written)+" written without duplicates")
+		if(self.n_repeated_blocks > 0):
+			self.logger.warning(str(self.n_repeated_blocks)+" blocks of "+self.name+" were of a chromosome pair that already had a block; sort the input on the chromosomes to remove all duplicates")
+		
+		return self.n_written
+	
+	def __len__(self):
+		return self.n_written
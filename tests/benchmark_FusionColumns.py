@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+# Memory comparison of the columnar breakpoint storage (FusionColumns)
+# with Fusion objects, on a synthetic Chimeric.out.junction-like input
+# that is annotated with synthetic genes covering about half of the
+# genome:
+#
+#	python -m tests.benchmark_FusionColumns [ROWS]
+#
+# Each variant is built and annotated in a separate process, of which
+# the increase of the peak resident memory is reported.
+
+import sys,random,resource,multiprocessing,time
+
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.GeneAnnotation import GeneAnnotation
+
+
+CHROMOSOMES = ["chr"+str(i) for i in range(1,23)] + ["chrX","chrY"]
+
+def get_rows(n):
+	random.seed(1)
+	for i in xrange(n):
+		yield (random.choice(CHROMOSOMES),random.choice(CHROMOSOMES),random.randint(1,250000000),random.randint(1,250000000),random.choice("+-"),random.choice("+-"),str(i + 1))
+
+def get_gene_annotation():
+	random.seed(2)
+	gene_annotation = GeneAnnotation("benchmark")
+	for chromosome in CHROMOSOMES:
+		for i in range(1000):
+			start = random.randint(1,250000000)
+			gene_annotation.add_annotation(Gene(chromosome+"_"+str(i),False),chromosome[3:],start,start + 125000)
+	
+	return gene_annotation
+
+def build(columnar,n,gene_annotation,queue):
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	started = time.time()
+	
+	experiment = FusionDetectionExperiment("benchmark")
+	for left_chr, right_chr, left_pos, right_pos, left_strand, right_strand, uid in get_rows(n):
+		if(columnar):
+			experiment.add_breakpoint(left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,uid,True)
+		else:
+			experiment.add_fusion(Fusion(left_chr,right_chr,left_pos,right_pos,left_strand,right_strand,"benchmark",uid,True))
+	
+	elapsed = time.time() - started
+	after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	rows = len(experiment)
+	
+	started = time.time()
+	experiment.annotate_genes(gene_annotation)
+	annotate_elapsed = time.time() - started
+	annotate_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	
+	queue.put((rows,(after - before) / 1024.0,elapsed,(annotate_after - before) / 1024.0,annotate_elapsed,len(experiment.fusions)))
+
+def main():
+	if(len(sys.argv) > 1):
+		n = int(sys.argv[1])
+	else:
+		n = 1000000
+	
+	gene_annotation = get_gene_annotation()
+	
+	sys.stdout.write("storage\trows\tpeak memory increase (MiB)\tbuild time (s)\tpeak memory increase after annotation (MiB)\tannotation time (s)\tFusion objects after annotation\n")
+	
+	for name, columnar in [("Fusion objects",False),("FusionColumns",True)]:
+		queue = multiprocessing.Queue()
+		process = multiprocessing.Process(target=build,args=(columnar,n,gene_annotation,queue))
+		process.start()
+		rows, memory, elapsed, annotate_memory, annotate_elapsed, fusions = queue.get()
+		process.join()
+		
+		sys.stdout.write(name+"\t"+str(rows)+"\t"+("%.1f" % memory)+"\t"+("%.1f" % elapsed)+"\t"+("%.1f" % annotate_memory)+"\t"+("%.1f" % annotate_elapsed)+"\t"+str(fusions)+"\n")
+
+if __name__ == '__main__':
+	main()
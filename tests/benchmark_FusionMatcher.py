@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+# Micro-benchmark of FusionMatcher against the per-pair dispatch on the
+# matching arguments that it replaces, using the Edgren test data:
+#
+#	python -m tests.benchmark_FusionMatcher
+
+import sys,time,itertools
+
+from fuma.Readers import ReadChimeraScanAbsoluteBEDPE, ReadDefuse, ReadFusionMap
+from fuma.ParseBED import ParseBED
+from fuma.FusionMatcher import FusionMatcher
+from fuma.CLI import CLI
+
+
+REPEATS = 5
+
+class DispatchMatcher:
+	"""
+	The former CompareFusionsBySpanningGenes.match_fusions(), without
+	the construction of the match
+	"""
+	def __init__(self,args):
+		self.args = args
+	
+	def match_fusion_gene_strands(self,fusion_1,fusion_2):
+		if not self.args.strand_specific_matching:
+			return True
+		else:
+			if fusion_1.left_strand == None or fusion_1.right_strand == None or fusion_2.left_strand == None or fusion_2.right_strand == None:
+				raise Exception("A fusion gene without an annotated strand was used for strand-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
+			else:
+				return fusion_1.left_strand == fusion_2.left_strand and fusion_1.right_strand == fusion_2.right_strand
+	
+	def match_acceptor_donor_direction(self,fusion_1,fusion_2):
+		if(not self.args.acceptor_donor_order_specific_matching):
+			return True
+		elif(fusion_1.acceptor_donor_direction == None or fusion_2.acceptor_donor_direction == None):
+			raise Exception("A fusion gene without an annotated acceptor-donor direction was used for acceptor-donor-order-specific-matching.\n\n"+fusion_1.__str__()+"\n"+fusion_2.__str__())
+		else:
+			return (fusion_1.acceptor_donor_direction == fusion_2.acceptor_donor_direction)
+	
+	def match(self,fusion_1,fusion_2):
+		if(self.match_fusion_gene_strands(fusion_1,fusion_2) and self.match_acceptor_donor_direction(fusion_1,fusion_2)):
+			if((fusion_1.annotated_genes_left and fusion_1.annotated_genes_right and fusion_2.annotated_genes_left and fusion_2.annotated_genes_right)):
+				if(self.args.matching_method == 'overlap'):
+					matches_left  = self.match_overlap( fusion_1.get_annotated_gene_names_left(), fusion_2.get_annotated_gene_names_left() )
+					matches_right = self.match_overlap( fusion_1.get_annotated_gene_names_right(), fusion_2.get_annotated_gene_names_right() )
+				elif(self.args.matching_method == 'egm'):
+					matches_left  = self.match_egm( fusion_1.get_annotated_gene_names_left(), fusion_2.get_annotated_gene_names_left() )
+					matches_right = self.match_egm( fusion_1.get_annotated_gene_names_right(), fusion_2.get_annotated_gene_names_right() )
+				else:
+					matches_left  = self.match_sets( fusion_1.get_annotated_gene_names_left(), fusion_2.get_annotated_gene_names_left() )
+					matches_right = self.match_sets( fusion_1.get_annotated_gene_names_right(), fusion_2.get_annotated_gene_names_right() )
+				
+				if(matches_left and matches_right):
+					return (matches_left,matches_right)
+		return None
+	
+	def match_sets(self,superset,subset):
+		if(len(subset) > len(superset)):
+			return self.match_sets(subset,superset)
+		elif(subset.issubset(superset)):
+			return subset
+		else:
+			return None
+	
+	def match_egm(self,set1,set2):
+		if set1 == set2:
+			return set1
+		else:
+			return None
+	
+	def match_overlap(self,set1,set2):
+		overlap = set1.intersection(set2)
+		if(not overlap):
+			return None
+		else:
+			return overlap
+
+def get_candidate_pairs(experiments):
+	pairs = []
+	
+	for experiment_1, experiment_2 in itertools.combinations(experiments,2):
+		for left_chr in experiment_1.index.keys():
+			for right_chr in experiment_1.index[left_chr].keys():
+				if experiment_2.index.has_key(left_chr) and experiment_2.index[left_chr].has_key(right_chr):
+					for fusion_1 in experiment_1.index[left_chr][right_chr]:
+						for fusion_2 in experiment_2.index[left_chr][right_chr]:
+							pairs.append((fusion_1,fusion_2))
+	
+	return pairs
+
+def benchmark(function,pairs):
+	timings = []
+	
+	for i in range(REPEATS):
+		started = time.time()
+		for fusion_1, fusion_2 in pairs:
+			function(fusion_1,fusion_2)
+		timings.append(time.time() - started)
+	
+	return min(timings)
+
+def main():
+	experiments = [
+		ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_Edgren_hg19.ChimeraScan.txt","chimerascan"),
+		ReadDefuse("tests/data/test_Functional.test_Edgren_hg19.Defuse.txt","defuse"),
+		ReadFusionMap("tests/data/test_Functional.test_Edgren_hg19.FusionMap.txt","fusion-map"),
+		ReadFusionMap("tests/data/test_Functional.test_Edgren_hg19.TruePositives.txt","edgren_tp")]
+	
+	genes = ParseBED("tests/data/refseq_genes_hg19.bed","hg19",200000)
+	for experiment in experiments:
+		experiment.annotate_genes(genes)
+	
+	pairs = get_candidate_pairs(experiments)
+	sys.stdout.write("Candidate pairs: "+str(len(pairs))+", best of "+str(REPEATS)+" runs\n\n")
+	sys.stdout.write("method\tstrand-specific\tdispatch (s)\tmatcher (s)\tspeedup\n")
+	
+	for matching_method in ['overlap','subset','egm']:
+		for strand_specific_matching in ['--no-strand-specific-matching','--strand-specific-matching']:
+			args = CLI(['-m',matching_method,strand_specific_matching,'-s',''])
+			dispatch = DispatchMatcher(args)
+			matcher = FusionMatcher(args)
+			
+			try:
+				for fusion_1, fusion_2 in pairs:
+					if dispatch.match(fusion_1,fusion_2) != matcher.match(fusion_1,fusion_2):
+						raise Exception("FusionMatcher and the dispatch disagree:\n\n"+str(fusion_1)+"\n"+str(fusion_2))
+			except Exception as e:
+				# Fusions without a strand can not be matched strand-specifically
+				sys.stdout.write(matching_method+"\t"+strand_specific_matching+"\t"+str(e).split("\n")[0]+"\n")
+				continue
+			
+			time_dispatch = benchmark(dispatch.match,pairs)
+			time_matcher = benchmark(matcher.match,pairs)
+			
+			sys.stdout.write(matching_method+"\t"+strand_specific_matching+"\t"+("%.4f" % time_dispatch)+"\t"+("%.4f" % time_matcher)+"\t"+("%.2fx" % (time_dispatch / max(time_matcher,1e-9)))+"\n")
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.ApproximateSummary import ApproximateSummary
+from fuma.CLI import CLI
+
+
+def make_experiment(name,gene_pairs):
+	experiment = FusionDetectionExperiment(name)
+	
+	for i in range(len(gene_pairs)):
+		fusion = Fusion("chr1","chr2",100+i,200+i,"+","+",name,"uid_"+str(i),True)
+		fusion.annotate_genes_left([Gene(gene_pairs[i][0],False)])
+		fusion.annotate_genes_right([Gene(gene_pairs[i][1],False)])
+		experiment.add_fusion(fusion)
+	
+	return experiment
+
+
+class TestApproximateSummary(unittest.TestCase):
+	def test_01(self):
+		"""
+		Sketches that are not full are exact; (A,B) equals (B,A)
+		without acceptor-donor-order-specific-matching.
+		"""
+		args = CLI(['--approximate-summary','--sketch-size','16','-s',''])
+		
+		summary = ApproximateSummary(args)
+		summary.add_experiment(make_experiment("a",[("A","B"),("C","D"),("E","F")]))
+		summary.add_experiment(make_experiment("b",[("B","A"),("C","D"),("G","H")]))
+		summary.add_experiment(make_experiment("c",[("C","D")]))
+		
+		self.assertEqual(summary.estimate([0]), (3.0, 0.0, True))
+		self.assertEqual(summary.estimate([0,1]), (2.0, 0.0, True))
+		self.assertEqual(summary.estimate([0,1,2]), (1.0, 0.0, True))
+		
+		args = CLI(['--approximate-summary','--sketch-size','16','--acceptor-donor-order-specific-matching','-s',''])
+		
+		summary = ApproximateSummary(args)
+		summary.add_experiment(make_experiment("a",[("A","B"),("C","D"),("E","F")]))
+		summary.add_experiment(make_experiment("b",[("B","A"),("C","D"),("G","H")]))
+		
+		self.assertEqual(summary.estimate([0,1]), (1.0, 0.0, True))
+	
+	def test_02(self):
+		"""
+		Full sketches give an estimate within a few standard errors.
+		"""
+		args = CLI(['--approximate-summary','--sketch-size','256','-s',''])
+		
+		summary = ApproximateSummary(args)
+		summary.add_experiment(make_experiment("a",[("L"+str(i),"R"+str(i)) for i in range(0,2000)]))
+		summary.add_experiment(make_experiment("b",[("L"+str(i),"R"+str(i)) for i in range(1000,3000)]))
+		
+		self.assertEqual(len(summary.sketches[0]), 256)
+		
+		estimate, standard_error, exact = summary.estimate([0])
+		self.assertFalse(exact)
+		self.assertTrue(standard_error > 0.0)
+		self.assertTrue(abs(estimate - 2000) < 4 * standard_error)
+		
+		estimate, standard_error, exact = summary.estimate([0,1])
+		self.assertTrue(abs(estimate - 1000) < 4 * standard_error)
+		self.assertTrue(standard_error < 200)
+		
+		# Complete sketches with a union larger than the sketch size are still exact
+		summary.add_experiment(make_experiment("c",[("L"+str(i),"R"+str(i)) for i in range(0,200)]))
+		summary.add_experiment(make_experiment("d",[("L"+str(i),"R"+str(i)) for i in range(100,300)]))
+		self.assertEqual(summary.estimate([2,3]), (100.0, 0.0, True))
+	
+	def test_estimated_zero(self):
+		"""
+		Full sketches without shared values give an estimate of 0 with
+		a standard error of 0, which is not exact.
+		"""
+		output_file = 'test_ApproximateSummary.test_estimated_zero.output.txt'
+		
+		args = CLI(['--approximate-summary','--sketch-size','16','-s',''])
+		
+		summary = ApproximateSummary(args)
+		summary.add_experiment(make_experiment("a",[("L"+str(i),"R"+str(i)) for i in range(0,100)]))
+		summary.add_experiment(make_experiment("b",[("L"+str(i),"R"+str(i)) for i in range(100,200)]))
+		
+		self.assertEqual(summary.estimate([0,1]), (0.0, 0.0, False))
+		
+		summary.export_summary(output_file)
+		
+		with open(output_file,"r") as fh:
+			rows = [line.rstrip("\n").split("\t") for line in fh]
+		
+		self.assertEqual(rows[-1], ["a & b","0","0.0","FALSE"])
+		
+		os.remove(output_file)
+	
+	def test_03(self):
+		output_file = 'test_ApproximateSummary.test_03.output.txt'
+		
+		args = CLI(['--approximate-summary','--approximate-summary-max-order','2','-s',''])
+		
+		summary = ApproximateSummary(args)
+		for name in ["a","b","c"]:
+			summary.add_experiment(make_experiment(name,[("A","B"),(name,name)]))
+		
+		summary.export_summary(output_file)
+		
+		with open(output_file,"r") as fh:
+			rows = [line.rstrip("\n").split("\t") for line in fh]
+		
+		self.assertEqual(rows[0], ["Datasets","Estimated fusion genes","Standard error","Exact"])
+		self.assertEqual([row[0] for row in rows[1:]], ["a","b","c","a & b","a & c","b & c"])
+		self.assertEqual([row[1] for row in rows[1:]], ["2","2","2","1","1","1"])
+		self.assertEqual(rows[-1][3], "TRUE")
+		
+		os.remove(output_file)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
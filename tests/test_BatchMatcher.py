@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,random
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.BatchMatcher import BatchMatcher
+from fuma.CompareFusionsBySpanningGenes import CompareFusionsBySpanningGenes
+from fuma.CLI import CLI
+
+class TestBatchMatcher(unittest.TestCase):
+	def get_fusions(self,n,dataset_name):
+		fusions = []
+		
+		for i in range(n):
+			fusion = Fusion("chr1","chr1",100+i,5000+i,random.choice("+-"),random.choice("+-"),dataset_name,"uid_"+str(i),True)
+			fusion.annotate_genes_left([Gene(gene_name,False) for gene_name in random.sample("ABCDE",random.randint(0,2))])
+			fusion.annotate_genes_right([Gene(gene_name,False) for gene_name in random.sample("FGHIJ",random.randint(1,3))])
+			fusions.append(fusion)
+		
+		return fusions
+	
+	def test_01(self):
+		"""
+		The pairs matched by BatchMatcher.match_block() have to be
+		identical to those of CompareFusionsBySpanningGenes.match_fusions()
+		"""
+		random.seed(1)
+		fusions_1 = self.get_fusions(60,"Experiment_1")
+		fusions_2 = self.get_fusions(50,"Experiment_2")
+		
+		for matching_method in ['overlap','subset','egm']:
+			args = CLI(['-m',matching_method,'--no-strand-specific-matching','--batch-matching-threshold','1','-s',''])
+			
+			batch_matcher = BatchMatcher(args)
+			overlap = CompareFusionsBySpanningGenes(False,False,args)
+			
+			self.assertTrue(batch_matcher.can_match_block(fusions_1,fusions_2))
+			matched_pairs = batch_matcher.match_block(fusions_1,fusions_2)
+			
+			for i in range(len(fusions_1)):
+				expected = [j for j in range(len(fusions_2)) if overlap.match_fusions(fusions_1[i],fusions_2[j],False)]
+				self.assertEqual(matched_pairs.get(i,[]), expected)
+	
+	def test_02(self):
+		"""
+		Small blocks and blocks with fusion genes without a strand are
+		matched per pair
+		"""
+		fusions = [Fusion("chr1","chr1",100,5000,None,None,"Experiment_1","uid",True)]
+		
+		self.assertFalse(BatchMatcher(CLI(['--batch-matching-threshold','2','--no-strand-specific-matching','-s',''])).can_match_block(fusions,fusions))
+		self.assertTrue(BatchMatcher(CLI(['--batch-matching-threshold','1','--no-strand-specific-matching','-s',''])).can_match_block(fusions,fusions))
+		self.assertFalse(BatchMatcher(CLI(['--batch-matching-threshold','1','--strand-specific-matching','-s',''])).can_match_block(fusions,fusions))
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os,tempfile
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.ComparisonTriangle import ComparisonTriangle
+from fuma.CohortStore import CohortStore
+from fuma.CLI import CLI
+
+
+def make_experiments():
+	"""
+	Sample s3 matches the fusions of s1 and s2, which do not match
+	each other; the fusion of s4 matches nothing
+	"""
+	experiments = []
+	
+	for name, fusions in [("s1",[(["A"],["B"],"1")]), \
+						  ("s2",[(["C"],["D"],"1")]), \
+						  ("s3",[(["A","C"],["B","D"],"1"),(["A"],["B"],"2")]), \
+						  ("s4",[(["E"],["F"],"1")])]:
+		experiment = FusionDetectionExperiment(name)
+		
+		for i, (genes_left, genes_right, uid) in enumerate(fusions):
+			fusion = Fusion("chr1","chr2",100+i,200+i,"+","-",name,uid,True)
+			fusion.annotate_genes_left([Gene(gene,gene == "C") for gene in genes_left])
+			fusion.annotate_genes_right([Gene(gene,False) for gene in genes_right])
+			experiment.add_fusion(fusion)
+		
+		experiments.append(experiment)
+	
+	return experiments
+
+def read_lines(filename):
+	with open(filename,"r") as fh:
+		return fh.read().split("\n")
+
+
+class TestCohortStore(unittest.TestCase):
+	def test_01(self):
+		"""
+		Adding the samples one by one has to give the same rows as
+		matching all of them at once
+		"""
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		fd, output_file = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(filename)
+		
+		args = CLI(['-m','overlap','--cohort',filename,'-o',output_file])
+		
+		o = ComparisonTriangle(args)
+		for experiment in make_experiments():
+			o.add_experiment(experiment)
+		o.overlay_fusions()
+		
+		rows = read_lines(output_file)
+		self.assertEqual(len(rows), 5)
+		
+		cohort = CohortStore(filename,args)
+		for experiment in make_experiments():
+			cohort.add_experiment(experiment,["tests/data/refseq_hg19.bed"])
+		cohort.export_list()
+		
+		self.assertEqual(cohort.get_sample_names(), ["s1","s2","s3","s4"])
+		self.assertEqual(read_lines(output_file)[0], rows[0])
+		self.assertEqual(sorted(read_lines(output_file)), sorted(rows))
+		
+		# s3 joined the components of s1 and s2
+		self.assertEqual(cohort.connection.execute("SELECT COUNT(DISTINCT component) FROM fusions").fetchone()[0], 2)
+		
+		cohort.close()
+		
+		os.remove(filename)
+		os.remove(output_file)
+	
+	def test_02(self):
+		"""
+		The output can be written again from the file, which refuses
+		known samples and other settings
+		"""
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		fd, output_file = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(filename)
+		
+		args = CLI(['-m','subset','--cohort',filename,'-o',output_file])
+		experiments = make_experiments()
+		
+		cohort = CohortStore(filename,args)
+		cohort.add_experiment(experiments[0],["tests/data/refseq_hg19.bed"])
+		cohort.add_experiment(experiments[2],["tests/data/refseq_hg19.bed"])
+		cohort.export_list()
+		cohort.close()
+		
+		rows = read_lines(output_file)
+		self.assertEqual(rows[0].split("\t")[3:], ["s1","s3"])
+		self.assertEqual(len(rows), 3)
+		
+		cohort = CohortStore(filename,args)
+		cohort.export_list()
+		self.assertEqual(read_lines(output_file), rows)
+		
+		self.assertRaises(Exception, cohort.add_experiment, make_experiments()[0], ["tests/data/refseq_hg19.bed"])
+		cohort.close()
+		
+		self.assertRaises(Exception, CohortStore, filename, CLI(['-m','egm','--cohort',filename,'-o',output_file]))
+		
+		os.remove(filename)
+		os.remove(output_file)
+	
+	def test_03(self):
+		"""
+		Samples annotated with another gene annotation than the
+		cohort are refused
+		"""
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		fd, output_file = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(filename)
+		
+		args = CLI(['-m','overlap','--cohort',filename,'-o',output_file])
+		experiments = make_experiments()
+		
+		cohort = CohortStore(filename,args)
+		cohort.add_experiment(experiments[0],["tests/data/refseq_hg19.bed"])
+		self.assertRaises(Exception, cohort.add_experiment, experiments[1], ["tests/data/gencode_hg19.subset.bed"])
+		cohort.close()
+		
+		# Nothing of the refused sample was stored
+		cohort = CohortStore(filename,args)
+		self.assertEqual(cohort.get_sample_names(), ["s1"])
+		cohort.add_experiment(experiments[1],["tests/data/refseq_hg19.bed"])
+		self.assertEqual(cohort.get_sample_names(), ["s1","s2"])
+		cohort.close()
+		
+		os.remove(filename)
+		os.remove(output_file)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
@@ -21,7 +21,7 @@
  <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
 """
 
-import unittest,logging,sys,hashlib,os
+import unittest,logging,sys,hashlib,os,gzip,json,numpy
 logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
 
 from fuma.FusionDetectionExperiment import FusionDetectionExperiment
@@ -1795,6 +1795,358 @@ f5=                                            [--A6--]
 		if files_identical:
 			os.remove(output_file_b)
 		#---------------------------------------------------------------#
+	
+	def test_index_fusions(self):
+		"""
+		Fusions are only compared with fusions that share the strands
+		(strand-specific-matching only) and fusions without annotated
+		genes are not compared at all.
+		"""
+		args_specific     = CLI(['-m','overlap','-f','list',   '--strand-specific-matching','-s','','-o','-'])
+		args_non_specific = CLI(['-m','overlap','-f','list','--no-strand-specific-matching','-s','','-o','-'])
+		
+		gene_A = Gene("A", False)
+		gene_B = Gene("B", False)
+		
+		fusion_1 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_1","1",True)
+		fusion_2 = Fusion("chr1","chr2",15000,15000,"+","-","Experiment_2","2",True)
+		fusion_3 = Fusion("chr3","chr4",15000,15000,"+","+","Experiment_2","3",True)
+		fusion_4 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_2","4",True)
+		
+		for fusion in [fusion_1, fusion_2, fusion_3]:
+			fusion.annotate_genes_left([gene_A])
+			fusion.annotate_genes_right([gene_B])
+		
+		experiment_1 = FusionDetectionExperiment("Experiment_1")
+		experiment_1.add_fusion(fusion_1)
+		
+		experiment_2 = FusionDetectionExperiment("Experiment_2")
+		experiment_2.add_fusion(fusion_2)
+		experiment_2.add_fusion(fusion_3)
+		experiment_2.add_fusion(fusion_4)
+		
+		overlap = ComparisonTriangle(args_specific)
+		overlap.add_experiment(experiment_1)
+		overlap.add_experiment(experiment_2)
+		overlap.index_fusions()
+		
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_1)], [fusion_1, fusion_3])
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_2)], [fusion_2])
+		
+		overlap = ComparisonTriangle(args_non_specific)
+		overlap.add_experiment(experiment_1)
+		overlap.add_experiment(experiment_2)
+		overlap.index_fusions()
+		
+		# Chromosome names are not taken into account; only gene names
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_1)], [fusion_1, fusion_2, fusion_3])
+	
+	def test_index_fusions_gene_names(self):
+		"""
+		Only fusions that share at least one left and one right gene are
+		candidates; for egm the gene sets have to be identical.
+		"""
+		args_overlap = CLI(['-m','overlap','-f','list','--no-strand-specific-matching','-s','','-o','-'])
+		args_egm     = CLI(['-m',    'egm','-f','list','--no-strand-specific-matching','-s','','-o','-'])
+		
+		gene_A = Gene("A", False)
+		gene_B = Gene("B", False)
+		gene_C = Gene("C", False)
+		
+		fusion_1 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_1","1",True)
+		fusion_2 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_2","2",True)
+		fusion_3 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_2","3",True)
+		fusion_4 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_2","4",True)
+		
+		fusion_1.annotate_genes_left([gene_A, gene_B])
+		fusion_1.annotate_genes_right([gene_C])
+		
+		fusion_2.annotate_genes_left([gene_B])
+		fusion_2.annotate_genes_right([gene_C])
+		
+		fusion_3.annotate_genes_left([gene_A, gene_B])
+		fusion_3.annotate_genes_right([gene_C])
+		
+		fusion_4.annotate_genes_left([gene_C])
+		fusion_4.annotate_genes_right([gene_A, gene_B])
+		
+		experiment_1 = FusionDetectionExperiment("Experiment_1")
+		experiment_1.add_fusion(fusion_1)
+		
+		experiment_2 = FusionDetectionExperiment("Experiment_2")
+		experiment_2.add_fusion(fusion_2)
+		experiment_2.add_fusion(fusion_3)
+		experiment_2.add_fusion(fusion_4)
+		
+		overlap = ComparisonTriangle(args_overlap)
+		overlap.add_experiment(experiment_1)
+		overlap.add_experiment(experiment_2)
+		overlap.index_fusions()
+		
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_1)], [fusion_1, fusion_2, fusion_3])
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_4)], [fusion_4])
+		
+		overlap = ComparisonTriangle(args_egm)
+		overlap.add_experiment(experiment_1)
+		overlap.add_experiment(experiment_2)
+		overlap.index_fusions()
+		
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_1)], [fusion_1, fusion_3])
+		self.assertEqual([fusion for i,fusion in overlap.get_candidates(fusion_2)], [fusion_2])
+	
+	def test_dataset_mask(self):
+		args = CLI(['-m','overlap','-f','list','-s','','-o','-'])
+		
+		fusion_1 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_1","1",True)
+		fusion_2 = Fusion("chr1","chr2",15000,15000,"+","+","Experiment_2","2",True)
+		fusion_3 = Fusion("chr1","chr2",16000,16000,"+","+","Experiment_2","3",True)
+		
+		experiment_1 = FusionDetectionExperiment("Experiment_1")
+		experiment_1.add_fusion(fusion_1)
+		
+		experiment_2 = FusionDetectionExperiment("Experiment_2")
+		experiment_2.add_fusion(fusion_2)
+		experiment_2.add_fusion(fusion_3)
+		
+		overlap = ComparisonTriangle(args)
+		overlap.add_experiment(experiment_1)
+		overlap.add_experiment(experiment_2)
+		
+		self.assertEqual(fusion_1.dataset_mask, 1)
+		self.assertEqual(fusion_2.dataset_mask, 2)
+		self.assertEqual(fusion_3.dataset_mask, 2)
+		
+		merged_fusion = MergedFusion()
+		merged_fusion.add_fusion(fusion_1)
+		merged_fusion.add_fusion(fusion_2)
+		
+		self.assertEqual(merged_fusion.dataset_mask, 1 | 2)
+		self.assertTrue(merged_fusion.dataset_mask & fusion_3.dataset_mask)
+	
+	def test_jobs(self):
+		"""
+		Distributing the components over multiple processes should give
+		the same rows as the single process run.
+		"""
+		output_file = 'test_ComparisonTriangle.test_jobs.output.txt'
+		validation_file = 'tests/data/test_Functional.test_01.output.txt'
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-j','2','-s','','-o',output_file])
+		
+		experiment_a = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_01.bedpe","test1")
+		experiment_b = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_02.bedpe","test2")
+		experiment_c = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_03.bedpe","test3")
+		experiment_d = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_04.bedpe","test4")
+		
+		genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		
+		for experiment in [experiment_a, experiment_b, experiment_c, experiment_d]:
+			experiment.annotate_genes(genes)
+			experiment.remove_duplicates(args)
+		
+		overlap = ComparisonTriangle(args)
+		overlap.add_experiment(experiment_a)
+		overlap.add_experiment(experiment_b)
+		overlap.add_experiment(experiment_c)
+		overlap.add_experiment(experiment_d)
+		
+		overlap.overlay_fusions()
+		
+		# Fusions sharing genes end up in the same shard
+		components = overlap.find_components()
+		self.assertEqual(sorted([i for component in components for i in component]), range(overlap.num_fusions()))
+		
+		files_identical = match_files_unsorted(output_file,validation_file)
+		self.assertTrue(files_identical)
+		
+		if files_identical:
+			os.remove(output_file)
+	
+	def test_gzip_output(self):
+		"""
+		An --output ending with .gz should be written gzip compressed.
+		"""
+		output_file = 'test_ComparisonTriangle.test_gzip_output.output.txt.gz'
+		uncompressed_file = 'test_ComparisonTriangle.test_gzip_output.output.txt'
+		validation_file = 'tests/data/test_Functional.test_01.output.txt'
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o',output_file])
+		
+		experiment_a = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_01.bedpe","test1")
+		experiment_b = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_02.bedpe","test2")
+		experiment_c = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_03.bedpe","test3")
+		experiment_d = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_04.bedpe","test4")
+		
+		genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		
+		overlap = ComparisonTriangle(args)
+		for experiment in [experiment_a, experiment_b, experiment_c, experiment_d]:
+			experiment.annotate_genes(genes)
+			experiment.remove_duplicates(args)
+			overlap.add_experiment(experiment)
+		
+		overlap.overlay_fusions()
+		
+		with gzip.open(output_file,"rb") as fh_in:
+			with open(uncompressed_file,"w") as fh_out:
+				fh_out.write(fh_in.read())
+		
+		files_identical = match_files_unsorted(uncompressed_file,validation_file)
+		self.assertTrue(files_identical)
+		
+		if files_identical:
+			os.remove(output_file)
+			os.remove(uncompressed_file)
+	
+	def test_checkpoint_resume(self):
+		"""
+		A run that gets interrupted at a recursive level should, after
+		--resume, give the same rows as an uninterrupted run, without
+		parsing and annotating the samples again.
+		"""
+		output_file = 'test_ComparisonTriangle.test_checkpoint_resume.output.txt'
+		checkpoint_file = 'test_ComparisonTriangle.test_checkpoint_resume.checkpoint.json'
+		validation_file = 'tests/data/test_Functional.test_01.output.txt'
+		
+		def load_experiments(args):
+			experiments = [ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_0"+str(i)+".bedpe","test"+str(i)) for i in range(1,5)]
+			
+			genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+			
+			overlap = ComparisonTriangle(args)
+			for experiment in experiments:
+				experiment.annotate_genes(genes)
+				experiment.remove_duplicates(args)
+				overlap.add_experiment(experiment)
+			
+			return overlap
+		
+		# Interrupt the first run at its second recursive level
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o',output_file,'--checkpoint',checkpoint_file])
+		overlap = load_experiments(args)
+		overlay_fusions_recursive = overlap.overlay_fusions_recursive
+		levels = []
+		
+		def interrupted_overlay_fusions_recursive(fh,merged_fusions):
+			levels.append(len(merged_fusions[0].fusions))
+			if len(levels) == 2:
+				raise KeyboardInterrupt()
+			return overlay_fusions_recursive(fh,merged_fusions)
+		
+		overlap.overlay_fusions_recursive = interrupted_overlay_fusions_recursive
+		self.assertRaises(KeyboardInterrupt, overlap.overlay_fusions)
+		self.assertTrue(os.path.isfile(checkpoint_file))
+		
+		with open(checkpoint_file,"r") as fh:
+			checkpoint = json.load(fh)
+		self.assertEqual(checkpoint['k'], levels[1])
+		
+		# Different settings may not reuse the checkpoint
+		args = CLI(['-m','overlap','--no-strand-specific-matching','-s','','-o',output_file,'--checkpoint',checkpoint_file,'--resume'])
+		self.assertRaises(Exception, load_experiments(args).overlay_fusions)
+		
+		# The fusions are restored from the checkpoint
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o',output_file,'--checkpoint',checkpoint_file,'--resume'])
+		overlap = ComparisonTriangle(args)
+		self.assertTrue(overlap.has_checkpoint())
+		overlap.overlay_fusions()
+		
+		self.assertEqual([experiment.name for experiment in overlap.experiments], ["test1","test2","test3","test4"])
+		self.assertFalse(os.path.isfile(checkpoint_file))
+		
+		files_identical = match_files_unsorted(output_file,validation_file)
+		self.assertTrue(files_identical)
+		
+		if files_identical:
+			os.remove(output_file)
+	
+	def test_checkpoint_resume_jobs(self):
+		"""
+		With --jobs > 1 a checkpoint is saved after each shard. A run
+		that gets interrupted after a shard should, after --resume with
+		a different number of jobs, give the same rows as an
+		uninterrupted run.
+		"""
+		output_file = 'test_ComparisonTriangle.test_checkpoint_resume_jobs.output.txt'
+		checkpoint_file = 'test_ComparisonTriangle.test_checkpoint_resume_jobs.checkpoint.json'
+		validation_file = 'tests/data/test_Functional.test_01.output.txt'
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-j','2','-s','','-o',output_file,'--checkpoint',checkpoint_file])
+		
+		genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		
+		overlap = ComparisonTriangle(args)
+		for i in range(1,5):
+			experiment = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_0"+str(i)+".bedpe","test"+str(i))
+			experiment.annotate_genes(genes)
+			experiment.remove_duplicates(args)
+			overlap.add_experiment(experiment)
+		
+		# Interrupt the first run after its first shard
+		write_checkpoint = overlap.write_checkpoint
+		checkpoints = []
+		
+		def interrupted_write_checkpoint(fh,merged_fusions):
+			write_checkpoint(fh,merged_fusions)
+			checkpoints.append(len(overlap.pending_shards))
+			if len(checkpoints) == 1:
+				raise KeyboardInterrupt()
+		
+		overlap.write_checkpoint = interrupted_write_checkpoint
+		self.assertRaises(KeyboardInterrupt, overlap.overlay_fusions)
+		
+		with open(checkpoint_file,"r") as fh:
+			checkpoint = json.load(fh)
+		self.assertEqual(len(checkpoint['merged_fusions']), 0)
+		self.assertEqual(len(checkpoint['shards']), checkpoints[-1])
+		self.assertTrue(len(checkpoint['shards']) > 0)
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-j','1','-s','','-o',output_file,'--checkpoint',checkpoint_file,'--resume'])
+		ComparisonTriangle(args).overlay_fusions()
+		
+		self.assertFalse(os.path.isfile(checkpoint_file))
+		
+		files_identical = match_files_unsorted(output_file,validation_file)
+		self.assertTrue(files_identical)
+		
+		if files_identical:
+			os.remove(output_file)
+	
+	def test_incidence_matrix(self):
+		output_file = 'test_ComparisonTriangle.test_incidence_matrix.output.txt'
+		incidence_matrix_file = 'test_ComparisonTriangle.test_incidence_matrix.npz'
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o',output_file,'--incidence-matrix',incidence_matrix_file])
+		
+		genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		
+		overlap = ComparisonTriangle(args)
+		for i in range(1,5):
+			experiment = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_0"+str(i)+".bedpe","test"+str(i))
+			experiment.annotate_genes(genes)
+			experiment.remove_duplicates(args)
+			overlap.add_experiment(experiment)
+		
+		overlap.overlay_fusions()
+		
+		incidence_matrix = numpy.load(incidence_matrix_file)
+		self.assertEqual(list(incidence_matrix['datasets']), ['test1','test2','test3','test4'])
+		
+		rows = dict([(incidence_matrix['genes_left'][i], list(incidence_matrix['matrix'][i])) for i in range(len(incidence_matrix['matrix']))])
+		self.assertEqual(rows, {
+			'NM_000142:NM_001163213:NM_022965': [False,False,True,False],
+			'NR_001591': [False,True,True,True],
+			'NM_001130442:NM_005343:NM_176795': [True,True,True,True]})
+		
+		self.assertEqual(incidence_matrix['jaccard'][2][3], 2.0/3.0)
+		self.assertEqual(incidence_matrix['jaccard'][0][0], 1.0)
+		self.assertEqual(incidence_matrix['overlap_coefficient'][0][2], 1.0)
+		self.assertEqual(incidence_matrix['overlap_coefficient'][1][3], 1.0)
+		
+		incidence_matrix.close()
+		
+		os.remove(output_file)
+		os.remove(incidence_matrix_file)
 
 
 def main():
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os,shutil,tempfile
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.ExperimentCache import ExperimentCache
+
+
+class TestExperimentCache(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix="fuma-test-")
+		
+		self.filename = os.path.join(self.directory,"sample.txt")
+		with open(self.filename,"w") as fh:
+			fh.write("sample\n")
+	
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+	
+	def get_values(self,fusion):
+		return (fusion.get_left_position(), fusion.get_right_position(), fusion.get_left_strand(), fusion.get_right_strand(), fusion.acceptor_donor_direction, fusion.uid, fusion.dataset_name)
+	
+	def test_01(self):
+		"""
+		Experiments are loaded with the same fusions, in the same order
+		"""
+		cache = ExperimentCache(os.path.join(self.directory,"cache"),1024*1024)
+		
+		experiment = FusionDetectionExperiment("Experiment")
+		experiment.add_fusion(Fusion("chr2","chr1",300,100,"+","-","Experiment","1",True))
+		experiment.add_fusion(Fusion("chrX","chr3",100,200,None,None,"Experiment","2",False))
+		experiment.add_fusion(Fusion("chr1","chr2",100,200,"+","-","Experiment","3",True))
+		
+		key = cache.get_experiment_key(self.filename,"chimerascan")
+		self.assertEqual(cache.load_experiment(key,"Experiment"), None)
+		
+		cache.save_experiment(key,experiment)
+		loaded = cache.load_experiment(key,"Experiment")
+		
+		self.assertEqual(len(loaded), 3)
+		self.assertEqual([self.get_values(loaded.get_fusion(i)) for i in range(3)], [self.get_values(experiment.get_fusion(i)) for i in range(3)])
+		
+		# Breakpoints that were not materialized are saved as such
+		experiment = FusionDetectionExperiment("Experiment")
+		experiment.add_breakpoint("chr2","chr1",300,100,"+","-","1",True)
+		experiment.add_breakpoint("chr1","chr2",100,200,"+","-","2",True)
+		
+		key_star = cache.get_experiment_key(self.filename,"rnastarchimeric")
+		self.assertNotEqual(key, key_star)
+		
+		cache.save_experiment(key_star,experiment)
+		loaded = cache.load_experiment(key_star,"Other")
+		
+		self.assertEqual([self.get_values(loaded.get_fusion(i)) for i in range(2)], [self.get_values(experiment.get_fusion(i))[:-1]+("Other",) for i in range(2)])
+		
+		# A modified input file has another key
+		with open(self.filename,"a") as fh:
+			fh.write("modified\n")
+		
+		self.assertNotEqual(ExperimentCache(os.path.join(self.directory,"cache"),1024*1024).get_experiment_key(self.filename,"chimerascan"), key)
+	
+	def test_02(self):
+		"""
+		Annotations are loaded with the same genes per junction, and the
+		experiments annotated with the same gene annotation share them.
+		The breakpoints of a loaded experiment without genes on both
+		junctions are not materialized.
+		"""
+		cache = ExperimentCache(os.path.join(self.directory,"cache"),1024*1024)
+		
+		gene_a = Gene("A",False)
+		gene_b = Gene("B",True)
+		gene_c = Gene("C",False)
+		
+		experiment = FusionDetectionExperiment("Experiment")
+		for i, genes in enumerate([([gene_a],[gene_b,gene_c]),([],[gene_a]),([gene_c],[gene_c])]):
+			fusion = Fusion("chr1","chr2",100+i,200,"+","-","Experiment",str(i),True)
+			fusion.annotate_genes_left(genes[0])
+			fusion.annotate_genes_right(genes[1])
+			experiment.add_fusion(fusion)
+		
+		key = cache.get_experiment_key(self.filename,"chimerascan")
+		annotation_fingerprint = cache.get_annotation_fingerprint(self.filename,200000)
+		self.assertNotEqual(annotation_fingerprint, cache.get_annotation_fingerprint(self.filename,0))
+		
+		cache.save_experiment(key,experiment)
+		cache.save_annotation(key,annotation_fingerprint,experiment)
+		
+		loaded_1 = cache.load_experiment(key,"Experiment")
+		loaded_2 = cache.load_experiment(key,"Experiment")
+		self.assertFalse(cache.load_annotation(key,cache.get_annotation_fingerprint(self.filename,0),loaded_1,"hg19"))
+		
+		self.assertTrue(cache.load_annotation(key,annotation_fingerprint,loaded_1,"hg19"))
+		self.assertTrue(cache.load_annotation(key,annotation_fingerprint,loaded_2,"hg19"))
+		self.assertEqual(loaded_1.genes_spanning_left_junction, ["hg19"])
+		
+		self.assertEqual(len(loaded_1), 2)
+		self.assertEqual(loaded_1.gene_spanning_rows, [0,2])
+		self.assertEqual(loaded_1.n_non_gene_spanning, 1)
+		
+		for i, row in enumerate(loaded_1.gene_spanning_rows):
+			fusion = experiment.get_fusion(row)
+			loaded = loaded_1.get_fusion(i)
+			
+			self.assertEqual(loaded.uid, fusion.uid)
+			self.assertEqual([(str(gene),gene.is_long_gene) for gene in loaded.get_annotated_genes_left(False)], [(str(gene),gene.is_long_gene) for gene in fusion.get_annotated_genes_left(False)])
+			self.assertEqual([(str(gene),gene.is_long_gene) for gene in loaded.get_annotated_genes_right(False)], [(str(gene),gene.is_long_gene) for gene in fusion.get_annotated_genes_right(False)])
+			
+			self.assertEqual(loaded.get_annotated_genes_right(False), loaded_2.get_fusion(i).get_annotated_genes_right(False))
+		
+		# The rows are kept in the annotation saved from a loaded experiment
+		cache.save_annotation(key,annotation_fingerprint,loaded_1)
+		loaded_3 = cache.load_experiment(key,"Experiment")
+		self.assertTrue(cache.load_annotation(key,annotation_fingerprint,loaded_3,"hg19"))
+		self.assertEqual([fusion.uid for fusion in loaded_3], ["0","2"])
+		
+		# A materialized experiment is annotated by row
+		experiment.materialize_fusions()
+		for fusion in experiment:
+			fusion.annotate_genes_left([])
+			fusion.annotate_genes_right([])
+		self.assertTrue(cache.load_annotation(key,annotation_fingerprint,experiment,"hg19"))
+		self.assertEqual([str(gene) for gene in experiment.get_fusion(2).get_annotated_genes_left(False)], ["C"])
+		self.assertEqual(experiment.get_fusion(1).get_annotated_genes_left(False), [])
+	
+	def test_03(self):
+		"""
+		The least recently used files are removed when the cache exceeds
+		its size
+		"""
+		cache = ExperimentCache(os.path.join(self.directory,"cache"),1024*1024)
+		
+		keys = []
+		for i in range(3):
+			experiment = FusionDetectionExperiment("Experiment")
+			for j in range(1000):
+				experiment.add_breakpoint("chr1","chr2",j,j,"+","-",str(j),True)
+			
+			keys.append(cache.get_experiment_key(self.filename,"format_"+str(i)))
+			cache.save_experiment(keys[-1],experiment)
+			os.utime(cache.get_filename(keys[-1],"experiment"),(i,i))
+		
+		size = os.path.getsize(cache.get_filename(keys[0],"experiment"))
+		
+		# Loading marks the first experiment as most recently used
+		self.assertNotEqual(cache.load_experiment(keys[0],"Experiment"), None)
+		
+		cache.max_size = 2 * size
+		cache.evict()
+		
+		self.assertTrue(os.path.isfile(cache.get_filename(keys[0],"experiment")))
+		self.assertFalse(os.path.isfile(cache.get_filename(keys[1],"experiment")))
+		self.assertTrue(os.path.isfile(cache.get_filename(keys[2],"experiment")))
+	
+	def test_04(self):
+		"""
+		A file is not removed right after it is written, also not when
+		it alone exceeds the size of the cache
+		"""
+		cache = ExperimentCache(os.path.join(self.directory,"cache"),1)
+		
+		keys = []
+		for i in range(2):
+			experiment = FusionDetectionExperiment("Experiment")
+			experiment.add_breakpoint("chr1","chr2",100,200,"+","-","1",True)
+			
+			keys.append(cache.get_experiment_key(self.filename,"format_"+str(i)))
+			cache.save_experiment(keys[-1],experiment)
+			
+			self.assertEqual(len(cache.load_experiment(keys[-1],"Experiment")), 1)
+		
+		# The previous file is removed instead
+		self.assertEqual(cache.load_experiment(keys[0],"Experiment"), None)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
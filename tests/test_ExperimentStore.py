@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.ExperimentStore import ExperimentStore
+
+
+def make_experiment(name,n):
+	experiment = FusionDetectionExperiment(name)
+	
+	for i in range(n):
+		fusion = Fusion("chr1","chr2",100+i,200+i,"+","+",name,name+"_"+str(i),True)
+		fusion.annotate_genes_left([Gene("A"+str(i),False)])
+		fusion.annotate_genes_right([Gene("B"+str(i),False)])
+		experiment.add_fusion(fusion)
+	
+	return experiment
+
+def make_intermediate_experiment(experiment_1,experiment_2):
+	experiment = FusionDetectionExperiment(experiment_1.name+"_vs._"+experiment_2.name)
+	
+	for fusion_1, fusion_2 in zip(experiment_1, experiment_2):
+		fusion = Fusion("chr1","chr2",fusion_1.get_left_break_position(),fusion_1.get_right_break_position(),"+","+",experiment.name,"",True)
+		fusion.annotate_genes_left(fusion_1.annotated_genes_left)
+		fusion.annotate_genes_right(fusion_1.annotated_genes_right)
+		fusion.matches = fusion_1.matches | fusion_2.matches
+		experiment.add_fusion(fusion)
+	
+	return experiment
+
+
+class TestExperimentStore(unittest.TestCase):
+	def test_01(self):
+		experiment_1 = make_experiment("e1",3)
+		experiment_2 = make_experiment("e2",3)
+		experiment_3 = make_experiment("e3",3)
+		
+		store = ExperimentStore(4,[experiment_1,experiment_2,experiment_3])
+		store['1'] = experiment_1
+		store['2'] = experiment_2
+		store['3'] = experiment_3
+		
+		# The original datasets do not count and are never spilled
+		self.assertEqual(store.n_fusions, 0)
+		
+		store['1.2'] = make_intermediate_experiment(experiment_1,experiment_2)
+		self.assertEqual(store.n_fusions, 3)
+		self.assertEqual(store.spilled, {})
+		
+		store['1.3'] = make_intermediate_experiment(experiment_1,experiment_3)
+		self.assertEqual(store.n_fusions, 3)
+		self.assertEqual(store.spilled.keys(), ['1.2'])
+		self.assertTrue(os.path.isfile(store.spilled['1.2']))
+		
+		# Paging in spills the least recently used one
+		experiment_12 = store['1.2']
+		self.assertEqual(len(experiment_12), 3)
+		self.assertEqual(sorted(store.spilled.keys()), ['1.2','1.3'])
+		self.assertEqual(store.experiments.keys(), ['1','2','3','1.2'])
+		
+		# The original fusions and genes are the same objects
+		originals = set([fusion for fusion in experiment_1]+[fusion for fusion in experiment_2])
+		genes = set([gene for fusion in experiment_1 for gene in fusion.annotated_genes_left])
+		for fusion in experiment_12:
+			self.assertEqual(len(fusion.matches), 2)
+			self.assertTrue(fusion.matches.issubset(originals))
+			self.assertTrue(fusion.annotated_genes_left[0] in genes)
+		
+		filename = store.spilled['1.3']
+		del(store['1.3'])
+		self.assertFalse(os.path.isfile(filename))
+		self.assertFalse(store.has_key('1.3'))
+		
+		spill_directory = store.spill_directory
+		store.close()
+		self.assertFalse(os.path.isdir(spill_directory))
+	
+	def test_02(self):
+		"""
+		Without a limit nothing is spilled.
+		"""
+		experiment_1 = make_experiment("e1",3)
+		experiment_2 = make_experiment("e2",3)
+		
+		store = ExperimentStore(0,[experiment_1,experiment_2])
+		store['1'] = experiment_1
+		store['2'] = experiment_2
+		store['1.2'] = make_intermediate_experiment(experiment_1,experiment_2)
+		
+		self.assertEqual(store.n_fusions, 3)
+		self.assertEqual(store.spilled, {})
+		self.assertEqual(store.spill_directory, None)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
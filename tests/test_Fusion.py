@@ -46,6 +46,24 @@ class TestFusion(unittest.TestCase):
 		self.assertEqual( fusion_1.left_strand , STRAND_REVERSE )
 		self.assertEqual( fusion_1.right_strand , STRAND_FORWARD )
 
+	def test_02_gene_name_caches(self):
+		fusion_1 = Fusion("chr1","chrX",15000,15000,"-","+","Experiment_1","1",True)
+
+		fusion_1.annotate_genes_left([Gene("A",False),Gene("B",False),Gene("A",False)])
+		fusion_1.annotate_genes_right([Gene("C",False)])
+
+		self.assertEqual( fusion_1.get_annotated_gene_names_left() , frozenset(["A","B"]) )
+		self.assertEqual( fusion_1.get_annotated_gene_names_right() , frozenset(["C"]) )
+		self.assertEqual( sorted(fusion_1.get_annotated_genes_left(True).keys()) , ["A","B"] )
+		self.assertEqual( len(fusion_1.get_annotated_genes_left(True)["A"]) , 2 )
+
+		# Re-annotating must invalidate the caches
+		fusion_1.annotate_genes_left([Gene("D",False)])
+
+		self.assertEqual( fusion_1.get_annotated_gene_names_left() , frozenset(["D"]) )
+		self.assertEqual( fusion_1.get_annotated_genes_left(True).keys() , ["D"] )
+		self.assertEqual( fusion_1.get_annotated_gene_names_right() , frozenset(["C"]) )
+
 def main():
 	unittest.main()
 
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+import numpy
+
+from fuma.Fusion import Fusion
+from fuma.FusionColumns import FusionColumns
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.Gene import Gene
+from fuma.GeneAnnotation import GeneAnnotation
+from fuma.CLI import CLI
+
+class TestFusionColumns(unittest.TestCase):
+	def get_values(self,fusion):
+		return (fusion.get_left_position(), fusion.get_right_position(), fusion.get_left_strand(), fusion.get_right_strand(), fusion.acceptor_donor_direction, fusion.uid, fusion.dataset_name)
+	
+	def test_01(self):
+		"""
+		Materialized rows have to be identical to Fusion objects made
+		from the same arguments
+		"""
+		rows = [("chr1","chr2",100,200,"+","-","1",True),
+				("chr2","chr1","1,500",300,"-","+","2",True),
+				("chrX","chrX",500,400,None,"r","3",False),
+				("3","chr3",400,500,"forward","+","4",True)]
+		
+		columns = FusionColumns()
+		for row in rows * 500:
+			columns.append(*row)
+		
+		self.assertEqual(len(columns), 2000)
+		
+		fusions = list(columns.get_fusions("Experiment"))
+		for i in range(len(fusions)):
+			row = rows[i % len(rows)]
+			fusion = Fusion(row[0],row[1],row[2],row[3],row[4],row[5],"Experiment",row[6],row[7])
+			
+			self.assertEqual(self.get_values(fusions[i]), self.get_values(fusion))
+		
+		self.assertEqual([fusion.uid for fusion in columns.get_fusions("Experiment",[1,3])], ["2","4"])
+		self.assertRaises(Exception, columns.append, "chr1","chr2",100,200,"?","+","5",True)
+	
+	def test_02(self):
+		"""
+		Breakpoints are materialized when the fusions are used
+		"""
+		experiment = FusionDetectionExperiment("Experiment")
+		experiment.add_breakpoint("chr2","chr1",300,100,"+","-","1",True)
+		experiment.add_breakpoint("chr1","chr2",100,200,"+","-","2",True)
+		
+		self.assertEqual(len(experiment), 2)
+		self.assertNotEqual(experiment.breakpoint_columns, None)
+		
+		experiment.add_fusion(Fusion("chr3","chr4",100,200,"+","-","Experiment","3",True))
+		self.assertEqual(experiment.breakpoint_columns, None)
+		self.assertEqual(len(experiment), 3)
+		
+		self.assertEqual([experiment.get_fusion(i).uid for i in range(3)], ["1","2","3"])
+		self.assertEqual(experiment.get_fusion(0).get_left_position(), ["1",100])
+		
+		# Only the selected breakpoints are kept
+		experiment = FusionDetectionExperiment("Experiment")
+		for i in range(10):
+			experiment.add_breakpoint("chr1","chr2",100+i,200,"+","-",str(i),True)
+		experiment.materialize_fusions([i % 2 == 0 for i in range(10)])
+		
+		self.assertEqual(sorted([fusion.uid for fusion in experiment]), ["0","2","4","6","8"])
+	
+	def test_03(self):
+		"""
+		The selection can be a NumPy boolean mask or index array; an
+		invalid selection does not lose the breakpoints
+		"""
+		experiment = FusionDetectionExperiment("Experiment")
+		for i in range(10):
+			experiment.add_breakpoint("chr1","chr2",100+i,200,"+","-",str(i),True)
+		
+		self.assertEqual([fusion.uid for fusion in experiment.breakpoint_columns.get_fusions("Experiment",numpy.arange(10) >= 7)], ["7","8","9"])
+		self.assertEqual([fusion.uid for fusion in experiment.breakpoint_columns.get_fusions("Experiment",numpy.array([4,2]))], ["4","2"])
+		
+		self.assertRaises(IndexError, experiment.materialize_fusions, numpy.array([20]))
+		self.assertEqual(len(experiment.breakpoint_columns), 10)
+		
+		experiment.materialize_fusions(numpy.arange(10) % 3 == 0)
+		self.assertEqual(experiment.breakpoint_columns, None)
+		self.assertEqual(sorted([fusion.uid for fusion in experiment]), ["0","3","6","9"])
+		
+		experiment = FusionDetectionExperiment("Experiment")
+		for i in range(10):
+			experiment.add_breakpoint("chr1","chr2",100+i,200,"+","-",str(i),True)
+		experiment.materialize_fusions(numpy.array([1,5]))
+		
+		self.assertEqual(sorted([fusion.uid for fusion in experiment]), ["1","5"])
+	
+	def test_04(self):
+		"""
+		Breakpoints are annotated from the columns and only those with
+		genes on both junctions are materialized, which gives the same
+		fusions after removing the duplicates
+		"""
+		args = CLI(['-m','overlap','-s',''])
+		
+		genes = GeneAnnotation("hg19")
+		genes.add_annotation(Gene("A",False),"1",1000,2000)
+		genes.add_annotation(Gene("B",False),"2",1000,2000)
+		genes.add_annotation(Gene("C",False),"2",1500,3000)
+		
+		rows = [("chr1","chr2",1500,1600,"+","-","1",True),# A-B,C
+				("chr1","chr2",1500,5000,"+","-","2",True),# A-
+				("chr2","chr1",2500,1200,"-","+","3",True),# A-C after ordering the breakpoints
+				("chr1","chr3",1500,1600,"+","-","4",True),# A-
+				("chr1","chr2",500,1600,"+","-","5",True),#  -B,C
+				("chr1","chr2",1501,1601,"+","-","6",True)]# A-B,C
+		
+		experiment = FusionDetectionExperiment("Experiment")
+		experiment_materialized = FusionDetectionExperiment("Experiment")
+		for row in rows:
+			experiment.add_breakpoint(*row)
+			experiment_materialized.add_fusion(Fusion(*(row[:6]+("Experiment",)+row[6:])))
+		
+		experiment.annotate_genes(genes)
+		experiment_materialized.annotate_genes(genes)
+		
+		self.assertEqual(experiment.breakpoint_columns, None)
+		self.assertEqual(experiment.gene_spanning_rows, [0,2,5])
+		self.assertEqual(experiment.n_non_gene_spanning, 3)
+		self.assertEqual([fusion.uid for fusion in experiment.fusions], ["1","3","6"])
+		self.assertEqual([sorted([str(gene) for gene in fusion.get_annotated_genes_right(False)]) for fusion in experiment.fusions], [["B","C"],["C"],["B","C"]])
+		self.assertEqual(len(experiment_materialized), 6)
+		
+		self.assertEqual(experiment.remove_duplicates(args), 1)
+		self.assertEqual(experiment_materialized.remove_duplicates(args), 1)
+		
+		self.assertEqual([(str(fusion),sorted([match.uid for match in fusion.matches])) for fusion in experiment], [(str(fusion),sorted([match.uid for match in fusion.matches])) for fusion in experiment_materialized])
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
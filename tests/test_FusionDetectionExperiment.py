@@ -565,6 +565,77 @@ class TestFusionDetectionExperiment(unittest.TestCase):
 		self.assertEqual(len(experiment_4), 2)
 		self.assertEqual(len(experiment_5), 2)
 		self.assertEqual(len(experiment_6), 2)
+	
+	def test_14(self):
+		"""
+		Exact duplicates (identical breakpoints, strands, direction and
+		genes) are merged before the pairwise comparison, and egm uses the
+		gene names as key. The merged matches have to be identical to
+		those of the pairwise comparison.
+		"""
+		gene_a = Gene("A",False)
+		gene_b = Gene("B",False)
+		gene_c = Gene("C",False)
+		
+		def get_experiment():
+			experiment = FusionDetectionExperiment("Experiment")
+			experiment.genes_spanning_left_junction = [gene_a,gene_c]
+			experiment.genes_spanning_right_junction = [gene_b]
+			
+			for i, (position, genes_left, strand) in enumerate([(100,[gene_a],"+"),(200,[gene_a,gene_c],"+"),(100,[gene_a],"+"),(300,[gene_a],"-"),(100,[gene_a],"+"),(400,[],"+")]):
+				fusion = Fusion("chr1","chr2",position,5000,strand,"+","Experiment","uid_"+str(i),True)
+				fusion.annotate_genes_left(list(genes_left))
+				fusion.annotate_genes_right([gene_b])
+				experiment.add_fusion(fusion)
+			
+			return experiment
+		
+		for matching_method, strand_specific_matching, expected in [
+				('subset','--strand-specific-matching',[['uid_0','uid_1','uid_2','uid_4'],['uid_3']]),
+				('subset','--no-strand-specific-matching',[['uid_0','uid_1','uid_2','uid_3','uid_4']]),
+				('egm','--strand-specific-matching',[['uid_0','uid_2','uid_4'],['uid_1'],['uid_3']]),
+				('egm','--no-strand-specific-matching',[['uid_0','uid_2','uid_3','uid_4'],['uid_1']])]:
+			args = CLI(['-m',matching_method,strand_specific_matching,'-s',''])
+			
+			experiment = get_experiment()
+			experiment.remove_duplicates(args)
+			
+			self.assertEqual(sorted([sorted([match.uid for match in fusion.matches]) for fusion in experiment]), expected)
+		
+		# Strands are no longer identical after merging uid_3
+		experiment = get_experiment()
+		experiment.remove_duplicates(CLI(['-m','egm','--no-strand-specific-matching','-s','']))
+		self.assertEqual(sorted([fusion.left_strand for fusion in experiment]), [None,True])
+	
+	def test_15(self):
+		"""
+		Positional access, stable ids and the fusions per chromosome pair
+		"""
+		experiment = FusionDetectionExperiment("Experiment")
+		
+		fusion_1 = Fusion("chr1","chr2",100,200,"+","+","Experiment","uid_1",True)
+		fusion_2 = Fusion("chr3","chr3",100,200,"+","+","Experiment","uid_2",True)
+		fusion_3 = Fusion("chr1","chr2",300,400,"+","+","Experiment","uid_3",True)
+		
+		for fusion in [fusion_1,fusion_2,fusion_3]:
+			experiment.add_fusion(fusion)
+		
+		self.assertEqual(len(experiment), 3)
+		self.assertEqual([experiment[i] for i in range(len(experiment))], list(experiment))
+		self.assertEqual(experiment[3], None)
+		
+		self.assertEqual(experiment.get_fusion(1), fusion_2)
+		self.assertEqual(experiment.get_chromosome_pair("1","2"), [fusion_1,fusion_3])
+		self.assertEqual(experiment.get_chromosome_pair("3","3"), [fusion_2])
+		self.assertEqual(experiment.get_chromosome_pair("1","3"), [])
+		
+		# Adding fusions does not change the ids of the others
+		fusion_4 = Fusion("chr2","chr2",100,200,"+","+","Experiment","uid_4",True)
+		experiment.add_fusion(fusion_4)
+		
+		self.assertEqual(experiment.get_fusion(1), fusion_2)
+		self.assertEqual(experiment.get_fusion(3), fusion_4)
+		self.assertEqual(sorted([fusion.uid for fusion in experiment]), ["uid_1","uid_2","uid_3","uid_4"])
 
 def main():
 	unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,pickle
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.CompareFusionsBySpanningGenes import CompareFusionsBySpanningGenes
+from fuma.CLI import CLI
+
+class TestFusionMatch(unittest.TestCase):
+	def test_01(self):
+		args = CLI(['-m','overlap','--no-strand-specific-matching','-s',''])
+		
+		gene_a1 = Gene("A",False)
+		gene_a2 = Gene("A",False)
+		gene_b = Gene("B",False)
+		gene_c = Gene("C",False)
+		
+		fusion_1 = Fusion("chr1","chr2",100,200,"+","+","Experiment_1","uid_1",True)
+		fusion_1.annotate_genes_left([gene_a1])
+		fusion_1.annotate_genes_right([gene_b])
+		
+		fusion_2 = Fusion("chr2","chr1",250,150,"-","+","Experiment_2","uid_2",True)
+		fusion_2.annotate_genes_left([gene_a2,gene_c])
+		fusion_2.annotate_genes_right([gene_b])
+		
+		overlap = CompareFusionsBySpanningGenes(None,None,args)
+		match = overlap.match_fusions(fusion_1,fusion_2)
+		
+		self.assertEqual(match.get_left_position(), ['1',100])
+		self.assertEqual(match.get_right_position(), ['2',200])
+		self.assertEqual(match.uid, "")
+		
+		# fusion_2 was swapped: the strands of the right junctions and the acceptor-donor directions differ
+		self.assertEqual(match.left_strand, fusion_1.left_strand)
+		self.assertEqual(match.right_strand, None)
+		self.assertEqual(match.acceptor_donor_direction, None)
+		
+		self.assertEqual(match.dataset_name, "Experiment_1_vs._Experiment_2")
+		self.assertEqual(match.tested_datasets, {"Experiment_1_vs._Experiment_2":True})
+		self.assertEqual(match.matches, set([match]))
+		
+		self.assertEqual(match.get_annotated_gene_names_left(), frozenset(["A"]))
+		self.assertEqual(match.get_annotated_gene_names_right(), frozenset(["B"]))
+		self.assertEqual(set(match.annotated_genes_left), set([gene_a1,gene_a2]))
+		self.assertEqual(match.annotated_genes_right, [gene_b])
+		self.assertEqual(sorted(match.get_annotated_genes_left(True).keys()), ["A"])
+		
+		match.matches = fusion_1.matches | fusion_2.matches
+		match_copy = pickle.loads(pickle.dumps(match))
+		self.assertEqual(match_copy.dataset_name, match.dataset_name)
+		self.assertEqual(len(match_copy.matches), 2)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.FusionMatcher import FusionMatcher
+from fuma.CLI import CLI
+
+class TestFusionMatcher(unittest.TestCase):
+	def get_fusion(self,genes_left,genes_right,left_strand="+"):
+		fusion = Fusion("chr1","chr2",100,200,left_strand,"+","Experiment","uid",True)
+		fusion.annotate_genes_left([Gene(gene_name,False) for gene_name in genes_left])
+		fusion.annotate_genes_right([Gene(gene_name,False) for gene_name in genes_right])
+		
+		return fusion
+	
+	def test_01(self):
+		fusion_1 = self.get_fusion(["A","B"],["C"])
+		fusion_2 = self.get_fusion(["A"],["C"])
+		fusion_3 = self.get_fusion(["B","D"],["C"])
+		fusion_4 = self.get_fusion(["A","B"],["C"],"-")
+		
+		matcher = FusionMatcher(CLI(['-m','subset','--no-strand-specific-matching','-s','']))
+		self.assertEqual(matcher.match(fusion_1,fusion_2), (frozenset(["A"]),frozenset(["C"])))
+		self.assertEqual(matcher.match(fusion_1,fusion_3), None)
+		self.assertEqual(matcher.match(fusion_1,fusion_4), (frozenset(["A","B"]),frozenset(["C"])))
+		
+		matcher = FusionMatcher(CLI(['-m','egm','--no-strand-specific-matching','-s','']))
+		self.assertEqual(matcher.match(fusion_1,fusion_2), None)
+		self.assertEqual(matcher.match(fusion_1,fusion_4), (frozenset(["A","B"]),frozenset(["C"])))
+		
+		matcher = FusionMatcher(CLI(['-m','overlap','--no-strand-specific-matching','-s','']))
+		self.assertEqual(matcher.match(fusion_1,fusion_3), (frozenset(["B"]),frozenset(["C"])))
+		
+		genes = matcher.get_matched_genes(fusion_1.annotated_genes_left,fusion_3.annotated_genes_left,fusion_1.get_annotated_gene_names_left(),fusion_3.get_annotated_gene_names_left(),frozenset(["B"]))
+		self.assertEqual(genes, [fusion_1.annotated_genes_left[1]])
+	
+	def test_02(self):
+		"""
+		Strand-specific matching
+		"""
+		fusion_1 = self.get_fusion(["A","B"],["C"])
+		fusion_2 = self.get_fusion(["A","B"],["C"],"-")
+		fusion_3 = self.get_fusion(["A","B"],["C"],None)
+		
+		for matching_method in ['egm','overlap','subset']:
+			matcher = FusionMatcher(CLI(['-m',matching_method,'--strand-specific-matching','-s','']))
+			self.assertEqual(matcher.match(fusion_1,fusion_2), None)
+			self.assertEqual(matcher.match(fusion_1,fusion_1), (frozenset(["A","B"]),frozenset(["C"])))
+			self.assertRaises(Exception, matcher.match, fusion_1, fusion_3)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
@@ -42,6 +42,37 @@ class TestGeneAnnotation(unittest.TestCase):
 		genes.add_annotation(gene_04,"chr3",12,20)
 		
 		self.assertEqual(len(genes), 4)
+	
+	def test_02(self):
+		"""
+		The sweep of get_annotations_bulk() has to return the same genes
+		as get_annotations()
+		"""
+		genes = GeneAnnotation("hg18")
+		
+		gene_01 = Gene("ucsc.1", False)
+		gene_02 = Gene("ucsc.2", False)
+		gene_03 = Gene("ucsc.3", False)
+		
+		genes.add_annotation(gene_01,"3",10,15)
+		genes.add_annotation(gene_02,"3",12,20)
+		genes.add_annotation(gene_03,"3",30,40)
+		genes.add_annotation(gene_03,"3",35,50)# Add twice
+		genes.add_annotation(gene_01,"X",10,15)
+		
+		breakpoints = [("3",position) for position in [45,9,10,14,15,19,20,36,12]] + [("X",12),("Y",12)]
+		annotations = genes.get_annotations_bulk(breakpoints)
+		
+		self.assertEqual(len(annotations), len(breakpoints))
+		for i in range(len(breakpoints) - 1):
+			self.assertEqual(sorted([str(gene) for gene in annotations[i]]), sorted([str(gene) for gene in genes.get_annotations(breakpoints[i][0],breakpoints[i][1])]))
+		
+		self.assertEqual(annotations[3], [gene_01, gene_02] if annotations[3][0] == gene_01 else [gene_02, gene_01])
+		self.assertEqual(annotations[7], [gene_03])
+		self.assertEqual(annotations[10], [])
+		
+		# Few breakpoints compared to the intervals are looked up one by one
+		self.assertEqual(genes.get_annotations_bulk([("3",36)]), [[gene_03]])
 
 def main():
 	unittest.main()
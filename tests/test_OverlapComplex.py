@@ -1258,6 +1258,130 @@ f5=                                            [--A6--]
 		
 		if(validation_1 and validation_2):
 			os.remove(test_filename)
+	
+	def test_bitmask_engine(self):
+		"""
+		The bitmask engine should count the same matches per
+		combination of datasets as the pairwise comparisons.
+		"""
+		args = CLI(['-m','subset','-f','summary','--summary-engine','bitmask','--no-strand-specific-matching','-s',''])
+		
+		experiment_1 = ReadChimeraScanAbsoluteBEDPE("tests/data/test_OverlapComplex.TestOverlapComplex.test_01.bedpe","TestExperiment1")
+		experiment_2 = ReadChimeraScanAbsoluteBEDPE("tests/data/test_OverlapComplex.TestOverlapComplex.test_01.bedpe","TestExperiment2")
+		experiment_3 = ReadChimeraScanAbsoluteBEDPE("tests/data/test_OverlapComplex.TestOverlapComplex.test_01.bedpe","TestExperiment3")
+		
+		genes = ParseBED("tests/data/test_FusionDetectionExperiment.TestFusionDetectionExperiment.test_01.bed","hg18", 200000)
+		
+		for experiment in [experiment_1, experiment_2, experiment_3]:
+			experiment.annotate_genes(genes)
+			experiment.remove_duplicates(args)
+		
+		overlapping_complex_bitmask = OverlapComplex()
+		overlapping_complex_pairwise = OverlapComplex()
+		for experiment in [experiment_1, experiment_2, experiment_3]:
+			overlapping_complex_bitmask.add_experiment(experiment)
+			overlapping_complex_pairwise.add_experiment(experiment)
+		
+		overlapping_complex_bitmask.overlay_fusions_bitmask(args)
+		overlapping_complex_pairwise.overlay_fusions(True,False,args)
+		
+		self.assertEqual(sorted(overlapping_complex_bitmask.matches_total.keys()), ['1','1.2','1.2.3','1.3','2','2.3','3'])
+		self.assertEqual(overlapping_complex_bitmask.matches_total['1.2.3'], 538)
+		self.assertEqual(overlapping_complex_bitmask.matches_total, overlapping_complex_pairwise.matches_total)
+	
+	def test_bitmask_engine_non_matching(self):
+		"""
+		A (x,y) matches both B1 (x) and B2 (y), which do not match each
+		other, and so does C (x,y). The rows of the list format count
+		A & C twice (with B1 and with B2), the pairwise comparisons only
+		once. D and E are found with the same genes in datasets 1 and 3
+		and are counted as bitmask.
+		"""
+		args = CLI(['-m','overlap','-f','summary','--summary-engine','bitmask','--no-strand-specific-matching','-s',''])
+		
+		experiments = []
+		for name, fusions in [("Experiment_1",[(["x","y"],15000),(["d"],25000)]), \
+							  ("Experiment_2",[(["x"],15000),(["y"],16000)]), \
+							  ("Experiment_3",[(["x","y"],15000),(["d"],25000)])]:
+			experiment = FusionDetectionExperiment(name)
+			experiment.genes_spanning_left_junction = [True]
+			experiment.genes_spanning_right_junction = [True]
+			
+			for genes_left, left_pos in fusions:
+				fusion = Fusion("chrX","chr2",left_pos,60000,"+","+",name,"uid",True)
+				fusion.annotate_genes_left([Gene(gene, False) for gene in genes_left])
+				fusion.annotate_genes_right([Gene("z", False)])
+				experiment.add_fusion(fusion)
+			
+			experiments.append(experiment)
+		
+		overlapping_complex_bitmask = OverlapComplex()
+		overlapping_complex_pairwise = OverlapComplex()
+		for experiment in experiments:
+			overlapping_complex_bitmask.add_experiment(experiment)
+			overlapping_complex_pairwise.add_experiment(experiment)
+		
+		overlapping_complex_bitmask.overlay_fusions_bitmask(args)
+		overlapping_complex_pairwise.overlay_fusions(True,False,args)
+		
+		self.assertEqual(overlapping_complex_bitmask.matches_total, {'1':2, '2':2, '3':2, '1.2':2, '1.3':2, '2.3':2, '1.2.3':2})
+		self.assertEqual(overlapping_complex_bitmask.matches_total, overlapping_complex_pairwise.matches_total)
+		
+		# The fusions still belong to their datasets
+		for experiment in experiments:
+			self.assertEqual(len(experiment), 2)
+			for fusion in experiment:
+				self.assertTrue(len(fusion.matches) > 0)
+	
+	def test_jobs(self):
+		"""
+		Distributing the combinations of one level over multiple
+		processes should give the same summary as a single process.
+		"""
+		matches_total = []
+		
+		for jobs in ['1','2']:
+			args = CLI(['-m','subset','-f','summary','--no-strand-specific-matching','-j',jobs,'-s',''])
+			
+			genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+			
+			overlapping_complex = OverlapComplex()
+			for i in range(1,5):
+				experiment = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_0"+str(i)+".bedpe","test"+str(i))
+				experiment.annotate_genes(genes)
+				experiment.remove_duplicates(args)
+				overlapping_complex.add_experiment(experiment)
+			
+			overlapping_complex.overlay_fusions(True,False,args)
+			matches_total.append(overlapping_complex.matches_total)
+		
+		self.assertEqual(len(matches_total[0]), 15)
+		self.assertEqual(matches_total[0], matches_total[1])
+	
+	def test_max_fusions_in_memory(self):
+		"""
+		Spilling the intermediate results to disk should not change the
+		summary.
+		"""
+		matches_total = []
+		
+		for max_fusions_in_memory in ['0','1']:
+			args = CLI(['-m','subset','-f','summary','--no-strand-specific-matching','--max-fusions-in-memory',max_fusions_in_memory,'-s',''])
+			
+			genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+			
+			overlapping_complex = OverlapComplex()
+			for i in range(1,5):
+				experiment = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_0"+str(i)+".bedpe","test"+str(i))
+				experiment.annotate_genes(genes)
+				experiment.remove_duplicates(args)
+				overlapping_complex.add_experiment(experiment)
+			
+			overlapping_complex.overlay_fusions(True,False,args)
+			matches_total.append(overlapping_complex.matches_total)
+		
+		self.assertEqual(matches_total[0], matches_total[1])
+
 
 def main():
 	unittest.main()
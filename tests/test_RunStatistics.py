@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os,json
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Readers import ReadChimeraScanAbsoluteBEDPE
+from fuma.ParseBED import ParseBED
+from fuma.ComparisonTriangle import ComparisonTriangle
+from fuma.RunStatistics import RunStatistics
+from fuma.CLI import CLI
+
+class TestRunStatistics(unittest.TestCase):
+	def test_01(self):
+		output_file = 'test_RunStatistics.test_01.output.txt'
+		stats_file = 'test_RunStatistics.test_01.stats.jsonl'
+		
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o',output_file,'--stats-file',stats_file])
+		stats = RunStatistics(args.stats_file,0.0)
+		
+		stats.start("parse")
+		experiment_a = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_01.bedpe","test1")
+		experiment_b = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_02.bedpe","test2")
+		genes = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		stats.stop("parse")
+		
+		overlap = ComparisonTriangle(args,stats)
+		for experiment in [experiment_a, experiment_b]:
+			stats.start("annotate")
+			experiment.annotate_genes(genes)
+			stats.stop("annotate")
+			
+			overlap.add_experiment(experiment)
+		
+		overlap.overlay_fusions()
+		stats.close()
+		
+		with open(stats_file,"r") as fh:
+			records = [json.loads(line) for line in fh]
+		
+		self.assertEqual([record['phase'] for record in records if record['event'] == 'phase'], ['parse','annotate','annotate'])
+		
+		levels = [record for record in records if record['event'] == 'level']
+		self.assertEqual([level['k'] for level in levels], [1,2,3])
+		self.assertEqual([level['fusions'] for level in levels], [4,2,1])
+		self.assertEqual([level['comparisons'] for level in levels], [2,2,0])
+		self.assertEqual([level['matches'] for level in levels], [2,2,0])
+		
+		# Both k=2 matches result in the same merged fusion
+		self.assertEqual([level['merged_fusions'] for level in levels], [2,1,0])
+		
+		# The interval is 0 seconds, so each (merged) fusion reports progress
+		progress = [record for record in records if record['event'] == 'progress']
+		self.assertEqual([(record['k'], record['passed'], record['total']) for record in progress], [(1,1,4),(1,2,4),(1,3,4),(1,4,4),(2,1,2),(2,2,2),(3,1,1)])
+		self.assertEqual(progress[-1]['eta'], 0.0)
+		
+		summary = records[-1]
+		self.assertEqual(summary['event'], 'summary')
+		self.assertEqual(sorted(summary['phases'].keys()), ['annotate','export','overlay','parse'])
+		self.assertTrue(summary['peak_rss_kb'] > 0)
+		
+		os.remove(output_file)
+		os.remove(stats_file)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()
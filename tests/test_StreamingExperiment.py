@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""[License: GNU General Public License v3 (GPLv3)]
+ 
+ This file is part of FuMa.
+ 
+ FuMa is free software: you can redistribute it and/or modify
+ it under the terms of the GNU General Public License as published by
+ the Free Software Foundation, either version 3 of the License, or
+ (at your option) any later version.
+ 
+ FuMa is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ GNU General Public License for more details.
+
+ You should have received a copy of the GNU General Public License
+ along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+ Documentation as defined by:
+ <http://epydoc.sourceforge.net/manual-fields.html#fields-synonyms>
+"""
+
+import unittest,logging,sys,os,tempfile
+logging.basicConfig(level=logging.DEBUG,format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",stream=sys.stdout)
+
+from fuma.Fusion import Fusion
+from fuma.Gene import Gene
+from fuma.GeneAnnotation import GeneAnnotation
+from fuma.ParseBED import ParseBED
+from fuma.FusionDetectionExperiment import FusionDetectionExperiment
+from fuma.StreamingExperiment import StreamingExperiment
+from fuma.Readers import ReadChimeraScanAbsoluteBEDPE
+from fuma.CLI import CLI
+
+
+def get_gene_annotation():
+	gene_annotation = GeneAnnotation("hg19")
+	
+	gene_annotation.add_annotation(Gene("A",False),"1",100,200)
+	gene_annotation.add_annotation(Gene("B",False),"2",100,200)
+	gene_annotation.add_annotation(Gene("C",False),"2",150,300)
+	gene_annotation.add_annotation(Gene("D",False),"3",100,200)
+	
+	return gene_annotation
+
+def get_rows():
+	"""
+	Fusions of two chromosome pairs, with duplicates and a fusion
+	without genes on its right junction
+	"""
+	return [("chr1","chr2",110,120,"+","-","1",True),
+			("chr1","chr2",150,130,"+","-","2",True),
+			("chr1","chr2",120,160,"+","-","3",True),
+			("chr1","chr2",130,250,"+","-","4",True),
+			("chr1","chr2",140,500,"+","-","5",True),
+			("chr1","chr3",110,120,"+","-","6",True),
+			("chr1","chr3",110,120,"+","-","7",True)]
+
+def read_CG_Junctions_file(filename):
+	"""
+	Returns the rows without the ids and the related junctions
+	"""
+	rows = []
+	with open(filename,"r") as fh:
+		for line in fh:
+			if(line[0] not in ["#",">","\n"]):
+				line = line.rstrip("\n").split("\t")
+				rows.append(line[1:18]+[":".join(sorted(line[18].split(":"))),":".join(sorted(line[19].split(":")))])
+	return rows
+
+
+class TestStreamingExperiment(unittest.TestCase):
+	def test_01(self):
+		"""
+		Streaming has to write the same fusions as annotating, removing
+		the duplicates and exporting the whole experiment
+		"""
+		args = CLI(['-m','overlap','--no-strand-specific-matching','-s','','-o','-'])
+		gene_annotation = get_gene_annotation()
+		
+		fd, filename_1 = tempfile.mkstemp()
+		os.close(fd)
+		fd, filename_2 = tempfile.mkstemp()
+		os.close(fd)
+		
+		experiment = FusionDetectionExperiment("test")
+		streaming_experiment = StreamingExperiment("test",gene_annotation,args,filename_2)
+		for row in get_rows():
+			experiment.add_fusion(Fusion(row[0],row[1],row[2],row[3],row[4],row[5],"test",row[6],row[7]))
+			streaming_experiment.add_breakpoint(*row)
+		
+		experiment.annotate_genes(gene_annotation)
+		experiment.remove_duplicates(args)
+		experiment.export_to_CG_Junctions_file(filename_1)
+		
+		self.assertEqual(streaming_experiment.close(), 3)
+		self.assertEqual(len(streaming_experiment), len(experiment))
+		self.assertEqual(streaming_experiment.n_gene_spanning, 6)
+		
+		self.assertEqual(sorted(read_CG_Junctions_file(filename_2)), sorted(read_CG_Junctions_file(filename_1)))
+		self.assertEqual([row[-2:] for row in read_CG_Junctions_file(filename_2)], [["A","B"],["A","C"],["A","D"]])
+		
+		os.remove(filename_1)
+		os.remove(filename_2)
+	
+	def test_02(self):
+		"""
+		Duplicates in non-adjacent blocks of a chromosome pair are not
+		removed
+		"""
+		args = CLI(['-m','overlap','--no-strand-specific-matching','-s','','-o','-'])
+		
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		
+		rows = get_rows()
+		
+		streaming_experiment = StreamingExperiment("test",get_gene_annotation(),args,filename)
+		for row in [rows[0],rows[1],rows[5],rows[2]]:
+			streaming_experiment.add_breakpoint(*row)
+		
+		self.assertEqual(streaming_experiment.close(), 3)
+		self.assertEqual(streaming_experiment.n_repeated_blocks, 1)
+		
+		os.remove(filename)
+	
+	def test_03(self):
+		"""
+		Fusions added by a reader are streamed instead of kept by the
+		reader
+		"""
+		args = CLI(['-m','subset','--no-strand-specific-matching','-s','','-o','-'])
+		gene_annotation = ParseBED("tests/data/refseq_hg19.bed","hg19",200000)
+		
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		
+		experiment = ReadChimeraScanAbsoluteBEDPE("tests/data/test_Functional.test_01.Example_01.bedpe","test")
+		experiment.annotate_genes(gene_annotation)
+		experiment.remove_duplicates(args)
+		
+		streaming_experiment = StreamingExperiment("test",gene_annotation,args,filename)
+		streaming_experiment.read(ReadChimeraScanAbsoluteBEDPE,"tests/data/test_Functional.test_01.Example_01.bedpe")
+		
+		self.assertEqual(streaming_experiment.n_read, 2)
+		self.assertEqual(streaming_experiment.close(), len(experiment))
+		self.assertEqual(len(read_CG_Junctions_file(filename)), len(experiment))
+		
+		os.remove(filename)
+	
+	def test_04(self):
+		"""
+		The blocks are not logged one by one; close() logs the counts of
+		all of them once
+		"""
+		args = CLI(['-m','overlap','--no-strand-specific-matching','-s','','-o','-'])
+		
+		fd, filename = tempfile.mkstemp()
+		os.close(fd)
+		
+		class ListHandler(logging.Handler):
+			def __init__(self):
+				logging.Handler.__init__(self,logging.INFO)
+				self.messages = []
+			
+			def emit(self,record):
+				self.messages.append(record.getMessage())
+		
+		handler = ListHandler()
+		logging.getLogger().addHandler(handler)
+		
+		try:
+			streaming_experiment = StreamingExperiment("test",get_gene_annotation(),args,filename)
+			for row in get_rows():
+				streaming_experiment.add_breakpoint(*row)
+			for i in range(4,54):
+				streaming_experiment.add_breakpoint("chr1","chr"+str(i),110,120,"+","-",str(i+4),True)
+			
+			self.assertEqual(streaming_experiment.close(), 3)
+		finally:
+			logging.getLogger().removeHandler(handler)
+		
+		self.assertEqual(handler.messages, ["Streamed test: 57 fusions read, 6 gene-spanning, 3 written without duplicates"])
+		
+		os.remove(filename)
+
+def main():
+	unittest.main()
+
+if __name__ == '__main__':
+	main()